@@ -1,14 +1,36 @@
 import time
 import pickle
 import numpy as np
-from vis_gym import *
+from mdp_gym import CastleEscapeEnv
+from qtable import QTable
+from telemetry import Telemetry
+from evaluation import evaluate, format_report
 import random
-from collections import defaultdict, deque
+from collections import deque
 
-gui_flag = True
-setup(GUI=gui_flag)
-env = game  
-env.render()
+# GUI visualization is off until enable_gui() is called, so importing this module never loads pygame
+gui_flag = False
+env = CastleEscapeEnv(text_results=False)  # Only info['action'] is used here, skip building result strings
+refresh = None
+live_view = None
+
+def enable_gui(live=False):
+    """Switch to the pygame view; training and testing then render every step.
+
+    With live=True the agent keeps its own env and runs at full speed while a vis_gym.LiveView
+    render process draws its latest state at a fixed frame rate (use this to watch training).
+    """
+    global gui_flag, env, refresh, live_view
+    import vis_gym
+    if live:
+        live_view = vis_gym.LiveView(env)
+        refresh = live_view.refresh
+    else:
+        vis_gym.setup(GUI=True)
+        env = vis_gym.game
+        env.text_results = False
+        refresh = vis_gym.refresh
+    gui_flag = True
 
 def hash(obs):
     """Convert observation to a hashable state"""
@@ -21,14 +43,11 @@ def hash(obs):
         g = int(g[-1])
     return x * (5 * 3 * 5) + y * (3 * 5) + h * 5 + g
 
-def Advanced_Q_learning(env, num_training_episodes=2000):
-    # Define actions and initialize Q-table
+def Advanced_Q_learning(env, num_training_episodes=2000, recorder=None, telemetry=None,
+                        alpha=0.1, gamma=0.95, epsilon=1.0, epsilon_decay=0.995, min_epsilon=0.01, Q_table=None):
+    # Define actions and initialize Q-table, or keep training an earlier run's (with its current epsilon)
     actions = ['UP', 'DOWN', 'LEFT', 'RIGHT', 'FIGHT', 'HIDE']
-    Q = defaultdict(lambda: np.zeros(6))
-    
-    # Training parameters
-    alpha, gamma, epsilon = 0.1, 0.95, 1.0
-    epsilon_decay, min_epsilon = 0.995, 0.01
+    Q = Q_table if Q_table is not None else QTable(env.num_states, len(actions))
     
     # Precompute valid moves to avoid walls
     valid_moves = {}
@@ -42,24 +61,24 @@ def Advanced_Q_learning(env, num_training_episodes=2000):
             valid.extend([4, 5])       # FIGHT and HIDE always valid
             valid_moves[(x, y)] = valid
     
-    # Training loop
+    # Training loop; progress goes to a Telemetry sink (by default one that prints every few seconds)
     print("\n=== Training Agent ===")
     wins = 0
+    own_telemetry = telemetry is None
+    if own_telemetry:
+        telemetry = Telemetry()
     
     for episode in range(num_training_episodes):
         observation, _, done, _ = env.reset()
         state = hash(observation)
         total_reward = 0
         steps = 0
+        td_error = 0.0
         
         # Track visited positions for cycle detection
         visited_positions = set()
         position_history = deque(maxlen=10)
         
-        if episode % 50 == 0:
-            win_rate = (wins / max(1, episode)) * 100 if episode > 0 else 0
-            print(f"Episode {episode}/{num_training_episodes}, Win rate: {win_rate:.1f}%, Epsilon: {epsilon:.4f}")
-        
         while not done and steps < 100:
             position = observation['player_position']
             guard_present = observation['guard_in_cell'] is not None
@@ -141,9 +160,11 @@ def Advanced_Q_learning(env, num_training_episodes=2000):
                     reward -= 0.3
             
             # Q-learning update
-            best_next_q = np.max(Q[next_state])
-            td_target = reward + gamma * best_next_q
-            Q[state][action_idx] += alpha * (td_target - Q[state][action_idx])
+            td_error += abs(Q.td_update(state, action_idx, reward, next_state, gamma, alpha))
+
+            # Keep the transition (with the shaped reward the update used) if a TrajectoryRecorder was passed in
+            if recorder is not None:
+                recorder.record(state, action_idx, reward, next_state, done)
             
             # Update state
             observation = next_observation
@@ -151,55 +172,63 @@ def Advanced_Q_learning(env, num_training_episodes=2000):
             total_reward += reward
             steps += 1
             
-            # Render occasionally
-            if episode % 100 == 0 and gui_flag:
+            # Render occasionally in the window; a live view gets every step and draws at its own pace
+            if gui_flag and (live_view is not None or episode % 100 == 0):
                 refresh(observation, reward, done, info, delay=0.05)
         
         # Update statistics and decay exploration
         if done and total_reward > 0:
             wins += 1
+        # total_reward includes the shaping bonuses
+        telemetry.record_episode(steps, total_reward, done and total_reward > 0, epsilon, td_error)
         epsilon = max(min_epsilon, epsilon * epsilon_decay)
     
+    if own_telemetry:
+        telemetry.close()
     print(f"\nTraining completed: {wins} successful episodes ({(wins/num_training_episodes)*100:.1f}%)")
     
-    # Play demonstration episodes
-    
-    # Convert defaultdict to regular dict for saving
-    q_table_dict = {state: values.tolist() for state, values in Q.items()}
-    return q_table_dict
+    # Save with Q.save(path, lists=True) to keep the {state: list} format of advanced_Q_table.pickle
+    return Q
 
 # Uncomment to train a new agent
 # Q_table = Advanced_Q_learning(env, num_training_episodes=2000)
-# with open('advanced_Q_table.pickle', 'wb') as handle:
-#     pickle.dump(Q_table, handle, protocol=pickle.HIGHEST_PROTOCOL)
+# Q_table.save('advanced_Q_table.pickle', lists=True)
 # print("Q-table saved to 'advanced_Q_table.pickle'")
 
 
-def test_agent():
+def test_agent(path='advanced_Q_table.pickle', episodes=10000):
+    """Test a pre-trained agent: with the GUI on, watch one episode, then measure its win rate,
+    returns and fight/hide outcomes over many headless episodes"""
     try:
-        Q_table = np.load('advanced_Q_table.pickle', allow_pickle=True)
-        obs, reward, done, info = env.reset()
-        total_reward = 0
-        while not done:
-            state = hash(obs)
-            action = np.argmax(Q_table[state])
-            obs, reward, done, info = env.step(action)
-            total_reward += reward
-            if gui_flag:
+        # Load saved Q-table
+        Q_table = QTable.load(path, num_states=env.num_states)
+
+        if gui_flag:
+            obs, reward, done, info = env.reset()
+            total_reward = 0
+            while not done:
+                action = Q_table.greedy(hash(obs))
+                obs, reward, done, info = env.step(action)
+                total_reward += reward
                 refresh(obs, reward, done, info)  # Update the game screen [GUI only]
-        print("Total reward:", total_reward)
-        
-        # Result
-        print(f"Test complete: {'SUCCESS' if total_reward > 0 else 'FAILURE'}")
-        print(f"Total reward: {total_reward}")
-    
+            print("Total reward:", total_reward)
+
+        # One noisy episode says little about the policy; evaluate it on many
+        stats = evaluate(Q_table, episodes, env=env)
+        print(format_report(stats))
+        return stats
+
     except FileNotFoundError:
-        print("No advanced_Q_table.pickle file found. Run the training code first.")
+        print(f"No {path} file found. Run the training code first.")
     except Exception as e:
         print(f"Error loading or testing agent: {e}")
 
-# # Test existing agent
-test_agent()
+if __name__ == "__main__":
+    enable_gui()
+    env.render()
+
+    # # Test existing agent
+    test_agent()
 
-# Close environment
-env.close()
\ No newline at end of file
+    # Close environment
+    env.close()
@@ -1,13 +1,34 @@
 import time
 import pickle
 import numpy as np
-from vis_gym import *
-
-# Enable GUI visualization
-gui_flag = True
-setup(GUI=gui_flag)
-env = game 
-env.render()
+from mdp_gym import CastleEscapeEnv
+from qtable import QTable
+from telemetry import Telemetry
+from evaluation import evaluate, format_report
+
+# GUI visualization is off until enable_gui() is called, so importing this module never loads pygame
+gui_flag = False
+env = CastleEscapeEnv(text_results=False)  # Only info['action'] is used here, skip building result strings
+refresh = None
+live_view = None
+
+def enable_gui(live=False):
+    """Switch to the pygame view; training and testing then render every step.
+
+    With live=True the agent keeps its own env and runs at full speed while a vis_gym.LiveView
+    render process draws its latest state at a fixed frame rate (use this to watch training).
+    """
+    global gui_flag, env, refresh, live_view
+    import vis_gym
+    if live:
+        live_view = vis_gym.LiveView(env)
+        refresh = live_view.refresh
+    else:
+        vis_gym.setup(GUI=True)
+        env = vis_gym.game
+        env.text_results = False
+        refresh = vis_gym.refresh
+    gui_flag = True
 
 def hash(obs):
     x, y = obs['player_position']
@@ -20,95 +41,103 @@ def hash(obs):
     return x * (5 * 3 * 5) + y * (3 * 5) + h * 5 + g
 
 
-def Q_learning(num_episodes=1000000, gamma=0.9, epsilon=1.0, decay_rate=0.999999):
-    # Initialize Q-table as empty dictionary and update counter
-    Q_table = {}  
-    num_updates = np.zeros((375, 6)) 
+def Q_learning(num_episodes=1000000, gamma=0.9, epsilon=1.0, decay_rate=0.999999, recorder=None, telemetry=None,
+               Q_table=None):
+    # Dense Q-table over the 375 state codes; it also counts the updates of every (state, action).
+    # Pass an earlier run's table (and its current epsilon) to keep training it
+    if Q_table is None:
+        Q_table = QTable(env.num_states, len(env.actions))
+
+    # Progress goes to a Telemetry sink (by default one that prints a summary every few seconds)
+    own_telemetry = telemetry is None
+    if own_telemetry:
+        telemetry = Telemetry()
 
     for episode in range(num_episodes):
-        print(episode)
         # Reset environment for new episode
         obs, _, done, _ = env.reset()
         state = hash(obs)
+        steps, total_reward, td_error = 0, 0, 0.0
 
         while not done:
-            # Initialize Q-values for new states
-            Q_table.setdefault(state, np.zeros(6))
-
             # Epsilon-greedy action selection
             if np.random.rand() < epsilon:
                 # Exploration: choose random action
                 action = env.action_space.sample()
             else:
                 # Exploitation: choose best action according to Q-table
-                action = np.argmax(Q_table[state])
+                action = Q_table.greedy(state)
 
             # Take action and observe next state and reward
-            obs_next, reward, done, info = env.step(action)
-            next_state = hash(obs_next)
-            Q_table.setdefault(next_state, np.zeros(6))
-
-            # Calculate learning rate that decreases with visits
-            eta = 1.0 / (1 + num_updates[state, action])
-            
-            # Q-learning update equation
-            Q_table[state][action] = (1 - eta) * Q_table[state][action] + eta * (reward + gamma * np.max(Q_table[next_state]))
-
-            # Track number of updates for this state-action pair
-            num_updates[state, action] += 1
+            if gui_flag:
+                obs_next, reward, done, info = env.step(action)
+                next_state = hash(obs_next)
+            else:
+                # Headless: skip the observation dict and get the state code directly
+                next_state, reward, done = env.step_encoded(action)
+
+            # Q-learning update with a learning rate that decreases with visits (1 / (1 + updates))
+            td_error += abs(Q_table.td_update(state, action, reward, next_state, gamma))
+            steps += 1
+            total_reward += reward
+
+            # Keep the transition if a TrajectoryRecorder was passed in
+            if recorder is not None:
+                recorder.record(state, action, reward, next_state, done)
             state = next_state
 
             # Update visualization if GUI enabled
             if gui_flag:
                 refresh(obs_next, reward, done, info)
  
+        telemetry.record_episode(steps, total_reward, env.is_terminal() == 'goal', epsilon, td_error)
+
         # Decay exploration rate after each episode
         epsilon = max(epsilon*decay_rate, 0.01)
 
+    if own_telemetry:
+        telemetry.close()
     return Q_table
 
 # Uncomment to train a new agent
 # Q_table = Q_learning(num_episodes=1000000, gamma=0.9, epsilon=1, decay_rate=0.999999) # Run Q-learning
-# with open('Q_table.pickle', 'wb') as handle:
-#     pickle.dump(Q_table, handle, protocol=pickle.HIGHEST_PROTOCOL)
+# Q_table.save('Q_table.pickle')
 # print("Q-table saved to 'Q_table.pickle'")
 
 
-def test_agent():
-    """Test a pre-trained Q-learning agent"""
+def test_agent(path='Q_table.pickle', episodes=10000):
+    """Test a pre-trained agent: with the GUI on, watch one episode, then measure its win rate,
+    returns and fight/hide outcomes over many headless episodes"""
     try:
         # Load saved Q-table
-        Q_table = np.load('Q_table.pickle', allow_pickle=True)
-        obs, reward, done, info = env.reset()
-        total_reward = 0
-        
-        # Run agent until episode ends
-        while not done:
-            # Get state and choose best action from Q-table
-            state = hash(obs)
-            action = np.argmax(Q_table[state])
-            
-            # Take action and update total reward
-            obs, reward, done, info = env.step(action)
-            total_reward += reward
-            
-            # Update visualization if GUI enabled
-            if gui_flag:
+        Q_table = QTable.load(path, num_states=env.num_states)
+
+        if gui_flag:
+            obs, reward, done, info = env.reset()
+            total_reward = 0
+            while not done:
+                action = Q_table.greedy(hash(obs))
+                obs, reward, done, info = env.step(action)
+                total_reward += reward
                 refresh(obs, reward, done, info)  # Update the game screen [GUI only]
-                
-        print("Total reward:", total_reward)
-        
-        # Report result
-        print(f"Test complete: {'SUCCESS' if total_reward > 0 else 'FAILURE'}")
-        print(f"Total reward: {total_reward}")
-    
+            print("Total reward:", total_reward)
+
+        # One noisy episode says little about the policy; evaluate it on many
+        stats = evaluate(Q_table, episodes, env=env)
+        print(format_report(stats))
+        return stats
+
     except FileNotFoundError:
-        print("No advanced_Q_table.pickle file found. Run the training code first.")
+        print(f"No {path} file found. Run the training code first.")
     except Exception as e:
         print(f"Error loading or testing agent: {e}")
 
-# Test the pre-trained agent
-test_agent()
+if __name__ == "__main__":
+    enable_gui()
+    env.render()
+
+    # Test the pre-trained agent
+    test_agent()
 
-# Close the environment when done
-env.close()
\ No newline at end of file
+    # Close the environment when done
+    env.close()
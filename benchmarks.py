@@ -0,0 +1,333 @@
+import io
+import os
+import gc
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import contextlib
+import numpy as np
+from mdp_gym import CastleEscapeEnv, CastleEscapeVecEnv
+
+# Committed reference timings, compared by castle.py bench
+BASELINE_PATH = 'benchmarks_baseline.json'
+
+# Percentiles of the per-call time reported for every benchmark, besides the median
+PERCENTILES = [10, 90]
+
+# name -> (group, setup); setup builds the state a benchmark needs and returns the callable to time
+BENCHMARKS = {}
+
+
+def benchmark(name, group):
+    """Registers a setup function under name"""
+    def register(setup):
+        BENCHMARKS[name] = (group, setup)
+        return setup
+    return register
+
+
+class _NullTelemetry:
+    """Telemetry stand-in that drops every report, so timed training runs start no flush thread"""
+
+    def record_episode(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+# --- Environment -----------------------------------------------------------------------------
+
+def _castle(text_results=True):
+    """Seeded default castle with the guards in fixed rooms and the player in the empty center room"""
+    env = CastleEscapeEnv(text_results=text_results)
+    env.seed(0)
+    env._place_guards([1, 7, 17, 23])
+    env.state.player_cell = 12
+    return env
+
+
+@benchmark('reset', 'env')
+def bench_reset():
+    env = _castle()
+    return env.reset
+
+
+def _bench_step(action):
+    env = _castle()
+    if action >= 4:
+        env.state.player_cell = 7  # G2's room
+    start = env.clone_state()
+
+    def step():
+        env.restore_state(start)
+        env.step(action)
+    return step
+
+
+# One benchmark per action type; every call restores the start state first
+for _action, _name in enumerate(['UP', 'DOWN', 'LEFT', 'RIGHT', 'FIGHT', 'HIDE']):
+    benchmark(f'step {_name}', 'env')(lambda action=_action: _bench_step(action))
+
+
+@benchmark('step_encoded', 'env')
+def bench_step_encoded():
+    env = _castle(text_results=False)
+    actions = np.random.default_rng(0).integers(0, 6, 4096).tolist()
+    position = [0]
+
+    def step():
+        i = position[0] = (position[0] + 1) % len(actions)
+        if env.step_encoded(actions[i])[2]:
+            env.reset()
+    return step
+
+
+@benchmark('get_observation', 'env')
+def bench_get_observation():
+    env = _castle()
+    return env.get_observation
+
+
+@benchmark('vec step (1024 envs)', 'env')
+def bench_vec_step():
+    vec = CastleEscapeVecEnv(num_envs=1024, env=_castle(), seed=0)
+    actions = np.random.default_rng(0).integers(0, 6, 1024)
+    return lambda: vec.step(actions)
+
+
+# --- Learners --------------------------------------------------------------------------------
+
+@benchmark('Q_learning episode', 'learner')
+def bench_q_learning_episode():
+    import Q_learning as script
+
+    telemetry = _NullTelemetry()
+
+    def episode():
+        # The same seeds every call, so every call trains on the same exploratory episode
+        script.env.seed(0)
+        script.env.action_space.seed(0)
+        np.random.seed(0)
+        script.Q_learning(num_episodes=1, telemetry=telemetry)
+    return episode
+
+
+@benchmark('Advanced_Q_learning episode', 'learner')
+def bench_advanced_q_learning_episode():
+    import Advanced_Q_learning as script
+
+    telemetry = _NullTelemetry()
+
+    def episode():
+        script.env.seed(0)
+        np.random.seed(0)
+        random.seed(0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            script.Advanced_Q_learning(script.env, num_training_episodes=1, telemetry=telemetry)
+    return episode
+
+
+@benchmark('evaluate (10000 episodes)', 'learner')
+def bench_evaluate():
+    from evaluation import evaluate
+    from qtable import QTable
+
+    env = _castle(text_results=False)
+    Q_table = QTable.load('Q_table.pickle', num_states=env.num_states)
+    return lambda: evaluate(Q_table, 10000, seed=0, env=env)
+
+
+# --- Renderer --------------------------------------------------------------------------------
+
+def _vis_gym():
+    """vis_gym with a window on the SDL dummy video driver (no display server needed)"""
+    import vis_gym
+    if vis_gym.screen is None:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        vis_gym.setup(GUI=True)
+    return vis_gym
+
+
+@benchmark('load_images', 'render')
+def bench_load_images():
+    vis_gym = _vis_gym()
+    vis_gym.load_images(vis_gym.window)  # make sure the sprite cache is filled
+    return lambda: vis_gym.load_images(vis_gym.window)
+
+
+@benchmark('load_images (empty cache)', 'render')
+def bench_load_images_cold():
+    vis_gym = _vis_gym()
+
+    def load():
+        # Generate every sprite into a fresh cache directory
+        cache = tempfile.mkdtemp(prefix='castle-sprites-')
+        saved, vis_gym.SPRITE_CACHE_DIR = vis_gym.SPRITE_CACHE_DIR, cache
+        try:
+            vis_gym.load_images(vis_gym.window)
+        finally:
+            vis_gym.SPRITE_CACHE_DIR = saved
+            shutil.rmtree(cache, ignore_errors=True)
+    return load
+
+
+def _bench_refresh(full):
+    vis_gym = _vis_gym()
+    game = vis_gym.game
+    game.seed(0)
+    game.reset()
+    position = [0]
+
+    def frame():
+        # Play one step and draw it, as an agent driving the window does
+        position[0] += 1
+        obs, reward, done, info = game.step(position[0] % 6)
+        if full:
+            vis_gym.window.force_redraw = True
+        vis_gym.refresh(obs, reward, done, info, delay=0)
+        if done:
+            game.reset()
+    return frame
+
+
+@benchmark('refresh', 'render')
+def bench_refresh():
+    return _bench_refresh(full=False)
+
+
+@benchmark('refresh (full redraw)', 'render')
+def bench_refresh_full():
+    return _bench_refresh(full=True)
+
+
+# --- Running and comparing -------------------------------------------------------------------
+
+def measure(func, repeat=15, min_time=0.02):
+    """Per-call timings of func: each of repeat samples times enough calls to last min_time.
+
+    The first round calibrates the number of calls and doubles as a warm-up. The garbage
+    collector is off while timing, as in timeit.
+    """
+    number = 1
+    while True:
+        elapsed = _time(func, number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    samples = np.array([_time(func, number) / number for _ in range(repeat)])
+    result = {'median': float(np.median(samples))}
+    for q, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES).tolist()):
+        result[f'p{q}'] = value
+    result.update({'min': float(samples.min()), 'number': number, 'repeat': repeat, 'min_time': min_time})
+    return result
+
+
+def _time(func, number):
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def run_benchmarks(names=None, repeat=None, min_time=None, verbose=True, baseline=None):
+    """Times the registered benchmarks: all, or those whose group ('env', 'learner', 'render')
+    is one of names or whose name contains one of them.
+
+    Each benchmark takes repeat samples of at least min_time seconds. Left as None, they are
+    the ones its entry in baseline (a loaded baseline) was recorded with, so both sides of a
+    comparison are sampled alike, and otherwise 15 samples of 0.02 s.
+
+    Returns {name: timings} with per-call seconds. Benchmarks that cannot be set up (the
+    renderer ones without pygame, evaluate without Q_table.pickle) are reported and skipped.
+    """
+    recorded = baseline['results'] if baseline else {}
+    results = {}
+    for name, (group, setup) in BENCHMARKS.items():
+        if names and not any(part == group or part in name for part in names):
+            continue
+        try:
+            func = setup()
+        except (ImportError, OSError) as e:
+            if verbose:
+                print(f"{name}: skipped ({e})")
+            continue
+        reference = recorded.get(name, {})
+        results[name] = measure(func, repeat or reference.get('repeat', 15),
+                                min_time or reference.get('min_time', 0.02))
+        if verbose:
+            timings = results[name]
+            print(f"{name:<28} {format_time(timings['median']):>10}  "
+                  + "  ".join(f"p{q} {format_time(timings[f'p{q}'])}" for q in PERCENTILES))
+    return results
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def machine_info():
+    """What a baseline was measured on; timings only compare well on the same machine"""
+    return {'platform': platform.platform(), 'processor': platform.processor() or platform.machine(),
+            'python': platform.python_version(), 'numpy': np.__version__}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w') as handle:
+        json.dump({'machine': machine_info(), 'results': results}, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def compare(results, baseline, threshold=0.25):
+    """Rows (name, median, baseline median, ratio, status) comparing results with a baseline.
+
+    status is 'regression' when the median got slower than the baseline by more than
+    threshold (0.25 = 25%) and the two runs' timings do not overlap (the new p10 is above the
+    baseline's p90), 'faster' for the same improvement, 'new' for benchmarks missing from the
+    baseline and 'ok' otherwise.
+    """
+    rows = []
+    reference = baseline['results']
+    for name, timings in results.items():
+        if name not in reference:
+            rows.append((name, timings['median'], None, None, 'new'))
+            continue
+        before = reference[name]
+        ratio = timings['median'] / before['median']
+        low, high = f'p{PERCENTILES[0]}', f'p{PERCENTILES[-1]}'
+        if ratio > 1 + threshold and timings[low] > before[high]:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold) and timings[high] < before[low]:
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append((name, timings['median'], before['median'], ratio, status))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'benchmark':<28} {'median':>10} {'baseline':>10} {'change':>8}"]
+    for name, median, reference, ratio, status in rows:
+        if reference is None:
+            lines.append(f"{name:<28} {format_time(median):>10} {'-':>10} {'-':>8}  new")
+            continue
+        flag = {'regression': '  REGRESSION', 'faster': '  faster'}.get(status, '')
+        lines.append(f"{name:<28} {format_time(median):>10} {format_time(reference):>10} {ratio - 1:>+8.1%}{flag}")
+    return "\n".join(lines)
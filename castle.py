@@ -0,0 +1,294 @@
+"""Command line entry point for Castle Escape.
+
+    python castle.py train --agent q --episodes 100000 --out Q_table.pickle [--workers 8]
+    python castle.py eval --qtable Q_table.pickle --episodes 10000
+    python castle.py sweep --agent advanced --param alpha=0.05,0.1,0.2 --param gamma=0.9,0.95
+    python castle.py bench [env learner render] [--save-baseline]
+    python castle.py play [--qtable Q_table.pickle | --mcts] [--record run.gif]
+    python castle.py replay episodes.log
+
+train and eval only import mdp_gym and NumPy; pygame is loaded only by play, replay,
+train --gui, --record and the renderer benchmarks (on the SDL dummy video driver).
+"""
+import os
+import sys
+import atexit
+import pickle
+import argparse
+import numpy as np
+
+
+def cmd_train(args):
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    from telemetry import Telemetry
+
+    if args.workers > 1 and (args.agent != 'q' or args.gui):
+        sys.exit("--workers only applies to --agent q without --gui")
+    telemetry = Telemetry(args.metrics, interval=args.metrics_interval)
+    if args.agent == 'q' and args.workers > 1:
+        from parallel_q import parallel_Q_learning
+        Q_table = parallel_Q_learning(num_episodes=args.episodes, num_workers=args.workers, mode=args.sync,
+                                      sync_every=args.sync_every, seed=args.seed, telemetry=telemetry)
+    elif args.agent == 'q':
+        import Q_learning as script
+        if args.gui:
+            script.enable_gui(live=True)
+        Q_table = script.Q_learning(num_episodes=args.episodes, telemetry=telemetry)
+    elif args.agent == 'advanced':
+        import Advanced_Q_learning as script
+        if args.gui:
+            script.enable_gui(live=True)
+        Q_table = script.Advanced_Q_learning(script.env, num_training_episodes=args.episodes, telemetry=telemetry)
+    else:
+        import planning
+        from mdp_gym import CastleEscapeEnv, MAX_MODEL_STATES
+
+        env = CastleEscapeEnv(text_results=False)
+        # The model has num_cells * 3 states per layout; stay under transition_model()'s cap
+        max_layouts = MAX_MODEL_STATES // (env.num_cells * 3)
+        layouts = args.layouts
+        if layouts > max_layouts:
+            print(f"--layouts {layouts} would exceed {MAX_MODEL_STATES:,} model states; using {max_layouts}")
+            layouts = max_layouts
+        Q_table, _ = planning.plan(env, num_layouts=layouts, seed=args.seed)
+    telemetry.close()
+    if args.gui and args.agent != 'planning':
+        script.live_view.close()
+    if args.agent == 'planning':
+        with open(args.out, 'wb') as handle:
+            pickle.dump(Q_table, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    else:
+        # The same pickle formats the scripts always wrote: array rows, or list rows for the advanced agent
+        Q_table.save(args.out, lists=args.agent == 'advanced')
+    print(f"Q-table saved to '{args.out}'")
+
+
+def cmd_eval(args):
+    from mdp_gym import CastleEscapeEnv
+    from qtable import QTable
+
+    env = CastleEscapeEnv(text_results=False)
+    Q_table = QTable.load(args.qtable, num_states=env.num_states)
+    if not args.record and not args.log:
+        # Nothing to draw or log per step: play all episodes at once in the batched evaluator
+        from evaluation import evaluate, format_report
+        stats = evaluate(Q_table, args.episodes, seed=args.seed, env=env, max_steps=args.max_steps,
+                         confidence=args.confidence)
+        print(format_report(stats))
+        return
+    if args.seed is not None:
+        np.random.seed(args.seed)
+        env.seed(args.seed)
+    if args.record:
+        # Draw every step offscreen; pygame is only loaded when recording
+        import vis_gym
+        vis_gym.render_frame(env)
+        start_recording(args)
+    log = None
+    if args.log:
+        from episode_log import EpisodeLogWriter
+        log = EpisodeLogWriter(args.log, env)
+
+    wins = 0
+    returns = []
+    for _ in range(args.episodes):
+        env.reset()
+        if log is not None:
+            log.begin_episode(env)
+        state, done, total_reward, steps = env.state_code(), False, 0, 0
+        while not done and steps < args.max_steps:
+            action = Q_table.greedy(state)
+            state, reward, done = env.step_encoded(action)
+            total_reward += reward
+            steps += 1
+            if log is not None:
+                log.record(env, action, reward)
+            if args.record:
+                vis_gym.render_frame(env)
+        wins += env.is_terminal() == 'goal'
+        returns.append(total_reward)
+    if args.record:
+        vis_gym.stop_recording()
+    if log is not None:
+        log.close()
+        print(f"{log.episodes} episodes logged to '{args.log}'")
+    print(f"Win rate: {wins / args.episodes:.3f}, mean return: {np.mean(returns):.1f} over {args.episodes} episodes")
+
+
+def cmd_bench(args):
+    import benchmarks
+
+    baseline = benchmarks.load_baseline(args.baseline) if os.path.exists(args.baseline) else None
+    # A comparison samples each benchmark the way its baseline entry was recorded
+    results = benchmarks.run_benchmarks(args.only, repeat=args.repeat, min_time=args.min_time,
+                                        baseline=None if args.save_baseline else baseline)
+    if not results:
+        sys.exit(f"No benchmark matches {' '.join(args.only)}")
+    if args.save_baseline:
+        if args.only and baseline is not None:
+            # Refresh only the benchmarks that ran
+            results = {**baseline['results'], **results}
+        benchmarks.save_baseline(results, args.baseline)
+        print(f"Baseline saved to '{args.baseline}'")
+        return
+    if baseline is None:
+        print(f"No baseline at '{args.baseline}'; create one with --save-baseline")
+        return
+    if baseline['machine'] != benchmarks.machine_info():
+        print(f"Note: the baseline was measured on {baseline['machine']['processor']}, "
+              f"{baseline['machine']['platform']} (Python {baseline['machine']['python']})")
+    rows = benchmarks.compare(results, baseline, args.threshold)
+    print()
+    print(benchmarks.format_comparison(rows))
+    regressions = [row[0] for row in rows if row[4] == 'regression']
+    if regressions:
+        sys.exit(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+
+
+def start_recording(args):
+    import vis_gym
+
+    recorder = vis_gym.start_recording(args.record, fps=args.record_fps, scale=args.record_scale,
+                                       skip=args.record_skip)
+    # Close the file however the run ends
+    atexit.register(vis_gym.stop_recording)
+    print(f"Recording to '{args.record}'")
+    return recorder
+
+
+def cmd_play(args):
+    import vis_gym
+
+    vis_gym.setup(GUI=True)
+    env = vis_gym.game
+    if args.record:
+        start_recording(args)
+    if args.mcts:
+        from mcts_agent import MCTSAgent, run_episode
+        run_episode(env, MCTSAgent(env, time_budget=args.budget), render=vis_gym.refresh)
+    elif args.qtable:
+        import Q_learning as script
+        script.env, script.refresh, script.gui_flag = env, vis_gym.refresh, True
+        script.test_agent(args.qtable)
+    else:
+        vis_gym.main()
+    vis_gym.stop_recording()
+    env.close()
+
+
+def parse_param(text):
+    """name=v1,v2,... (values to try) or name=low:high[:log] (a range for random search)"""
+    name, _, values = text.partition('=')
+    if not values:
+        raise argparse.ArgumentTypeError(f"expected name=values, got {text!r}")
+    if ':' in values:
+        low, high, *log = values.split(':')
+        return name, (float(low), float(high), 'log') if log == ['log'] else (float(low), float(high))
+    return name, [float(v) for v in values.split(',')]
+
+
+def cmd_sweep(args):
+    from sweep import run_sweep
+
+    space = dict(args.param)
+    if args.search == 'grid' and any(isinstance(v, tuple) for v in space.values()):
+        sys.exit("ranges (low:high) need --search random")
+    rows = run_sweep(args.agent, space, args.out, search=args.search, num_trials=args.trials, episodes=args.episodes,
+                     eval_episodes=args.eval_episodes, workers=args.workers, seed=args.seed or 0)
+    finished = [row for row in rows if row['status'] == 'done']
+    if finished:
+        best = max(finished, key=lambda row: float(row['win_rate']))
+        print(f"Best: {', '.join(f'{name}={best[name]}' for name in space)} "
+              f"(win rate {float(best['win_rate']):.3f}, mean return {float(best['mean_return']):.1f})")
+
+
+def cmd_replay(args):
+    import vis_gym
+
+    vis_gym.replay(args.log, episode=args.episode, speed=args.speed)
+
+
+def add_record_arguments(parser):
+    parser.add_argument('--record', metavar='PATH', default=None,
+                        help="stream the drawn frames to a .gif (or any format ffmpeg writes, e.g. .mp4)")
+    parser.add_argument('--record-fps', type=float, default=10, help="playback rate of the recording")
+    parser.add_argument('--record-scale', type=float, default=0.5, help="downscale factor for recorded frames")
+    parser.add_argument('--record-skip', type=int, default=1, help="keep every N-th drawn frame")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Castle Escape training, evaluation and play")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    train = sub.add_parser('train', help="train an agent headless and save its Q-table")
+    train.add_argument('--agent', choices=['q', 'advanced', 'planning'], default='q')
+    train.add_argument('--episodes', type=int, default=100000, help="training episodes")
+    train.add_argument('--layouts', type=int, default=2000, help="guard layouts to plan over (--agent planning)")
+    train.add_argument('--out', default='Q_table.pickle')
+    train.add_argument('--seed', type=int, default=None)
+    train.add_argument('--workers', type=int, default=1,
+                       help="worker processes sharing one Q-table (--agent q only)")
+    train.add_argument('--sync', choices=['hogwild', 'merge'], default='hogwild',
+                       help="hogwild: lock-free updates to the shared table; merge: fold local updates in periodically")
+    train.add_argument('--sync-every', type=int, default=500, help="episodes between merges with --sync merge")
+    train.add_argument('--metrics', metavar='PATH', default=None,
+                       help="write training metrics to a .csv or JSON lines file")
+    train.add_argument('--metrics-interval', type=float, default=5.0, help="seconds between metrics rows")
+    train.add_argument('--gui', action='store_true', help="show training live in the pygame window (drawn at 30 fps, training is not slowed)")
+    train.set_defaults(func=cmd_train)
+
+    evaluate = sub.add_parser('eval', help="evaluate a saved Q-table headless")
+    evaluate.add_argument('--qtable', default='Q_table.pickle')
+    evaluate.add_argument('--episodes', type=int, default=10000)
+    evaluate.add_argument('--max-steps', type=int, default=1000)
+    evaluate.add_argument('--seed', type=int, default=None)
+    evaluate.add_argument('--confidence', type=float, default=0.95, help="level of the reported confidence intervals")
+    evaluate.add_argument('--log', metavar='PATH', default=None,
+                          help="write every episode to a binary log for 'castle.py replay'")
+    add_record_arguments(evaluate)
+    evaluate.set_defaults(func=cmd_eval)
+
+    sweep = sub.add_parser('sweep', help="hyperparameter sweep over a process pool, resumable")
+    sweep.add_argument('--agent', choices=['q', 'advanced'], default='q')
+    sweep.add_argument('--param', type=parse_param, action='append', required=True, metavar='NAME=VALUES',
+                       help="training keyword to sweep: name=v1,v2,... or name=low:high[:log] (random search)")
+    sweep.add_argument('--search', choices=['grid', 'random'], default='grid')
+    sweep.add_argument('--trials', type=int, default=20, help="configurations to draw with --search random")
+    sweep.add_argument('--episodes', type=int, default=None, help="training episodes per trial")
+    sweep.add_argument('--eval-episodes', type=int, default=1000)
+    sweep.add_argument('--workers', type=int, default=None, help="pool size (default: all cores)")
+    sweep.add_argument('--seed', type=int, default=None)
+    sweep.add_argument('--out', default='sweep.csv', help="results table; rerun with the same arguments to resume")
+    sweep.set_defaults(func=cmd_sweep)
+
+    bench = sub.add_parser('bench', help="time the env, learner and renderer hot paths against a stored baseline")
+    bench.add_argument('only', nargs='*', help="groups (env, learner, render) or parts of benchmark names to run")
+    bench.add_argument('--repeat', type=int, help="timing samples per benchmark (default: as in the baseline, or 15)")
+    bench.add_argument('--min-time', type=float,
+                       help="seconds each sample lasts at least (default: as in the baseline, or 0.02)")
+    bench.add_argument('--baseline', default='benchmarks_baseline.json')
+    bench.add_argument('--threshold', type=float, default=0.25,
+                       help="slowdown of the median that counts as a regression (0.25 = 25%%)")
+    bench.add_argument('--save-baseline', action='store_true', help="store these timings as the new baseline")
+    bench.set_defaults(func=cmd_bench)
+
+    play = sub.add_parser('play', help="open the game window (manual play, a Q-table agent or MCTS)")
+    play.add_argument('--qtable', default=None)
+    play.add_argument('--mcts', action='store_true')
+    play.add_argument('--budget', type=float, default=0.1, help="MCTS time per move in seconds")
+    add_record_arguments(play)
+    play.set_defaults(func=cmd_play)
+
+    replay = sub.add_parser('replay', help="play back an episode log written by eval --log")
+    replay.add_argument('log')
+    replay.add_argument('--episode', type=int, default=0, help="episode to start at (0-based)")
+    replay.add_argument('--speed', type=float, default=1, help="steps per sleeptime, 1 to 100")
+    replay.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
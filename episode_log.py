@@ -0,0 +1,186 @@
+import json
+import struct
+import numpy as np
+from mdp_gym import CastleEscapeEnv, EVENT_GOAL, EVENT_DEFEAT, describe_event
+
+# File layout: MAGIC, a little-endian uint32 header length and a JSON header describing the
+# castle, padded to 8 bytes; then one block per episode:
+#   uint32 step count (INCOMPLETE while the episode is being written), uint16 start cell,
+#   uint8 start health, one pad byte, uint16 guard cells, padded to 8 bytes,
+#   followed by one 8-byte STEP_DTYPE record per step
+MAGIC = b'CASTLOG1'
+INCOMPLETE = 0xFFFFFFFF
+_EPISODE = struct.Struct('<IHBx')
+_STEP = struct.Struct('<BBHf')
+
+# action in bits 0-2 and health after the step in bits 3-4 of 'code'; 'event' is the step's
+# mdp_gym EVENT_* code with its goal/defeat flags; 'cell' is the player's cell after the step
+STEP_DTYPE = np.dtype([('code', 'u1'), ('event', 'u1'), ('cell', '<u2'), ('reward', '<f4')])
+
+
+def _pad8(n):
+    return -n % 8
+
+
+class EpisodeLogWriter:
+    """Appends episodes to a compact binary log for replay.
+
+    Call begin_episode(env) after each reset and record(env, action, reward) after each step;
+    the new player cell and health and the outcome event are read from env. Records are
+    buffered and written in blocks, and each episode's step count is filled in when it ends.
+    """
+
+    def __init__(self, path, env, buffer_size=1 << 16):
+        self.file = open(path, 'wb')
+        self.num_guards = len(env.guard_names)
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.episode_offset = None  # file offset of the open episode's step count
+        self.steps = 0
+        self.episodes = 0
+        header = json.dumps({
+            'grid_size': [env.num_rows, env.num_cols],
+            'goal_room': list(env.goal_room),
+            'guards': env.guards,
+            'rewards': env.rewards,
+            'actions': env.actions,
+        }).encode()
+        header += b' ' * _pad8(len(MAGIC) + 4 + len(header))
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+
+    def begin_episode(self, env):
+        self.end_episode()
+        self.episode_offset = self.file.tell() + len(self.buffer)
+        self.steps = 0
+        s = env.state
+        self.buffer += _EPISODE.pack(INCOMPLETE, s.player_cell, s.player_health)
+        guards = struct.pack(f'<{self.num_guards}H', *s.guard_cells)
+        self.buffer += guards + bytes(_pad8(_EPISODE.size + len(guards)))
+
+    def record(self, env, action, reward):
+        s = env.state
+        self.buffer += _STEP.pack(action | s.player_health << 3, env.last_event, s.player_cell, reward)
+        self.steps += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+
+    def end_episode(self):
+        """Writes out the open episode (called by begin_episode() and close())"""
+        if self.episode_offset is None:
+            return
+        self.file.write(self.buffer)
+        self.buffer.clear()
+        end = self.file.tell()
+        self.file.seek(self.episode_offset)
+        self.file.write(struct.pack('<I', self.steps))
+        self.file.seek(end)
+        self.episode_offset = None
+        self.episodes += 1
+
+    def close(self):
+        self.end_episode()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EpisodeLog:
+    """Read-only view of a log written by EpisodeLogWriter.
+
+    The file is memory-mapped, so only the pages of the episodes actually looked at are read.
+    Episode boundaries are found on first use by hopping between episode headers. An episode
+    still being written (or cut short by a crash) is read up to its last complete step.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not an episode log")
+        header_length, = struct.unpack_from('<I', self.data, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self.data[start:start + header_length]))
+        self.num_guards = len(self.header['guards'])
+        self.actions = self.header['actions']
+        self.rewards = self.header['rewards']
+        self.first_episode = start + header_length
+        guard_bytes = 2 * self.num_guards
+        self.episode_header_size = _EPISODE.size + guard_bytes + _pad8(_EPISODE.size + guard_bytes)
+        self._index = None
+
+    def _build_index(self):
+        offsets, lengths = [], []
+        offset, size = self.first_episode, len(self.data)
+        while offset + self.episode_header_size <= size:
+            steps, = struct.unpack_from('<I', self.data, offset)
+            available = (size - offset - self.episode_header_size) // STEP_DTYPE.itemsize
+            if steps == INCOMPLETE or steps > available:
+                steps = available
+            offsets.append(offset)
+            lengths.append(steps)
+            offset += self.episode_header_size + steps * STEP_DTYPE.itemsize
+        self._index = (offsets, lengths)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._build_index()
+        return self._index
+
+    def __len__(self):
+        return len(self.index[0])
+
+    def num_steps(self, episode):
+        return self.index[1][episode]
+
+    def start_state(self, episode):
+        """(player_cell, player_health, guard_cells) at the start of episode"""
+        offset = self.index[0][episode]
+        _, cell, health = _EPISODE.unpack_from(self.data, offset)
+        return (cell, health, struct.unpack_from(f'<{self.num_guards}H', self.data, offset + _EPISODE.size))
+
+    def steps(self, episode):
+        """The episode's step records as a STEP_DTYPE array viewing the file"""
+        start = self.index[0][episode] + self.episode_header_size
+        end = start + self.num_steps(episode) * STEP_DTYPE.itemsize
+        return self.data[start:end].view(STEP_DTYPE)
+
+    def snapshot(self, episode, step):
+        """State after step steps of episode (0 is the start), in clone_state() form"""
+        cell, health, guard_cells = self.start_state(episode)
+        if step > 0:
+            record = self.steps(episode)[step - 1]
+            cell, health = int(record['cell']), int(record['code']) >> 3
+        return (cell, health, guard_cells)
+
+    def describe(self, episode, step):
+        """Console line for step (1-based) of episode"""
+        record = self.steps(episode)[step - 1]
+        guard_cells = self.start_state(episode)[2]
+        previous_cell = self.snapshot(episode, step - 1)[0]
+        names = list(self.header['guards'])
+        guard = next((names[g] for g, cell in enumerate(guard_cells) if cell == previous_cell), None)
+        cols = self.header['grid_size'][1]
+        result = describe_event(int(record['event']), guard, divmod(int(record['cell']), cols), self.rewards)
+        return f"{step}. {self.actions[int(record['code']) & 7]}: {result} ({record['reward']:g})"
+
+    def make_env(self):
+        """A CastleEscapeEnv with the logged castle, for drawing snapshots"""
+        env = CastleEscapeEnv(grid_size=tuple(self.header['grid_size']), guards=self.header['guards'],
+                              goal_room=tuple(self.header['goal_room']))
+        env.rewards = self.rewards
+        return env
+
+    def summary(self, episode):
+        """(steps, total reward, outcome) of episode; outcome is 'goal', 'defeat' or None"""
+        steps = self.steps(episode)
+        if not len(steps):
+            return 0, 0.0, None
+        last = int(steps['event'][-1])
+        outcome = 'goal' if last & EVENT_GOAL else 'defeat' if last & EVENT_DEFEAT else None
+        return len(steps), float(steps['reward'].sum(dtype=np.float64)), outcome
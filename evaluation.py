@@ -0,0 +1,174 @@
+import time
+from statistics import NormalDist
+import numpy as np
+from mdp_gym import (CastleEscapeEnv, random_guard_cells, EVENT_OUTCOMES, EVENT_MASK, EVENT_BLOCKED, EVENT_FIGHT_WON,
+                     EVENT_FIGHT_LOST, EVENT_HID, EVENT_HIDE_FAILED_WON, EVENT_HIDE_FAILED_LOST, OUTCOME_WON,
+                     OUTCOME_LOST)
+from qtable import QTable
+
+# Percentiles reported for episode returns and lengths
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def policy_actions(policy, num_states, num_actions):
+    """Greedy action for every state code of a QTable, a {state: Q-values} dict, a
+    (num_states, num_actions) array of Q-values or an array of actions; None for a callable"""
+    if callable(policy) and not isinstance(policy, (QTable, dict, np.ndarray)):
+        return None
+    if isinstance(policy, QTable):
+        values = policy.values
+    elif isinstance(policy, dict):
+        values = np.zeros((num_states, num_actions))
+        for state, row in policy.items():
+            values[state] = row
+    else:
+        values = np.asarray(policy)
+    actions = values.argmax(axis=1) if values.ndim == 2 else values.astype(np.int64)
+    # States the policy does not cover get action 0, like greedy() on an all-zero row
+    table = np.zeros(num_states, dtype=np.int64)
+    table[:min(len(actions), num_states)] = actions[:num_states]
+    return table
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    """Wilson score interval for a binomial proportion"""
+    if not trials:
+        return (0.0, 1.0)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / trials
+    center = (p + z * z / (2 * trials)) / (1 + z * z / trials)
+    half = z * np.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / (1 + z * z / trials)
+    return (float(center - half), float(center + half))
+
+
+def evaluate(policy, n_episodes=10000, seed=None, env=None, max_steps=1000, confidence=0.95):
+    """Plays n_episodes greedy episodes of policy at once and returns their statistics as a dict.
+
+    policy is a QTable, a {state: Q-values} dict, an array of Q-values or actions indexed by
+    state code, or a callable mapping an array of state codes to an array of actions. env only
+    supplies the castle (grid, guards, goal room and rewards); the episodes run in one batch on
+    its transition kernel, dropping finished ones as they end, and seed makes them repeatable.
+    Episodes still running after max_steps count as timeouts.
+
+    The result has the win rate with its Wilson interval at the given confidence, the mean
+    return with a normal interval, percentiles of return and episode length, and per guard the
+    outcomes of fighting and hiding.
+    """
+    env = env if env is not None else CastleEscapeEnv(text_results=False)
+    env._check_kernel()
+    kernel = env.kernel
+    num_guards = len(env.guard_names)
+    num_guard_codes = num_guards + 1
+    num_cells = env.num_cells
+    table = policy_actions(policy, env.num_states, len(env.actions))
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+
+    # Guards do not move during an episode, so each episode's guard map is built once
+    guard_cells = random_guard_cells(rng, env.guard_candidates, n_episodes, num_guards)
+    occupancy = np.zeros((n_episodes, num_cells), dtype=np.int64)
+    for g in reversed(range(num_guards)):
+        occupancy[np.arange(n_episodes), guard_cells[:, g]] = g + 1
+    occupancy = occupancy.reshape(-1)
+
+    returns = np.zeros(n_episodes)
+    lengths = np.full(n_episodes, max_steps, dtype=np.int64)
+    outcomes = np.zeros(n_episodes, dtype=np.int8)  # 1 goal, -1 defeat, 0 timeout
+    # Step counts per (guard, event code), for the fight/hide breakdown
+    num_events = EVENT_MASK + 1
+    events = np.zeros(num_guard_codes * num_events, dtype=np.int64)
+    win_reward = env.rewards['combat_win']
+    loss_reward = env.rewards['combat_loss']
+
+    # State of the episodes still running, compacted whenever some finish
+    ids = np.arange(n_episodes)
+    cell = np.zeros(n_episodes, dtype=np.int64)
+    health = np.full(n_episodes, 2, dtype=np.int64)
+    total = np.zeros(n_episodes)
+    for step in range(max_steps):
+        guard = occupancy[ids * num_cells + cell]
+        codes = (cell * 3 + health) * num_guard_codes + guard
+        actions = table[codes] if table is not None else np.asarray(policy(codes), dtype=np.int64)
+        cell, health, event = kernel.step_batch(cell, health, guard, actions, rng.random(len(ids)))
+        events += np.bincount(guard * num_events + event, minlength=len(events))
+        outcome = EVENT_OUTCOMES[event]
+        total += np.where(outcome == OUTCOME_WON, win_reward, np.where(outcome == OUTCOME_LOST, loss_reward, 0))
+
+        goal = cell == env.goal_cell
+        defeat = ~goal & (health == 0)
+        done = goal | defeat
+        if not done.any():
+            continue
+        total += goal * env.rewards['goal'] + defeat * env.rewards['defeat']
+        finished = ids[done]
+        returns[finished] = total[done]
+        lengths[finished] = step + 1
+        outcomes[finished] = np.where(goal[done], 1, -1)
+        keep = ~done
+        ids, cell, health, total = ids[keep], cell[keep], health[keep], total[keep]
+        if not len(ids):
+            break
+    returns[ids] = total  # timeouts
+    elapsed = time.perf_counter() - start
+
+    wins = int((outcomes == 1).sum())
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    mean_return = float(returns.mean())
+    half = z * float(returns.std(ddof=1)) / np.sqrt(n_episodes) if n_episodes > 1 else float('inf')
+    events = events.reshape(num_guard_codes, num_events)
+    guards = {}
+    for name, counts in zip(env.guard_names, events[1:].tolist()):
+        fights = counts[EVENT_FIGHT_WON] + counts[EVENT_FIGHT_LOST]
+        hides = counts[EVENT_HID] + counts[EVENT_HIDE_FAILED_WON] + counts[EVENT_HIDE_FAILED_LOST]
+        guards[name] = {
+            'fights': fights,
+            'fights_won': counts[EVENT_FIGHT_WON],
+            'fight_win_rate': counts[EVENT_FIGHT_WON] / fights if fights else None,
+            'hides': hides,
+            'hid': counts[EVENT_HID],
+            'hide_rate': counts[EVENT_HID] / hides if hides else None,
+            'hides_fought_won': counts[EVENT_HIDE_FAILED_WON],
+            'hides_fought_lost': counts[EVENT_HIDE_FAILED_LOST],
+            'blocked': counts[EVENT_BLOCKED],
+        }
+    return {
+        'episodes': n_episodes,
+        'wins': wins,
+        'defeats': int((outcomes == -1).sum()),
+        'timeouts': int((outcomes == 0).sum()),
+        'win_rate': wins / n_episodes,
+        'win_rate_ci': wilson_interval(wins, n_episodes, confidence),
+        'mean_return': mean_return,
+        'return_ci': (mean_return - half, mean_return + half),
+        'return_percentiles': dict(zip(PERCENTILES, np.percentile(returns, PERCENTILES).tolist())),
+        'mean_length': float(lengths.mean()),
+        'length_percentiles': dict(zip(PERCENTILES, np.percentile(lengths, PERCENTILES).tolist())),
+        'guards': guards,
+        'confidence': confidence,
+        'seconds': elapsed,
+    }
+
+
+def format_report(stats):
+    """Multi-line text summary of an evaluate() result"""
+    level = f"{stats['confidence']:.0%}"
+    low, high = stats['win_rate_ci']
+    lines = [
+        f"{stats['episodes']:,} episodes in {stats['seconds']:.2f}s: {stats['wins']:,} won, "
+        f"{stats['defeats']:,} defeated, {stats['timeouts']:,} timed out",
+        f"Win rate:    {stats['win_rate']:.3f} ({level} CI {low:.3f}-{high:.3f})",
+        f"Mean return: {stats['mean_return']:.1f} ({level} CI {stats['return_ci'][0]:.1f} to {stats['return_ci'][1]:.1f})",
+        "Return:      " + ", ".join(f"p{q} {v:g}" for q, v in stats['return_percentiles'].items()),
+        f"Length:      mean {stats['mean_length']:.1f}, "
+        + ", ".join(f"p{q} {v:g}" for q, v in stats['length_percentiles'].items()),
+        f"{'Guard':<6} {'fights':>8} {'won':>7} {'hides':>8} {'hid':>7} {'caught':>8} {'blocked':>8}",
+    ]
+
+    def rate(value):
+        return f"{value:.1%}" if value is not None else "-"
+
+    for name, g in stats['guards'].items():
+        caught = g['hides'] - g['hid']
+        lines.append(f"{name:<6} {g['fights']:>8,} {rate(g['fight_win_rate']):>7} {g['hides']:>8,} "
+                     f"{rate(g['hide_rate']):>7} {caught:>8,} {g['blocked']:>8,}")
+    return "\n".join(lines)
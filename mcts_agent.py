@@ -0,0 +1,195 @@
+import math
+import time
+import random
+import numpy as np
+from mdp_gym import CastleEscapeEnv, CastleEscapeVecEnv
+
+
+class _Node:
+    """Decision node: one game state with visit counts and summed returns per action"""
+    __slots__ = ('snapshot', 'actions', 'visits', 'action_visits', 'action_values', 'children')
+
+    def __init__(self, snapshot, actions):
+        self.snapshot = snapshot
+        self.actions = actions
+        self.visits = 0
+        self.action_visits = [0] * 6
+        self.action_values = [0.0] * 6
+        # action -> {(player_cell, player_health): child node}
+        self.children = [None] * 6
+
+
+class MCTSAgent:
+    """Online UCT planner for CastleEscapeEnv.
+
+    Each decision runs simulations from the current state until the time or node budget is
+    spent. Tree steps are simulated on a private env with clone_state/restore_state; the leaf
+    rollouts of a batch of simulations run together in a CastleEscapeVecEnv. The subtree
+    under the real outcome is kept for the next move.
+    """
+
+    def __init__(self, env, time_budget=0.05, node_budget=None, batch_size=32, rollout_depth=40,
+                 gamma=0.95, exploration=1.0, seed=None):
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        self.batch_size = batch_size
+        self.rollout_depth = rollout_depth
+        self.gamma = gamma
+        self.rng = random.Random(seed)
+
+        # Private copies of the game for tree steps and batched rollouts
+        self.sim = CastleEscapeEnv(grid_size=env.grid_size, guards=env.guards, goal_room=env.goal_room)
+        self.sim.rewards = env.rewards
+        self.sim.seed(seed)
+        self.rollouts = CastleEscapeVecEnv(batch_size, env=self.sim, seed=seed)
+        self.exploration = exploration * max(abs(r) for r in env.rewards.values())
+        self._neighbors = self.sim.kernel.neighbors.tolist()
+        self._goal_row, self._goal_col = env.goal_room
+
+        self.root = None
+        self.last_action = None
+        self.stats = {}
+        self.latencies = []
+
+    def _legal_actions(self, snapshot):
+        """FIGHT/HIDE when a guard is in the room, otherwise the in-bounds moves"""
+        self.sim.restore_state(snapshot)
+        if self.sim.guard_in_cell() >= 0:
+            return (4, 5)
+        return tuple(d for d in range(4) if self._neighbors[snapshot[0]][d] >= 0)
+
+    def _new_node(self, snapshot):
+        return _Node(snapshot, self._legal_actions(snapshot))
+
+    def _select_action(self, node):
+        untried = [a for a in node.actions if node.action_visits[a] == 0]
+        if untried:
+            return self.rng.choice(untried)
+        log_visits = math.log(node.visits)
+        return max(node.actions, key=lambda a: node.action_values[a] / node.action_visits[a]
+                   + self.exploration * math.sqrt(log_visits / node.action_visits[a]))
+
+    def _simulate(self, root):
+        """Walks down the tree to a new leaf; returns (path, leaf snapshot or None if terminal, depth)"""
+        node = root
+        path = []
+        while True:
+            action = self._select_action(node)
+            # Count the visit now so the other simulations of the batch spread out
+            node.visits += 1
+            node.action_visits[action] += 1
+            self.sim.restore_state(node.snapshot)
+            _, reward, done = self.sim.step_encoded(action)
+            path.append((node, action, reward))
+            if done:
+                return path, None
+            snapshot = self.sim.clone_state()
+            children = node.children[action]
+            if children is None:
+                children = node.children[action] = {}
+            child = children.get(snapshot[:2])
+            if child is None:
+                children[snapshot[:2]] = self._new_node(snapshot)
+                return path, snapshot
+            node = child
+
+    def _rollout(self, leaves):
+        """Discounted return of a random rollout from each leaf snapshot, all run as one batch"""
+        vec = self.rollouts
+        n = len(leaves)
+        vec.set_state(np.arange(n), [s[0] for s in leaves], [s[1] for s in leaves], [s[2] for s in leaves])
+        returns = np.zeros(vec.num_envs)
+        alive = np.arange(vec.num_envs) < n
+        discount = 1.0
+        guard = vec.get_observation()['guard_in_cell']
+        for _ in range(self.rollout_depth):
+            # Fight or hide when facing a guard, otherwise move at random
+            moves = vec.rng.integers(0, 4, vec.num_envs)
+            actions = np.where(guard > 0, 4 + (moves & 1), moves)
+            obs, rewards, dones, _ = vec.step(actions)
+            returns += discount * rewards * alive
+            alive &= ~dones
+            if not alive.any():
+                break
+            discount *= self.gamma
+            guard = obs['guard_in_cell']
+        return returns[:n]
+
+    def _backup(self, path, value):
+        for node, action, reward in reversed(path):
+            value = reward + self.gamma * value
+            node.action_values[action] += value
+
+    def act(self, env):
+        """Chooses the next action for env's current state"""
+        start = time.perf_counter()
+        snapshot = env.clone_state()
+
+        # Reuse the subtree under the outcome that actually happened
+        root = None
+        if self.root is not None and self.last_action is not None and snapshot[2] == self.root.snapshot[2]:
+            children = self.root.children[self.last_action]
+            if children:
+                root = children.get(snapshot[:2])
+        if root is None:
+            root = self._new_node(snapshot)
+
+        simulations = 0
+        nodes = 0
+        while True:
+            batch = []
+            for _ in range(self.batch_size):
+                path, leaf = self._simulate(root)
+                nodes += len(path)
+                batch.append((path, leaf))
+            leaves = [leaf for _, leaf in batch if leaf is not None]
+            values = iter(self._rollout(leaves)) if leaves else iter(())
+            for path, leaf in batch:
+                self._backup(path, next(values) if leaf is not None else 0.0)
+            simulations += len(batch)
+            if self.node_budget is not None and nodes >= self.node_budget:
+                break
+            if self.time_budget is not None and time.perf_counter() - start >= self.time_budget:
+                break
+
+        action = max(root.actions, key=lambda a: root.action_visits[a])
+        self.root = root
+        self.last_action = action
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.stats = {'simulations': simulations, 'nodes': nodes, 'latency': latency,
+                      'nodes_per_sec': nodes / latency}
+        return action
+
+
+def run_episode(env, agent, render=None, verbose=True):
+    """Plays one episode with agent, calling render(obs, reward, done, info) after every step"""
+    obs, reward, done, info = env.reset()
+    agent.root = None
+    total_reward = 0
+    while not done:
+        action = agent.act(env)
+        obs, reward, done, info = env.step(action)
+        total_reward += reward
+        if render is not None:
+            render(obs, reward, done, info)
+        if verbose:
+            print(f"{env.actions[action]:>5}  {agent.stats['nodes_per_sec']:,.0f} nodes/s, "
+                  f"{agent.stats['latency'] * 1000:.1f} ms")
+    if verbose:
+        print(f"Test complete: {'SUCCESS' if total_reward > 0 else 'FAILURE'}")
+        print(f"Total reward: {total_reward}, mean decision latency: {np.mean(agent.latencies) * 1000:.1f} ms")
+    return total_reward
+
+
+if __name__ == "__main__":
+    gui_flag = True
+    if gui_flag:
+        import vis_gym
+        vis_gym.setup(GUI=gui_flag)
+        env = vis_gym.game
+    else:
+        env = CastleEscapeEnv()
+    agent = MCTSAgent(env, time_budget=0.1)
+    run_episode(env, agent, render=vis_gym.refresh if gui_flag else None)
+    env.close()
@@ -1,17 +1,334 @@
 import gym
 from gym import spaces
 import numpy as np
-import random
+import hashlib
+import itertools
+import math
+import os
+
+# Outcome types for FIGHT/HIDE in the transition kernel
+OUTCOME_WON, OUTCOME_LOST, OUTCOME_HID = 0, 1, 2
+
+# Event codes describing what a step did (info['event'] when text_results is off).
+# EVENT_GOAL / EVENT_DEFEAT are flags OR'ed in when the step ends the game.
+EVENT_MOVED = 0
+EVENT_BLOCKED = 1
+EVENT_OUT_OF_BOUNDS = 2
+EVENT_FIGHT_WON = 3
+EVENT_FIGHT_LOST = 4
+EVENT_HID = 5
+EVENT_HIDE_FAILED_WON = 6
+EVENT_HIDE_FAILED_LOST = 7
+EVENT_NO_GUARD_FIGHT = 8
+EVENT_NO_GUARD_HIDE = 9
+EVENT_MASK = 0x0F
+EVENT_GOAL = 0x10
+EVENT_DEFEAT = 0x20
+
+# Result text for each event, as CastleEscapeEnv.step() reports it in info['result']
+EVENT_MESSAGES = {
+    EVENT_MOVED: "Moved to {position}",
+    EVENT_BLOCKED: "Guard {guard} is in the room! You must fight or hide.",
+    EVENT_OUT_OF_BOUNDS: "Out of bounds!",
+    EVENT_FIGHT_WON: "Fought {guard} and won!",
+    EVENT_FIGHT_LOST: "Fought {guard} and lost!",
+    EVENT_HID: "Successfully hid from {guard}!",
+    EVENT_HIDE_FAILED_WON: "Fought {guard} and won!",
+    EVENT_HIDE_FAILED_LOST: "Fought {guard} and lost!",
+    EVENT_NO_GUARD_FIGHT: "No guard to fight!",
+    EVENT_NO_GUARD_HIDE: "No guard to hide from!",
+}
+
+# Events for each fight/hide outcome type, indexed by OUTCOME_*
+FIGHT_EVENTS = (EVENT_FIGHT_WON, EVENT_FIGHT_LOST)
+HIDE_EVENTS = (EVENT_HIDE_FAILED_WON, EVENT_HIDE_FAILED_LOST, EVENT_HID)
+
+# Array forms for batched steps: the event of FIGHT (row 0) / HIDE (row 1) for each outcome type,
+# and the outcome type of each event code (-1 for events without a fight or hide)
+OUTCOME_EVENTS = np.array([FIGHT_EVENTS + (EVENT_FIGHT_LOST,), HIDE_EVENTS])
+EVENT_OUTCOMES = np.full(EVENT_MASK + 1, -1)
+EVENT_OUTCOMES[list(FIGHT_EVENTS) + list(HIDE_EVENTS)] = [OUTCOME_WON, OUTCOME_LOST, OUTCOME_WON, OUTCOME_LOST,
+                                                         OUTCOME_HID]
+
+
+def describe_event(event, guard, position, rewards):
+    """Turns an event code back into the result text of CastleEscapeEnv.step()"""
+    result = EVENT_MESSAGES[event & EVENT_MASK].format(guard=guard, position=position)
+    if event & EVENT_GOAL:
+        result += f" You've reached the goal! {rewards['goal']} points!"
+    elif event & EVENT_DEFEAT:
+        result += f" You've been caught! {rewards['combat_loss']} points!"
+    return result
+
+
+# Number of uniforms drawn at once by CastleEscapeEnv
+RANDOM_BLOCK_SIZE = 4096
+
+
+def build_alias_tables(probs):
+    """Vectorized alias tables for each row of a (rows, n) probability matrix.
+
+    Returns (prob, alias) so that drawing i uniformly from 0..n-1 and keeping it with
+    probability prob[row, i] (else taking alias[row, i]) samples from that row.
+    """
+    rows, n = probs.shape
+    scaled = probs * n
+    prob = np.ones((rows, n))
+    alias = np.tile(np.arange(n), (rows, 1))
+    done = np.zeros((rows, n), dtype=bool)
+    r = np.arange(rows)
+    for _ in range(n - 1):
+        # Pair the smallest remaining entry with the largest one in every row
+        small = np.where(done, np.inf, scaled).argmin(axis=1)
+        large = np.where(done, -np.inf, scaled).argmax(axis=1)
+        active = (scaled[r, small] < 1) & (small != large)
+        ra, sa, la = r[active], small[active], large[active]
+        prob[ra, sa] = scaled[ra, sa]
+        alias[ra, sa] = la
+        scaled[ra, la] -= 1 - scaled[ra, sa]
+        done[ra, sa] = True
+    return prob, alias
+
+
+class TransitionKernel:
+    """Precompiled dynamics for one castle configuration.
+
+    Movement is sampled from per-(cell, direction) alias tables over destination cells.
+    FIGHT and HIDE are sampled from per-(guard, action) alias tables over outcome types;
+    the leftover fraction of the same uniform then picks the adjacent room, so every
+    step needs a single uniform draw.
+    """
+
+    def __init__(self, grid_shape, strength, keenness):
+        self.key = (tuple(grid_shape), tuple(strength), tuple(keenness))
+        rows, cols = grid_shape
+        num_cells = rows * cols
+        cells = np.arange(num_cells)
+        x, y = np.divmod(cells, cols)
+
+        # Neighbors in UP, DOWN, LEFT, RIGHT order, -1 when out of bounds
+        tx = np.stack([x - 1, x + 1, x, x], axis=1)
+        ty = np.stack([y, y, y - 1, y + 1], axis=1)
+        inside = (tx >= 0) & (tx < rows) & (ty >= 0) & (ty < cols)
+        self.neighbors = np.where(inside, tx * cols + ty, -1)
+
+        # In-bounds neighbors packed to the front of each row
+        order = np.argsort(~inside, axis=1, kind='stable')
+        self.adjacent = np.take_along_axis(self.neighbors, order, axis=1)
+        self.num_adjacent = inside.sum(axis=1)
+
+        # Movement: 90% intended target, 10% split over the other in-bounds neighbors
+        # (or staying put if there are none). Outcome 0 is the target, 1-3 the others.
+        move_out = np.empty((num_cells, 4, 4), dtype=np.int64)
+        move_p = np.zeros((num_cells, 4, 4))
+        for d in range(4):
+            others = [o for o in range(4) if o != d]
+            other_in = inside[:, others]
+            num_others = other_in.sum(axis=1)
+            move_out[:, d, 0] = self.neighbors[:, d]
+            move_out[:, d, 1:] = np.where(other_in, self.neighbors[:, others], cells[:, None])
+            move_p[:, d, 0] = 0.9
+            move_p[:, d, 1:] = np.where(other_in, 0.1 / np.maximum(num_others, 1)[:, None], 0.0)
+            stuck = num_others == 0
+            move_out[stuck, d, 1] = cells[stuck]
+            move_p[stuck, d, 1] = 0.1
+        prob, alias = build_alias_tables(move_p.reshape(-1, 4))
+        base = np.arange(num_cells * 4)[:, None] * 4
+        self.move_out = move_out.reshape(-1)
+        self.move_p = move_p.reshape(-1)
+        self.move_prob = prob.reshape(-1)
+        self.move_alias = (base + alias).reshape(-1)
+
+        # FIGHT: won with 1 - strength. HIDE: hid with 1 - keenness, otherwise fight.
+        s = np.asarray(strength, dtype=float)
+        k = np.asarray(keenness, dtype=float)
+        num_guards = len(s)
+        act_out = np.zeros((num_guards, 2, 3), dtype=np.int64)
+        act_p = np.zeros((num_guards, 2, 3))
+        act_out[:, 0] = [OUTCOME_WON, OUTCOME_LOST, OUTCOME_LOST]
+        act_p[:, 0, 0], act_p[:, 0, 1] = 1 - s, s
+        act_out[:, 1] = [OUTCOME_HID, OUTCOME_WON, OUTCOME_LOST]
+        act_p[:, 1, 0], act_p[:, 1, 1], act_p[:, 1, 2] = 1 - k, k * (1 - s), k * s
+        prob, alias = build_alias_tables(act_p.reshape(-1, 3))
+        base = np.arange(num_guards * 2)[:, None] * 3
+        self.act_out = act_out.reshape(-1)
+        self.act_p = act_p.reshape(-1)
+        self.act_prob = prob.reshape(-1)
+        self.act_alias = (base + alias).reshape(-1)
+
+    def step_batch(self, cell, health, guard, actions, u):
+        """One step for arrays of players, the array form of CastleEscapeEnv._play().
+
+        guard is the 1-based guard in each player's cell (0 if none) and u one uniform per
+        player. Returns the new cells, the new health values and the EVENT_* code of each step
+        (without the goal/defeat flags).
+        """
+        has_guard = guard > 0
+        g = np.maximum(guard - 1, 0)
+
+        # Movement: blocked by a guard, out of bounds, or sampled from the alias table
+        d = np.minimum(actions, 3)
+        x = u * 4
+        i = x.astype(np.int64)
+        j = (cell * 4 + d) * 4 + i
+        dest = np.where(x - i < self.move_prob[j], self.move_out[j], self.move_out[self.move_alias[j]])
+        inside = self.neighbors[cell, d] >= 0
+        moving = (actions < 4) & ~has_guard & inside
+        new_cell = np.where(moving, dest, cell)
+
+        # Fighting and hiding, sampled from the per-guard alias tables
+        acting = (actions >= 4) & has_guard
+        a = np.clip(actions - 4, 0, 1)
+        x = u * 3
+        i = x.astype(np.int64)
+        f = x - i
+        j = (g * 2 + a) * 3 + i
+        p = self.act_prob[j]
+        take = f < p
+        outcome = np.where(take, self.act_out[j], self.act_out[self.act_alias[j]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rest = np.where(take, f / p, (f - p) / (1 - p))
+        new_health = np.where(acting & (outcome == OUTCOME_LOST), np.maximum(health - 1, 0), health)
+
+        # Every fight or hide ends in a random adjacent room, picked with the rest of the uniform
+        num_adjacent = self.num_adjacent[cell]
+        pick = np.clip((rest * num_adjacent).astype(np.int64), 0, np.maximum(num_adjacent - 1, 0))
+        new_cell = np.where(acting & (num_adjacent > 0), self.adjacent[cell, pick], new_cell)
+
+        move_event = np.where(has_guard, EVENT_BLOCKED, np.where(inside, EVENT_MOVED, EVENT_OUT_OF_BOUNDS))
+        act_event = np.where(has_guard, OUTCOME_EVENTS[a, outcome], EVENT_NO_GUARD_FIGHT + a)
+        return new_cell, new_health, np.where(actions < 4, move_event, act_event)
+
+
+# Bump when the layout of cached transition models changes
+MODEL_CACHE_VERSION = 1
+
+# Default cap on the states of a transition model (layouts * cells * 3 health values)
+MAX_MODEL_STATES = 5000000
+
+
+class TransitionModel:
+    """Exact MDP of CastleEscapeEnv for a set of guard layouts.
+
+    State s = (layout * num_cells + cell) * 3 + health. P[a] is a CSR matrix with
+    P[a][s, s'] = Pr(s' | s, a) and R[a][s] is the expected immediate reward, including
+    the goal/defeat bonus on entering a terminal state. Terminal states are absorbing
+    with zero reward. obs_codes maps every state to the code step_encoded() returns and
+    goal_distance gives the Manhattan distance from each cell to the goal.
+    """
+
+    def __init__(self, P, R, layouts, num_cells, terminal, obs_codes, goal_distance):
+        self.P = P
+        self.R = R
+        self.layouts = layouts
+        self.num_cells = num_cells
+        self.terminal = terminal
+        self.obs_codes = obs_codes
+        self.goal_distance = goal_distance
+        self.num_states = len(terminal)
+        self.num_actions = len(P)
+
+    def state_index(self, layout, cell, health):
+        return (layout * self.num_cells + cell) * 3 + health
+
+    def initial_states(self, start_cell=0):
+        """Start state of every layout (each layout is equally likely)"""
+        return self.state_index(np.arange(len(self.layouts)), start_cell, 2)
+
+
+def random_guard_cells(rng, candidates, count, num_guards):
+    """Guard cells for count castles, num_guards distinct rooms each drawn from candidates"""
+    if len(candidates) <= 4096:
+        # A random permutation per castle gives distinct guard rooms, like np.random.choice(replace=False)
+        keys = rng.random((count, len(candidates)))
+        return candidates[np.argsort(keys, axis=1)[:, :num_guards]]
+    # Large castles: sample each castle separately instead of permuting every room
+    return np.array([rng.choice(candidates, num_guards, replace=False) for _ in range(count)],
+                    dtype=np.int64).reshape(count, num_guards)
+
+
+def random_guards(num_guards, seed=None):
+    """A roster of num_guards guards G1..Gn with random strength and keenness"""
+    rng = np.random.default_rng(seed)
+    return {
+        f'G{i + 1}': {'strength': round(float(rng.uniform(0.5, 0.95)), 2),
+                      'keenness': round(float(rng.uniform(0.1, 0.6)), 2)}
+        for i in range(num_guards)
+    }
+
+
+class CastleState:
+    """Compact game state: player cell index, health as an int and a tuple of guard cells"""
+    __slots__ = ('player_cell', 'player_health', 'guard_cells')
+
+    def __init__(self, player_cell=0, player_health=2, guard_cells=()):
+        self.player_cell = player_cell
+        self.player_health = player_health
+        self.guard_cells = tuple(guard_cells)
+
+
+class _Guard(dict):
+    """One guard's {'strength', 'keenness'} entry that reports every change to on_change"""
+
+    def __init__(self, stats, on_change):
+        super().__init__(stats)
+        self._on_change = on_change
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._on_change()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._on_change()
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class GuardTable(dict):
+    """Guard table of an env, {name: {'strength': p, 'keenness': p}}.
+
+    Adding, removing or editing a guard calls on_change, which lets the env rebuild its
+    transition kernel before the next step. Copies and pickles are plain dicts.
+    """
+
+    def __init__(self, guards, on_change):
+        super().__init__((name, _Guard(stats, on_change)) for name, stats in guards.items())
+        self._on_change = on_change
+
+    def __setitem__(self, name, stats):
+        super().__setitem__(name, _Guard(stats, self._on_change))
+        self._on_change()
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self._on_change()
+
+    def update(self, *args, **kwargs):
+        for name, stats in dict(*args, **kwargs).items():
+            super().__setitem__(name, _Guard(stats, self._on_change))
+        self._on_change()
+
+    def __reduce__(self):
+        return dict, ({name: dict(stats) for name, stats in self.items()},)
+
 
 class CastleEscapeEnv(gym.Env):
-    metadata = {'render.modes': ['human']}
+    metadata = {'render.modes': ['human', 'rgb_array']}
 
-    def __init__(self):
+    def __init__(self, grid_size=5, guards=None, goal_room=None, text_results=True):
         super(CastleEscapeEnv, self).__init__()
-        # Define a 5x5 grid (numbered from (0,0) to (4,4))
-        self.grid_size = 5
-        self.rooms = [(i, j) for i in range(self.grid_size) for j in range(self.grid_size)]
-        self.goal_room = (4, 4)  # Define the goal room
+        # With text_results off, step() reports info['event'] / info['guard'] instead of result strings
+        self.text_results = text_results
+        self.last_event = EVENT_MOVED
+        self.last_guard = -1
+        # Setting grid_size, goal_room or guards (or editing a guard) marks the kernel stale
+        self._kernel_stale = True
+        # Define the grid, 5x5 by default (numbered from (0,0) to (4,4)); (rows, cols) for rectangular castles
+        self.grid_size = grid_size
+        # Goal room, the bottom-right corner unless given; a default goal follows later grid changes
+        self.goal_room = goal_room
 
         # Define health states
         self.health_states = ['Full', 'Injured', 'Critical']
@@ -19,7 +336,7 @@ class CastleEscapeEnv(gym.Env):
         self.int_to_health_state = {2: 'Full', 1: 'Injured', 0: 'Critical'}
 
         # Define the guards with their strengths (affects combat) and keenness (affects hiding)
-        self.guards = {
+        self.guards = guards if guards is not None else {
             'G1': {'strength': 0.8, 'keenness': 0.1},  # Guard 1
             'G2': {'strength': 0.6, 'keenness': 0.3},  # Guard 2
             'G3': {'strength': 0.9, 'keenness': 0.2},  # Guard 3
@@ -39,160 +356,308 @@ class CastleEscapeEnv(gym.Env):
         self.actions = ['UP', 'DOWN', 'LEFT', 'RIGHT', 'FIGHT', 'HIDE']
         self.action_space = spaces.Discrete(len(self.actions))
 
-        # Observation space
-        obs_space_dict = {
-            'player_position': spaces.Tuple((spaces.Discrete(self.grid_size), spaces.Discrete(self.grid_size))),
+        # Transition kernel and observation space, built by _check_kernel() and rebuilt whenever the
+        # grid or guards change
+        self.kernel = None
+        self._layout_key = None
+        self._rng = np.random.default_rng()
+        self._uniforms = []
+        self._uniform_index = 0
+
+        # Set initial state; _occupancy maps each cell to the 1-based index of its guard (0 if empty)
+        self.state = CastleState()
+        self._occupancy = []
+        self.reset()
+
+    @property
+    def grid_size(self):
+        return self._grid_size
+
+    @grid_size.setter
+    def grid_size(self, value):
+        self._grid_size = value
+        self._kernel_stale = True
+
+    @property
+    def goal_room(self):
+        return self._goal_room
+
+    @goal_room.setter
+    def goal_room(self, value):
+        self._goal_room = value
+        self._default_goal = value is None
+        self._kernel_stale = True
+
+    @property
+    def guards(self):
+        return self._guards
+
+    @guards.setter
+    def guards(self, value):
+        self._guards = GuardTable(value, self._mark_kernel_stale)
+        self._kernel_stale = True
+
+    def _mark_kernel_stale(self):
+        self._kernel_stale = True
+
+    def _check_kernel(self):
+        """Rebuild the transition kernel if the grid, the goal or the guard table changed"""
+        self.guard_names = list(self.guards.keys())
+        strength = tuple(self.guards[g]['strength'] for g in self.guard_names)
+        keenness = tuple(self.guards[g]['keenness'] for g in self.guard_names)
+        grid_shape = (self.grid_size, self.grid_size) if isinstance(self.grid_size, int) else tuple(self.grid_size)
+        layout_key = (grid_shape, tuple(self.guard_names), None if self._default_goal else tuple(self.goal_room))
+        if self.kernel is not None and self.kernel.key == (grid_shape, strength, keenness) \
+                and self._layout_key == layout_key:
+            self._kernel_stale = False
+            return
+        grid_changed = self.kernel is None or self.kernel.key[0] != grid_shape
+        self.num_rows, self.num_cols = grid_shape
+        self.rooms = [(i, j) for i in range(self.num_rows) for j in range(self.num_cols)]
+        self.num_cells = self.num_rows * self.num_cols
+        if self._default_goal:
+            self._goal_room = (self.num_rows - 1, self.num_cols - 1)
+        elif not (0 <= self.goal_room[0] < self.num_rows and 0 <= self.goal_room[1] < self.num_cols):
+            raise ValueError(f"goal room {self.goal_room} is outside the {self.num_rows}x{self.num_cols} castle")
+        self.goal_cell = self.goal_room[0] * self.num_cols + self.goal_room[1]
+        # Guards start in any room except the starting room and the goal
+        self.guard_candidates = np.array([c for c in range(self.num_cells) if c not in (0, self.goal_cell)])
+        if len(self.guard_names) > len(self.guard_candidates):
+            raise ValueError(f"{len(self.guard_names)} guards do not fit in a {self.num_rows}x{self.num_cols} castle")
+        # Integer layout used by step_encoded: cell * 3 * (guards + 1) + health * (guards + 1) + guard,
+        # which for the 5x5 castle is the same 375-state layout as hash() in the training scripts
+        self.num_states = self.num_cells * len(self.health_states) * (len(self.guards) + 1)
+        self.kernel = TransitionKernel(grid_shape, strength, keenness)
+        self._layout_key = layout_key
+        self.observation_space = spaces.Dict({
+            'player_position': spaces.Tuple((spaces.Discrete(self.num_rows), spaces.Discrete(self.num_cols))),
             'player_health': spaces.Discrete(len(self.health_states)),
             'guard_positions': spaces.Dict({
-                guard: spaces.Tuple((spaces.Discrete(self.grid_size), spaces.Discrete(self.grid_size)))
-                for guard in self.guards
+                guard: spaces.Tuple((spaces.Discrete(self.num_rows), spaces.Discrete(self.num_cols)))
+                for guard in self.guard_names
             })
+        })
+
+        # The old state may index cells or guards that no longer exist: keep the guards only if the
+        # grid and the roster size are unchanged, and restart the player on a new grid
+        old_guard_cells = self.state.guard_cells
+        self._occupancy = [0] * self.num_cells
+        self.state.guard_cells = ()
+        if grid_changed:
+            self.state.player_cell = 0
+            self.state.player_health = 2
+        elif len(old_guard_cells) == len(self.guard_names):
+            self._place_guards(old_guard_cells)
+        # Plain lists are faster than NumPy arrays for the scalar step path
+        self._neighbors = self.kernel.neighbors.tolist()
+        self._adjacent = [row[:k] for row, k in zip(self.kernel.adjacent.tolist(), self.kernel.num_adjacent.tolist())]
+        self._move_out = self.kernel.move_out.tolist()
+        self._move_prob = self.kernel.move_prob.tolist()
+        self._move_alias = self.kernel.move_alias.tolist()
+        self._act_out = self.kernel.act_out.tolist()
+        self._act_prob = self.kernel.act_prob.tolist()
+        self._act_alias = self.kernel.act_alias.tolist()
+        self._kernel_stale = False
+
+    def seed(self, seed=None):
+        """Seeds the random number generator used for transitions"""
+        self._rng = np.random.default_rng(seed)
+        self._uniforms = []
+        self._uniform_index = 0
+        return [seed]
+
+    def _uniform(self):
+        """Next uniform from the pre-drawn block, refilling it when exhausted"""
+        i = self._uniform_index
+        if i >= len(self._uniforms):
+            self._uniforms = self._rng.random(RANDOM_BLOCK_SIZE).tolist()
+            i = 0
+        self._uniform_index = i + 1
+        return self._uniforms[i]
+
+    @property
+    def current_state(self):
+        """Dict view of the game state (positions as (row, col) tuples, health as a string)"""
+        n = self.num_cols
+        return {
+            'player_position': divmod(self.state.player_cell, n),
+            'player_health': self.int_to_health_state[self.state.player_health],
+            'guard_positions': {
+                guard: divmod(cell, n) for guard, cell in zip(self.guard_names, self.state.guard_cells)
+            }
         }
-        self.observation_space = spaces.Dict(obs_space_dict)
 
-        # Set initial state
-        self.reset()
+    @current_state.setter
+    def current_state(self, value):
+        n = self.num_cols
+        x, y = value['player_position']
+        self.state.player_cell = x * n + y
+        self.state.player_health = self.health_state_to_int[value['player_health']]
+        self._place_guards([value['guard_positions'][g][0] * n + value['guard_positions'][g][1]
+                            for g in self.guard_names])
+
+    def _place_guards(self, guard_cells):
+        """Moves the guards to guard_cells, updating only the occupancy entries that change"""
+        occupancy = self._occupancy
+        for cell in self.state.guard_cells:
+            occupancy[cell] = 0
+        # Fill in reverse so the first guard listed wins if two share a cell
+        for g in range(len(guard_cells) - 1, -1, -1):
+            occupancy[guard_cells[g]] = g + 1
+        self.state.guard_cells = tuple(guard_cells)
+
+    def clone_state(self, include_rng=False):
+        """Immutable snapshot of the game for restore_state().
+
+        Guard cells are shared as one tuple, so cloning and restoring within an episode is O(1).
+        With include_rng the snapshot also captures the random stream, making replays exact.
+        """
+        s = self.state
+        if include_rng:
+            return (s.player_cell, s.player_health, s.guard_cells,
+                    self._rng.bit_generator.state, self._uniforms, self._uniform_index)
+        return (s.player_cell, s.player_health, s.guard_cells)
+
+    def restore_state(self, snapshot):
+        """Reinstates a snapshot taken by clone_state()"""
+        s = self.state
+        if snapshot[2] is not s.guard_cells:
+            self._place_guards(snapshot[2])
+        s.player_cell = snapshot[0]
+        s.player_health = snapshot[1]
+        if len(snapshot) > 3:
+            # The block of uniforms is replaced on refill, never modified, so it can be shared
+            self._rng.bit_generator.state = snapshot[3]
+            self._uniforms = snapshot[4]
+            self._uniform_index = snapshot[5]
 
     def reset(self):
         """Resets the game to the initial state"""
-        #print(self.rooms[1:-1])
-        rnd_indices = np.random.choice(range(1,len(self.rooms)-1), size=len(self.guards), replace=False)
-        guard_pos = [self.rooms[i] for i in rnd_indices]
-        self.current_state = {
-            'player_position': (0, 0),
-            'player_health': 'Full',
-            'guard_positions': {
-                guard: pos for guard, pos in zip(self.guard_names, guard_pos)
-            }  # Guards in random rooms (not the goal or the starting)
-        }
+        self._check_kernel()
+        # Guards in random rooms (not the goal or the starting)
+        if len(self.guard_candidates) <= 4096:
+            rnd_indices = np.random.choice(self.guard_candidates, size=len(self.guards), replace=False)
+        else:
+            # Large castles: avoid permuting every room on each reset
+            rnd_indices = self._rng.choice(self.guard_candidates, size=len(self.guards), replace=False)
+        self.state.player_cell = 0
+        self.state.player_health = 2
+        self._place_guards(rnd_indices.tolist())
         return self.get_observation(), 0, False, {}
 
-    def get_observation(self):
-        guard_in_cell = None
-        guard_positions = self.current_state['guard_positions']
-        player_position = self.current_state['player_position']
-        for guard in guard_positions:
-            if guard_positions[guard] == player_position:
-                guard_in_cell = guard
-                break
+    def guard_in_cell(self):
+        """Index of the first guard in the player's room, or -1 if the room is empty"""
+        return self._occupancy[self.state.player_cell] - 1
 
+    def state_code(self):
+        """Encodes the current observation as a single int (see num_states)"""
+        s = self.state
+        num_guard_codes = len(self.guard_names) + 1
+        return (s.player_cell * 3 + s.player_health) * num_guard_codes + self.guard_in_cell() + 1
+
+    def get_observation(self):
+        guard = self.guard_in_cell()
         obs = {
-            'player_position': self.current_state['player_position'],
-            'player_health': self.health_state_to_int[self.current_state['player_health']],
-            'guard_in_cell': guard_in_cell if guard_in_cell else None,
+            'player_position': divmod(self.state.player_cell, self.num_cols),
+            'player_health': self.state.player_health,
+            'guard_in_cell': self.guard_names[guard] if guard >= 0 else None,
         }
         return obs
 
     def is_terminal(self):
         """Check if the game has reached a terminal state"""
-        if self.current_state['player_position'] == self.goal_room:  # Reaching the goal means victory
+        if self.state.player_cell == self.goal_cell:  # Reaching the goal means victory
             return 'goal'
-        if self.current_state['player_health'] == 'Critical':  # Losing health 3 times results in defeat
+        if self.state.player_health == 0:  # Losing health 3 times results in defeat
             return 'defeat'
         return False
 
+    def _move(self, direction):
+        """Moves the player towards direction (0-3); returns False if that leaves the grid"""
+        s = self.state
+        if self._neighbors[s.player_cell][direction] < 0:
+            return False
+        # 90% intended move, 10% random other adjacent cell, sampled from the alias table
+        x = self._uniform() * 4
+        i = int(x)
+        j = (s.player_cell * 4 + direction) * 4 + i
+        s.player_cell = self._move_out[j] if x - i < self._move_prob[j] else self._move_out[self._move_alias[j]]
+        return True
+
+    def _resolve(self, guard, action):
+        """Resolves FIGHT (4) or HIDE (5) against a guard; returns an OUTCOME_* type"""
+        s = self.state
+        x = self._uniform() * 3
+        i = int(x)
+        f = x - i
+        j = (guard * 2 + action - 4) * 3 + i
+        p = self._act_prob[j]
+        if f < p:
+            outcome = self._act_out[j]
+            f = f / p
+        else:
+            outcome = self._act_out[self._act_alias[j]]
+            f = (f - p) / (1 - p)
+        if outcome == OUTCOME_LOST and s.player_health > 0:
+            s.player_health -= 1
+        # The player ends up in a random adjacent cell, chosen with the rest of the same uniform
+        adjacent = self._adjacent[s.player_cell]
+        if adjacent:
+            s.player_cell = adjacent[min(int(f * len(adjacent)), len(adjacent) - 1)]
+        return outcome
+
+    def _play(self, action):
+        """Applies an integer action and returns its reward; the outcome is left in last_event / last_guard"""
+        if self._kernel_stale:
+            self._check_kernel()
+        guard = self.guard_in_cell()
+        self.last_guard = guard
+        if action < 4:
+            # If there's a guard in the room, the player must fight or hide
+            if guard >= 0:
+                self.last_event = EVENT_BLOCKED
+            elif self._move(action):
+                self.last_event = EVENT_MOVED
+            else:
+                self.last_event = EVENT_OUT_OF_BOUNDS
+            return 0
+        if guard < 0:
+            self.last_event = EVENT_NO_GUARD_FIGHT if action == 4 else EVENT_NO_GUARD_HIDE
+            return 0
+        # A failed hide turns into a fight, resolved in the same draw
+        outcome = self._resolve(guard, action)
+        self.last_event = FIGHT_EVENTS[outcome] if action == 4 else HIDE_EVENTS[outcome]
+        if outcome == OUTCOME_WON:
+            return self.rewards['combat_win']
+        if outcome == OUTCOME_LOST:
+            return self.rewards['combat_loss']
+        return 0
+
+    def describe_last_event(self):
+        """Result text for the last step, built from last_event"""
+        guard = self.guard_names[self.last_guard] if self.last_guard >= 0 else None
+        return describe_event(self.last_event, guard, divmod(self.state.player_cell, self.num_cols), self.rewards)
+
     def move_player(self, action):
         """Move player based on the action, but prevent movement if a guard is in the same room"""
-        current_position = self.current_state['player_position']
-        guards_in_room = [
-            guard for guard in self.guards
-            if self.current_state['guard_positions'][guard] == current_position
-        ]
-
-        # If there's a guard in the room, the player must fight or hide
-        if guards_in_room:
-            return f"Guard {guards_in_room[0]} is in the room! You must fight or hide.", 0
-
-        x, y = self.current_state['player_position']
-        directions = {
-            'UP': (x - 1, y),
-            'DOWN': (x + 1, y),
-            'LEFT': (x, y - 1),
-            'RIGHT': (x, y + 1)
-        }
-
-        # Calculate the intended move
-        new_position = directions.get(action, self.current_state['player_position'])
-
-        # Ensure new position is within bounds
-        if 0 <= new_position[0] < self.grid_size and 0 <= new_position[1] < self.grid_size:
-            # 90% chance to move as intended
-            if random.random() <= 0.9:
-                self.current_state['player_position'] = new_position
-            else:
-                # 10% chance to move to a random adjacent cell
-                adjacent_positions = [
-                    directions[act] for act in directions if act != action
-                ]
-                adjacent_positions = [
-                    pos for pos in adjacent_positions
-                    if 0 <= pos[0] < self.grid_size and 0 <= pos[1] < self.grid_size
-                ]
-                if adjacent_positions:
-                    self.current_state['player_position'] = random.choice(adjacent_positions)
-            return f"Moved to {self.current_state['player_position']}", 0
-        else:
-            return "Out of bounds!", 0
+        reward = self._play(self.actions.index(action))
+        return self.describe_last_event(), reward
 
     def move_player_to_random_adjacent(self):
         """Move player to a random adjacent cell without going out of bounds"""
-        x, y = self.current_state['player_position']
-        directions = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
-
-        # Filter out-of-bounds positions
-        adjacent_positions = [
-            pos for pos in directions
-            if 0 <= pos[0] < self.grid_size and 0 <= pos[1] < self.grid_size
-        ]
-
-        # Move player to a random adjacent position
-        if adjacent_positions:
-            self.current_state['player_position'] = random.choice(adjacent_positions)
+        adjacent = self._adjacent[self.state.player_cell]
+        if adjacent:
+            self.state.player_cell = adjacent[int(self._uniform() * len(adjacent))]
 
     def try_fight(self):
         """Player chooses to fight the guard"""
-        current_position = self.current_state['player_position']
-        guards_in_room = [
-            guard for guard in self.guards
-            if self.current_state['guard_positions'][guard] == current_position
-        ]
-
-        if guards_in_room:
-            guard = guards_in_room[0]  # Choose one guard to fight
-            strength = self.guards[guard]['strength']
-
-            # Player tries to fight the guard
-            if random.random() > strength:  # Successful fight
-                self.move_player_to_random_adjacent()  # Move player to a random adjacent cell after victory
-                return f"Fought {guard} and won!", self.rewards['combat_win']
-            else:  # Player loses the fight
-                if self.current_state['player_health'] == 'Full':
-                    self.current_state['player_health'] = 'Injured'
-                elif self.current_state['player_health'] == 'Injured':
-                    self.current_state['player_health'] = 'Critical'
-                self.move_player_to_random_adjacent()  # Move player to a random adjacent cell after defeat
-                return f"Fought {guard} and lost!", self.rewards['combat_loss']
-        return "No guard to fight!", 0
+        reward = self._play(4)
+        return self.describe_last_event(), reward
 
     def try_hide(self):
         """Player attempts to hide from the guard"""
-        current_position = self.current_state['player_position']
-        guards_in_room = [
-            guard for guard in self.guards
-            if self.current_state['guard_positions'][guard] == current_position
-        ]
-
-        if guards_in_room:
-            guard = guards_in_room[0]  # Choose one guard to hide from
-            keenness = self.guards[guard]['keenness']
-
-            # Player tries to hide
-            if random.random() > keenness:  # Successful hide
-                self.move_player_to_random_adjacent()  # Move player to a random adjacent cell after successfully hiding
-                return f"Successfully hid from {guard}!", 0
-            else:
-                return self.try_fight()  # Hide failed, must fight
-        return "No guard to hide from!", 0
+        reward = self._play(5)
+        return self.describe_last_event(), reward
 
     def play_turn(self, action):
         """Take an action and update the state"""
@@ -213,29 +678,272 @@ class CastleEscapeEnv(gym.Env):
             action = self.actions.index(action)
 
         action_name = self.actions[action]
-        result, reward = self.play_turn(action_name)
+        reward = self._play(action)
 
         done = False
         terminal_state = self.is_terminal()
         if terminal_state == 'goal':
             done = True
             reward += self.rewards['goal']
-            result += f" You've reached the goal! {self.rewards['goal']} points!"
+            self.last_event |= EVENT_GOAL
         elif terminal_state == 'defeat':
             done = True
             reward += self.rewards['defeat']
-            result += f" You've been caught! {self.rewards['combat_loss']} points!"
+            self.last_event |= EVENT_DEFEAT
 
         observation = self.get_observation()
-        info = {'result': result, 'action': action_name}
+        if self.text_results:
+            info = {'result': self.describe_last_event(), 'action': action_name}
+        else:
+            info = {'event': self.last_event, 'guard': self.last_guard, 'action': action_name}
 
         return observation, reward, done, info
 
-    def render(self, mode='human'):
-        """Renders the current state"""
+    def step_encoded(self, action):
+        """Fast step for integer actions: returns (state_code, reward, done) without building an observation"""
+        s = self.state
+        reward = self._play(action)
+        if s.player_cell == self.goal_cell:
+            self.last_event |= EVENT_GOAL
+            return self.state_code(), reward + self.rewards['goal'], True
+        if s.player_health == 0:
+            self.last_event |= EVENT_DEFEAT
+            return self.state_code(), reward + self.rewards['defeat'], True
+        return self.state_code(), reward, False
+
+    def guard_layouts(self, max_layouts=None):
+        """Every possible guard layout as an array of guard cells, one row per layout"""
+        count = math.perm(len(self.guard_candidates), len(self.guard_names))
+        if max_layouts is not None and count > max_layouts:
+            raise ValueError(f"{count} guard layouts exceed max_layouts={max_layouts}; pass layouts explicitly")
+        layouts = np.array(list(itertools.permutations(self.guard_candidates, len(self.guard_names))), dtype=np.int64)
+        return layouts.reshape(count, len(self.guard_names))
+
+    def transition_model(self, layouts=None, cache_dir='.model_cache', max_states=MAX_MODEL_STATES):
+        """Builds the exact MDP as sparse matrices (see TransitionModel).
+
+        layouts is an array of guard cells, one row per layout; None enumerates every
+        layout (only feasible for small castles, 16M states for the default one).
+        Models are cached in cache_dir keyed by the env configuration and layouts.
+        """
+        from scipy import sparse
+
+        self._check_kernel()
+        num_guards = len(self.guard_names)
+        if layouts is None:
+            layouts = self.guard_layouts(max_layouts=max_states // (self.num_cells * 3))
+        layouts = np.asarray(layouts, dtype=np.int64).reshape(-1, num_guards)
+        num_states = len(layouts) * self.num_cells * 3
+        if num_states > max_states:
+            raise ValueError(f"{num_states} states exceed max_states={max_states}; pass fewer layouts")
+
+        key = repr((MODEL_CACHE_VERSION, self.kernel.key, self.goal_cell, sorted(self.rewards.items())))
+        digest = hashlib.sha1(key.encode() + layouts.tobytes()).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"model_{digest}.npz") if cache_dir else None
+        x, y = np.divmod(np.arange(self.num_cells), self.num_cols)
+        goal_distance = np.abs(x - self.goal_room[0]) + np.abs(y - self.goal_room[1])
+        if path and os.path.exists(path):
+            data = np.load(path)
+            P = [sparse.csr_matrix((data[f'data{a}'], data[f'indices{a}'], data[f'indptr{a}']),
+                                   shape=(num_states, num_states)) for a in range(len(self.actions))]
+            return TransitionModel(P, list(data['R']), layouts, self.num_cells, data['terminal'],
+                                   data['obs_codes'], goal_distance)
+
+        k = self.kernel
+        C = self.num_cells
+        # Guard occupying each cell of each layout (1-based, 0 if empty)
+        occupancy = np.zeros((len(layouts), C), dtype=np.int64)
+        for g in reversed(range(num_guards)):
+            occupancy[np.arange(len(layouts)), layouts[:, g]] = g + 1
+
+        layout, cell, health = [a.reshape(-1) for a in np.indices((len(layouts), C, 3))]
+        states = np.arange(num_states)
+        guard = occupancy[layout, cell]
+        terminal = (cell == self.goal_cell) | (health == 0)
+        obs_codes = (cell * 3 + health) * (num_guards + 1) + guard
+
+        def bonus(dest_cell, dest_health):
+            # Reward for entering a terminal state, goal checked first as in is_terminal()
+            return np.where(dest_cell == self.goal_cell, self.rewards['goal'],
+                            np.where(dest_health == 0, self.rewards['defeat'], 0))
+
+        # Terminal states and actions that leave the state unchanged are self-loops
+        num_adjacent = np.maximum(k.num_adjacent, 1)
+        adjacent = np.where(k.num_adjacent[:, None] > 0, k.adjacent, np.arange(C)[:, None])
+
+        P, R = [], []
+        for a in range(len(self.actions)):
+            if a < 4:
+                stay = terminal | (guard > 0) | (k.neighbors[cell, a] < 0)
+                j = ((cell * 4 + a) * 4)[:, None] + np.arange(4)
+                dest_cell = k.move_out[j]
+                dest_health = np.repeat(health[:, None], 4, axis=1)
+                prob = k.move_p[j]
+                immediate = np.zeros_like(prob)
+            else:
+                stay = terminal | (guard == 0)
+                g = np.maximum(guard - 1, 0)
+                j = ((g * 2 + a - 4) * 3)[:, None] + np.arange(3)
+                outcome = k.act_out[j][:, :, None]
+                dest_cell = np.repeat(adjacent[cell][:, None, :], 3, axis=1)
+                dest_health = np.maximum(health[:, None, None] - (outcome == OUTCOME_LOST), 0)
+                valid = np.arange(4) < num_adjacent[cell][:, None, None]
+                prob = k.act_p[j][:, :, None] * valid / num_adjacent[cell][:, None, None]
+                immediate = np.where(outcome == OUTCOME_WON, self.rewards['combat_win'],
+                                     np.where(outcome == OUTCOME_LOST, self.rewards['combat_loss'], 0))
+                dest_cell, dest_health, prob, immediate = [np.broadcast_to(x, prob.shape).reshape(num_states, -1)
+                                                           for x in (dest_cell, dest_health, prob, immediate)]
+            # Self-loops for states where the action changes nothing
+            dest_cell = np.where(stay[:, None], cell[:, None], dest_cell)
+            dest_health = np.where(stay[:, None], health[:, None], dest_health)
+            prob = np.where(stay[:, None], np.arange(prob.shape[1]) == 0, prob)
+            immediate = np.where(stay[:, None], 0, immediate)
+
+            keep = prob > 0
+            rows = np.broadcast_to(states[:, None], prob.shape)[keep]
+            dest = (layout[:, None] * C + dest_cell) * 3 + dest_health
+            reward = np.where(stay[:, None], 0, immediate + bonus(dest_cell, dest_health))
+            P.append(sparse.csr_matrix((prob[keep], (rows, dest[keep])), shape=(num_states, num_states)))
+            R.append(np.bincount(rows, weights=(prob * reward)[keep], minlength=num_states))
+
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            arrays = {'R': np.array(R), 'terminal': terminal, 'obs_codes': obs_codes}
+            for a, m in enumerate(P):
+                arrays.update({f'data{a}': m.data, f'indices{a}': m.indices, f'indptr{a}': m.indptr})
+            np.savez(path, **arrays)
+        return TransitionModel(P, R, layouts, C, terminal, obs_codes, goal_distance)
+
+    def render(self, mode='human', size=None, console=True, cell_size=None):
+        """Renders the current state.
+
+        mode='rgb_array' draws the game offscreen with vis_gym (no window or display needed)
+        and returns a (height, width, 3) uint8 view of the drawn frame, valid until the next
+        call. cell_size sets the drawing resolution, size=(width, height) scales the frame and
+        console=False drops the console below the castle.
+        """
+        if mode == 'rgb_array':
+            import vis_gym
+            return vis_gym.render_frame(self, size=size, console=console, cell_size=cell_size)
         print(f"Current state: {self.current_state}")
 
     def close(self):
         """Performs cleanup"""
         pass
 
+
+class CastleEscapeVecEnv:
+    """Runs num_envs independent castles at once using NumPy arrays.
+
+    The dynamics are the same as CastleEscapeEnv (90/10 movement slip, guard
+    strength for fights, keenness for hides) so Q-tables learned on either
+    env stay valid. Finished envs are reset automatically inside step().
+    """
+
+    def __init__(self, num_envs=64, env=None, seed=None):
+        # Copy the castle configuration from a single env
+        if env is None:
+            env = CastleEscapeEnv()
+        self.num_envs = num_envs
+        self.grid_size = env.grid_size
+        self.goal_room = env.goal_room
+        self.rewards = dict(env.rewards)
+        self.actions = list(env.actions)
+        self.rng = np.random.default_rng(seed)
+
+        # Share the compiled transition kernel and guard rooms of the single env
+        env._check_kernel()
+        self.kernel = env.kernel
+        self.guard_names = list(env.guard_names)
+        self.num_guards = len(self.guard_names)
+        self.num_cols = env.num_cols
+        self.num_cells = env.num_cells
+        self.start_cell = 0
+        self.goal_cell = env.goal_cell
+        self.guard_candidates = np.array(env.guard_candidates)
+
+        self.player_cell = np.zeros(num_envs, dtype=np.int64)
+        self.player_health = np.zeros(num_envs, dtype=np.int64)
+        self.guard_cells = np.zeros((num_envs, self.num_guards), dtype=np.int64)
+        # Guard index: every env's guard cells sorted and offset by env * num_cells, so one
+        # searchsorted finds the guard in each player's cell regardless of the guard count
+        self._guard_keys = np.zeros(num_envs * self.num_guards, dtype=np.int64)
+        self._guard_order = np.zeros(num_envs * self.num_guards, dtype=np.int64)
+        self.reset()
+
+    def _index_guards(self, idx):
+        """Refresh the guard index for the envs at the given indices"""
+        order = np.argsort(self.guard_cells[idx], axis=1, kind='stable')
+        keys = np.take_along_axis(self.guard_cells[idx], order, axis=1) + (idx * self.num_cells)[:, None]
+        slots = (idx * self.num_guards)[:, None] + np.arange(self.num_guards)
+        self._guard_keys[slots] = keys
+        self._guard_order[slots] = order
+
+    def _reset_envs(self, idx):
+        """Reset the envs at the given indices"""
+        self.player_cell[idx] = self.start_cell
+        self.player_health[idx] = 2
+        self.guard_cells[idx] = random_guard_cells(self.rng, self.guard_candidates, len(idx), self.num_guards)
+        self._index_guards(idx)
+
+    def set_state(self, idx, player_cell, player_health, guard_cells):
+        """Overwrites the state of the envs at the given indices"""
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+        self.player_cell[idx] = player_cell
+        self.player_health[idx] = player_health
+        self.guard_cells[idx] = guard_cells
+        self._index_guards(idx)
+
+    def _guard_in_cell(self, cells):
+        """Index of the first guard in each player's cell (0 if none, else 1-based like G1..Gn)"""
+        if self.num_guards == 0:
+            return np.zeros(self.num_envs, dtype=np.int64)
+        query = np.arange(self.num_envs) * self.num_cells + cells
+        pos = np.minimum(np.searchsorted(self._guard_keys, query), len(self._guard_keys) - 1)
+        return np.where(self._guard_keys[pos] == query, self._guard_order[pos] + 1, 0)
+
+    def get_observation(self):
+        cells = self.player_cell
+        return {
+            'player_position': np.stack(np.divmod(cells, self.num_cols), axis=1),
+            'player_health': self.player_health.copy(),
+            'guard_in_cell': self._guard_in_cell(cells),
+        }
+
+    def reset(self, seed=None):
+        """Resets every env and returns the batched observation"""
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self._reset_envs(np.arange(self.num_envs))
+        return self.get_observation()
+
+    def step(self, actions):
+        """Performs one step in every env; returns (obs, rewards, dones, info)"""
+        actions = np.asarray(actions, dtype=np.int64)
+        u = self.rng.random(self.num_envs)
+        guard = self._guard_in_cell(self.player_cell)
+        new_cell, health, event = self.kernel.step_batch(self.player_cell, self.player_health, guard, actions, u)
+        outcome = EVENT_OUTCOMES[event]
+        rewards = np.where(outcome == OUTCOME_WON, self.rewards['combat_win'],
+                           np.where(outcome == OUTCOME_LOST, self.rewards['combat_loss'], 0)).astype(float)
+
+        self.player_cell = new_cell
+        self.player_health = health
+
+        # Terminal checks, goal first as in is_terminal()
+        goal = new_cell == self.goal_cell
+        defeat = ~goal & (health == 0)
+        rewards += goal * self.rewards['goal'] + defeat * self.rewards['defeat']
+        dones = goal | defeat
+
+        info = {'final_observation': self.get_observation(), 'reached_goal': goal, 'event': event}
+        if dones.any():
+            self._reset_envs(np.flatnonzero(dones))
+            obs = self.get_observation()
+        else:
+            obs = info['final_observation']
+        return obs, rewards, dones, info
+
+    def close(self):
+        """Performs cleanup"""
+        pass
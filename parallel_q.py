@@ -0,0 +1,196 @@
+import os
+import random
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from mdp_gym import CastleEscapeEnv
+from qtable import QTable
+from telemetry import Telemetry
+
+# Per-worker progress counters in shared memory, one float64 row per worker
+COUNTERS = ['episodes', 'steps', 'wins', 'return_sum', 'td_sum']
+
+
+class SharedQTable(QTable):
+    """QTable whose values, visits and known arrays live in multiprocessing.shared_memory.
+
+    The creating process owns the blocks (create=True) and must unlink() them; workers
+    attach to the same blocks by passing the names from spec().
+    """
+
+    def __init__(self, num_states=375, num_actions=6, names=None):
+        shapes = [((num_states, num_actions), np.float32), ((num_states, num_actions), np.int64),
+                  ((num_states,), np.bool_)]
+        self.blocks = []
+        arrays = []
+        for i, (shape, dtype) in enumerate(shapes):
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=names[i])
+            self.blocks.append(block)
+            array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            if names is None:
+                array.fill(0)
+            arrays.append(array)
+        self.values, self.visits, self.known = arrays
+
+    def spec(self):
+        """What a worker needs to attach: (num_states, num_actions, block names)"""
+        return self.num_states, self.num_actions, [block.name for block in self.blocks]
+
+    def to_qtable(self):
+        """A private copy as a plain QTable"""
+        table = QTable(self.num_states, self.num_actions)
+        table.values[:] = self.values
+        table.visits[:] = self.visits
+        table.known[:] = self.known
+        return table
+
+    def close(self):
+        # Drop the array views first; a block cannot be closed while they export its buffer
+        self.values = self.visits = self.known = None
+        for block in self.blocks:
+            block.close()
+
+    def unlink(self):
+        for block in self.blocks:
+            block.unlink()
+
+
+def _merge(shared, local, base_values, base_visits):
+    """Folds the updates local made since it was copied from shared (base_*) into shared.
+
+    With the 1 / (1 + visits) learning rate each Q-value is the mean of its targets, so the
+    sum of the new targets can be recovered exactly and added to the shared running mean.
+    """
+    new = local.visits - base_visits
+    touched = new > 0
+    n = shared.visits[touched]
+    d = new[touched]
+    base_n = base_visits[touched]
+    target_sums = local.values[touched].astype(np.float64) * (base_n + d) - base_values[touched] * base_n
+    shared.values[touched] = (shared.values[touched] * n + target_sums) / (n + d)
+    shared.visits[touched] = n + d
+    shared.known |= local.known
+
+
+def _worker(index, spec, counters_name, lock, num_episodes, seed, mode, sync_every, gamma, epsilon,
+            decay_rate, num_workers, env_kwargs):
+    shared = SharedQTable(spec[0], spec[1], names=spec[2])
+    counters_block = shared_memory.SharedMemory(name=counters_name)
+    counters = np.ndarray((num_workers, len(COUNTERS)), dtype=np.float64, buffer=counters_block.buf)[index]
+
+    env = CastleEscapeEnv(text_results=False, **env_kwargs)
+    env.seed(seed)
+    np.random.seed(seed % 2 ** 32)  # guard placement on reset
+    rng = random.Random(seed)
+    num_actions = len(env.actions)
+
+    if mode == 'merge':
+        table = shared.to_qtable()
+        base_values, base_visits = table.values.copy(), table.visits.copy()
+    else:
+        table = shared
+
+    # Every worker's episode stands for num_workers episodes of the serial schedule
+    decay = decay_rate ** num_workers
+    episodes = steps = wins = 0
+    return_sum = td_sum = 0.0
+    for episode in range(num_episodes):
+        env.reset()
+        state = env.state_code()
+        done = False
+        total_reward = 0
+        while not done:
+            if rng.random() < epsilon:
+                action = rng.randrange(num_actions)
+            else:
+                action = table.greedy(state)
+            next_state, reward, done = env.step_encoded(action)
+            td_sum += abs(table.td_update(state, action, reward, next_state, gamma))
+            total_reward += reward
+            steps += 1
+            state = next_state
+        episodes += 1
+        wins += env.is_terminal() == 'goal'
+        return_sum += total_reward
+        epsilon = max(epsilon * decay, 0.01)
+
+        if mode == 'merge' and ((episode + 1) % sync_every == 0 or episode + 1 == num_episodes):
+            with lock:
+                _merge(shared, table, base_values, base_visits)
+                table.values[:] = shared.values
+                table.visits[:] = shared.visits
+                table.known[:] = shared.known
+            base_values[:] = table.values
+            base_visits[:] = table.visits
+        if episodes % 64 == 0 or episode + 1 == num_episodes:
+            counters[:] = (episodes, steps, wins, return_sum, td_sum)
+
+    del counters
+    counters_block.close()
+    shared.close()
+
+
+def parallel_Q_learning(num_episodes=1000000, num_workers=None, mode='hogwild', sync_every=500, gamma=0.9,
+                        epsilon=1.0, decay_rate=0.999999, seed=None, env=None, telemetry=None):
+    """Q-learning with num_workers processes sharing one Q-table; returns a QTable.
+
+    Each worker runs its share of the episodes on its own seeded CastleEscapeEnv with the same
+    update rule as Q_learning(). mode='hogwild' applies every update straight to the shared
+    table without locking. mode='merge' lets each worker learn on a private copy and fold its
+    updates into the shared table every sync_every episodes under a lock. env only supplies the
+    castle layout (grid, guards, goal room) for the workers' environments. Progress from all
+    workers is reported to telemetry as in Q_learning().
+    """
+    if mode not in ('hogwild', 'merge'):
+        raise ValueError(f"unknown mode {mode!r}; use 'hogwild' or 'merge'")
+    num_workers = num_workers or os.cpu_count() or 1
+    env = env if env is not None else CastleEscapeEnv(text_results=False)
+    env_kwargs = {'grid_size': env.grid_size, 'guards': env.guards, 'goal_room': env.goal_room}
+    seeds = np.random.SeedSequence(seed).generate_state(num_workers, dtype=np.uint64).tolist()
+    shares = [num_episodes // num_workers + (i < num_episodes % num_workers) for i in range(num_workers)]
+    own_telemetry = telemetry is None
+    if own_telemetry:
+        telemetry = Telemetry()
+
+    shared = SharedQTable(env.num_states, len(env.actions))
+    counters_block = shared_memory.SharedMemory(create=True, size=num_workers * len(COUNTERS) * 8)
+    counters = np.ndarray((num_workers, len(COUNTERS)), dtype=np.float64, buffer=counters_block.buf)
+    counters.fill(0)
+    lock = mp.Lock()
+    try:
+        workers = [mp.Process(target=_worker, name=f"castle-q-{i}",
+                              args=(i, shared.spec(), counters_block.name, lock, shares[i], seeds[i], mode,
+                                    sync_every, gamma, epsilon, decay_rate, num_workers, env_kwargs))
+                   for i in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        # Forward the workers' counters to telemetry until the last one exits
+        reported = np.zeros(len(COUNTERS))
+        running = list(workers)
+        while running:
+            wait([worker.sentinel for worker in running], timeout=0.5)
+            running = [worker for worker in running if worker.is_alive()]
+            totals = counters.sum(axis=0)
+            episodes, steps, wins, return_sum, td_sum = (totals - reported).tolist()
+            if episodes:
+                telemetry.record_totals(int(episodes), int(steps), int(wins), return_sum, td_sum,
+                                        max(epsilon * decay_rate ** totals[0], 0.01))
+            reported = totals
+        for worker in workers:
+            worker.join()
+            if worker.exitcode != 0:
+                raise RuntimeError(f"{worker.name} exited with code {worker.exitcode}")
+        return shared.to_qtable()
+    finally:
+        del counters
+        counters_block.close()
+        counters_block.unlink()
+        shared.close()
+        shared.unlink()
+        if own_telemetry:
+            telemetry.close()
@@ -0,0 +1,137 @@
+import time
+import pickle
+import numpy as np
+from mdp_gym import CastleEscapeEnv
+
+
+def sample_layouts(env, num_layouts, seed=None):
+    """Random guard layouts drawn like CastleEscapeEnv.reset(); every layout if there are few enough"""
+    try:
+        return env.guard_layouts(max_layouts=num_layouts)
+    except ValueError:
+        pass
+    rng = np.random.default_rng(seed)
+    candidates = np.array(env.guard_candidates)
+    keys = rng.random((num_layouts, len(candidates)))
+    return candidates[np.argsort(keys, axis=1)[:, :len(env.guard_names)]]
+
+
+def _sweep_blocks(model, num_blocks):
+    """Gauss-Seidel blocks of non-terminal states, ordered from the goal outwards"""
+    cell = (np.arange(model.num_states) // 3) % model.num_cells
+    # Cells closer to the goal come first so values propagate back towards the start in one sweep
+    order = np.argsort(model.goal_distance[cell], kind='stable')
+    order = order[~model.terminal[order]]
+    return [b for b in np.array_split(order, num_blocks) if len(b)]
+
+
+def q_values(model, V, gamma):
+    """Q[s, a] = R[a][s] + gamma * sum_s' P[a][s, s'] V[s']"""
+    return np.stack([model.R[a] + gamma * (model.P[a] @ V) for a in range(model.num_actions)], axis=1)
+
+
+def value_iteration(model, gamma=0.9, tol=1e-6, max_iterations=10000, method='gauss-seidel', num_blocks=16):
+    """Solves the model with Bellman backups as sparse matrix-vector products.
+
+    method='jacobi' backs up every state from the previous sweep's values; 'gauss-seidel'
+    updates blocks of states in place, goal side first. Returns (V, Q, stats).
+    """
+    from scipy import sparse
+
+    start = time.perf_counter()
+    blocks = _sweep_blocks(model, 1 if method == 'jacobi' else num_blocks)
+    P_all = sparse.vstack(model.P, format='csr')
+    R_all = np.concatenate(model.R)
+    # Pre-slice the rows of every action for each block
+    block_rows = []
+    for b in blocks:
+        rows = (np.arange(model.num_actions)[:, None] * model.num_states + b).reshape(-1)
+        block_rows.append((b, P_all[rows], R_all[rows]))
+
+    V = np.zeros(model.num_states)
+    residual = np.inf
+    iterations = 0
+    while residual > tol and iterations < max_iterations:
+        residual = 0.0
+        V_old = V.copy() if method == 'jacobi' else V
+        for b, P_b, R_b in block_rows:
+            new = (R_b + gamma * (P_b @ V_old)).reshape(model.num_actions, -1).max(axis=0)
+            residual = max(residual, np.abs(new - V[b]).max())
+            V[b] = new
+        iterations += 1
+
+    stats = {'iterations': iterations, 'wall_time': time.perf_counter() - start,
+             'residual': float(residual), 'num_states': model.num_states}
+    return V, q_values(model, V, gamma), stats
+
+
+def policy_iteration(model, gamma=0.9, max_iterations=100):
+    """Howard's policy iteration with exact sparse policy evaluation. Returns (V, Q, stats)."""
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve
+
+    start = time.perf_counter()
+    P_all = sparse.vstack(model.P, format='csr')
+    R_all = np.concatenate(model.R)
+    states = np.arange(model.num_states)
+    identity = sparse.identity(model.num_states, format='csr')
+
+    policy = np.zeros(model.num_states, dtype=np.int64)
+    V = np.zeros(model.num_states)
+    iterations = 0
+    while iterations < max_iterations:
+        rows = policy * model.num_states + states
+        V = spsolve((identity - gamma * P_all[rows]).tocsc(), R_all[rows])
+        Q = q_values(model, V, gamma)
+        iterations += 1
+        # Keep the current action on ties so the loop terminates
+        best = Q.argmax(axis=1)
+        improved = Q[states, best] > Q[states, policy] + 1e-9
+        if not improved.any():
+            break
+        policy = np.where(improved, best, policy)
+
+    Q = q_values(model, V, gamma)
+    stats = {'iterations': iterations, 'wall_time': time.perf_counter() - start,
+             'residual': float(np.abs(Q.max(axis=1) - V).max()), 'num_states': model.num_states}
+    return V, Q, stats
+
+
+def observation_q_table(model, Q):
+    """Averages Q over guard layouts into the observation-code layout test_agent() loads.
+
+    This is the QMDP approximation: the agent does not see where the guards are, so each
+    observation's Q-values are the mean over all layouts consistent with it.
+    """
+    num_codes = model.obs_codes.max() + 1
+    totals = np.zeros((num_codes, model.num_actions))
+    np.add.at(totals, model.obs_codes, Q)
+    counts = np.bincount(model.obs_codes, minlength=num_codes)
+    return {int(code): totals[code] / counts[code] for code in np.flatnonzero(counts)}
+
+
+def plan(env=None, num_layouts=2000, gamma=0.9, tol=1e-6, method='gauss-seidel', seed=0, verbose=True):
+    """Builds the model for a sample of guard layouts, solves it and returns (Q_table, stats)"""
+    if env is None:
+        env = CastleEscapeEnv()
+    start = time.perf_counter()
+    model = env.transition_model(sample_layouts(env, num_layouts, seed))
+    build_time = time.perf_counter() - start
+
+    if method == 'policy':
+        _, Q, stats = policy_iteration(model, gamma=gamma)
+    else:
+        _, Q, stats = value_iteration(model, gamma=gamma, tol=tol, method=method)
+    stats['build_time'] = build_time
+
+    if verbose:
+        print(f"{method}: {stats['num_states']} states, {stats['iterations']} iterations, "
+              f"{stats['wall_time']:.2f}s (model {build_time:.2f}s), residual {stats['residual']:.2e}")
+    return observation_q_table(model, Q), stats
+
+
+if __name__ == "__main__":
+    Q_table, stats = plan()
+    with open('planned_Q_table.pickle', 'wb') as handle:
+        pickle.dump(Q_table, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    print("Q-table saved to 'planned_Q_table.pickle'")
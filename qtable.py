@@ -0,0 +1,132 @@
+import pickle
+import numpy as np
+
+
+class QTable:
+    """Dense Q-values for integer state codes.
+
+    values is one contiguous (num_states, num_actions) float32 array, visits counts the updates
+    of each (state, action) pair and known marks the states seen so far. Indexing, `in`, get()
+    and len() behave like the {state: Q-values} dicts the training scripts used to build, and
+    load()/save() read and write both pickle formats: rows as NumPy arrays (Q_learning) or as
+    lists (Advanced_Q_learning).
+    """
+
+    def __init__(self, num_states=375, num_actions=6):
+        self.values = np.zeros((num_states, num_actions), dtype=np.float32)
+        self.visits = np.zeros((num_states, num_actions), dtype=np.int64)
+        self.known = np.zeros(num_states, dtype=bool)
+
+    @property
+    def num_states(self):
+        return self.values.shape[0]
+
+    @property
+    def num_actions(self):
+        return self.values.shape[1]
+
+    def __getitem__(self, state):
+        return self.values[state]
+
+    def __contains__(self, state):
+        return 0 <= state < self.num_states and bool(self.known[state])
+
+    def __len__(self):
+        return int(self.known.sum())
+
+    def get(self, state, default=None):
+        return self.values[state] if state in self else default
+
+    def states(self):
+        """Codes of the known states"""
+        return np.flatnonzero(self.known)
+
+    def greedy(self, states):
+        """Best action for a state code, or an array of best actions for an array of codes"""
+        if np.ndim(states) == 0:
+            return int(self.values[states].argmax())
+        return self.values[states].argmax(axis=1)
+
+    def best_values(self, states):
+        """max_a Q(s, a) for an array of state codes"""
+        return self.values[states].max(axis=1)
+
+    def td_update(self, state, action, reward, next_state, gamma, alpha=None):
+        """One Q-learning update towards reward + gamma * max_a Q(next_state, a); returns the TD error.
+
+        alpha=None uses the learning rate 1 / (1 + visits), making each Q-value the running mean
+        of its targets.
+        """
+        values = self.values
+        n = self.visits[state, action]
+        q = float(values[state, action])
+        error = reward + gamma * float(values[next_state].max()) - q
+        values[state, action] = q + (1.0 / (1 + n) if alpha is None else alpha) * error
+        self.visits[state, action] = n + 1
+        self.known[state] = self.known[next_state] = True
+        return error
+
+    def td_update_batch(self, states, actions, rewards, next_states, gamma, alpha=None, dones=None):
+        """Q-learning updates for a batch of transitions at once; returns the TD errors.
+
+        Targets use the values from before the batch. Repeated (state, action) pairs are applied
+        as that many updates towards the mean of their targets: exactly what sequential updates
+        give with alpha=None, and weight 1 - (1 - alpha) ** count otherwise. With dones given,
+        terminal transitions do not bootstrap.
+        """
+        states = np.asarray(states, dtype=np.int64)
+        next_states = np.asarray(next_states, dtype=np.int64)
+        flat = states * self.num_actions + np.asarray(actions, dtype=np.int64)
+        bootstrap = self.values[next_states].max(axis=1).astype(np.float64)
+        if dones is not None:
+            bootstrap[np.asarray(dones, dtype=bool)] = 0.0
+        targets = np.asarray(rewards, dtype=np.float64) + gamma * bootstrap
+        values = self.values.reshape(-1)
+        visits = self.visits.reshape(-1)
+        errors = targets - values[flat]
+
+        pairs, inverse, counts = np.unique(flat, return_inverse=True, return_counts=True)
+        target_sums = np.bincount(inverse, weights=targets, minlength=len(pairs))
+        q = values[pairs].astype(np.float64)
+        if alpha is None:
+            n = visits[pairs]
+            values[pairs] = (q * n + target_sums) / (n + counts)
+        else:
+            values[pairs] = q + (1 - (1 - alpha) ** counts) * (target_sums / counts - q)
+        visits[pairs] += counts
+        self.known[states] = True
+        self.known[next_states] = True
+        return errors
+
+    def to_dict(self, lists=False):
+        """{state: Q-values} for the known states, rows as float64 arrays or as lists"""
+        rows = self.values[self.known].astype(np.float64)
+        if lists:
+            rows = rows.tolist()
+        return dict(zip(self.states().tolist(), rows))
+
+    @classmethod
+    def from_dict(cls, table, num_states=None, num_actions=None):
+        """Builds a QTable from a {state: Q-values} dict with array or list rows"""
+        states = np.fromiter(table.keys(), dtype=np.int64, count=len(table))
+        rows = np.array(list(table.values()), dtype=np.float32).reshape(len(table), -1)
+        if num_states is None:
+            num_states = max(375, int(states.max()) + 1 if len(states) else 0)
+        q_table = cls(num_states, num_actions or (rows.shape[1] if len(table) else 6))
+        q_table.values[states] = rows
+        q_table.known[states] = True
+        return q_table
+
+    def save(self, path, lists=False):
+        """Pickles the table as a {state: Q-values} dict (lists=True for the advanced agent's format)"""
+        with open(path, 'wb') as handle:
+            pickle.dump(self.to_dict(lists), handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, num_states=None, num_actions=None):
+        """Loads a pickled {state: Q-values} dict (array or list rows) or a pickled QTable"""
+        with open(path, 'rb') as handle:
+            table = pickle.load(handle)
+        if isinstance(table, cls):
+            return table
+        return cls.from_dict(table, num_states, num_actions)
@@ -0,0 +1,249 @@
+import io
+import os
+import csv
+import json
+import time
+import pickle
+import random
+import hashlib
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from evaluation import evaluate
+
+# Default training length per agent
+DEFAULT_EPISODES = {'q': 20000, 'advanced': 2000}
+
+# Result columns after the trial id, agent, status and the swept parameters
+RESULT_FIELDS = ['episodes', 'win_rate', 'win_rate_low', 'win_rate_high', 'mean_return', 'wall_time']
+
+
+def grid_space(space):
+    """Every combination of a {name: [values]} space, as a list of dicts"""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_space(space, num_trials, seed=0):
+    """num_trials configurations sampled from space.
+
+    Each entry is a list of values to choose from, a (low, high) range sampled uniformly or a
+    (low, high, 'log') range sampled log-uniformly. The same seed gives the same trials, which
+    lets an interrupted sweep resume.
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(num_trials):
+        params = {}
+        for name, spec in space.items():
+            if isinstance(spec, tuple) and len(spec) == 3 and spec[2] == 'log':
+                params[name] = float(np.exp(rng.uniform(np.log(spec[0]), np.log(spec[1]))))
+            elif isinstance(spec, tuple):
+                params[name] = float(rng.uniform(spec[0], spec[1]))
+            else:
+                params[name] = spec[int(rng.integers(len(spec)))]
+        trials.append(params)
+    return trials
+
+
+def trial_id(agent, params, episodes, seed):
+    key = json.dumps([agent, params, episodes, seed], sort_keys=True)
+    return f"{agent}-{hashlib.sha1(key.encode()).hexdigest()[:10]}"
+
+
+def rung_budgets(episodes, rungs):
+    """Training lengths a trial is evaluated at: each fraction of episodes in rungs, then episodes"""
+    budgets = {max(1, int(episodes * fraction)) for fraction in rungs}
+    return sorted(budget for budget in budgets if budget < episodes) + [episodes]
+
+
+def promoted(rows, min_peers=3):
+    """Trial ids of one rung's result rows that train on to the next rung.
+
+    A trial is dropped only when the upper end of its win rate interval is below the median
+    win rate of the rung, so at most half of the trials are pruned and none on noise alone.
+    With min_peers or fewer other trials at the rung, every trial is promoted.
+    """
+    if len(rows) <= min_peers:
+        return {row['trial'] for row in rows}
+    median = np.median([float(row['win_rate']) for row in rows])
+    return {row['trial'] for row in rows if float(row['win_rate_high']) >= median}
+
+
+class _TrialTelemetry:
+    """Telemetry stand-in that keeps the exploration rate of the last episode, to resume from"""
+
+    def __init__(self):
+        self.epsilon = None
+
+    def record_episode(self, steps, total_reward, won, epsilon=None, td_error=0.0):
+        self.epsilon = epsilon
+
+    def close(self):
+        pass
+
+
+def _next_epsilon(agent, params, epsilon):
+    """Exploration rate after the decay the learner applies at the end of an episode"""
+    if agent == 'q':
+        return max(epsilon * params.get('decay_rate', 0.999999), 0.01)
+    return max(params.get('min_epsilon', 0.01), epsilon * params.get('epsilon_decay', 0.995))
+
+
+def load_checkpoint(path):
+    """A trial's checkpoint written by run_trial(), or None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as handle:
+        return pickle.load(handle)
+
+
+def run_trial(trial, agent, params, episodes, seed, eval_episodes, confidence, checkpoint_dir):
+    """Trains one configuration up to episodes in a pool worker and returns its result row.
+
+    The trial's checkpoint in checkpoint_dir (its QTable, exploration rate, wall time and every
+    random stream) is updated after training. A checkpoint from fewer episodes is resumed, so
+    only the remaining episodes are trained and the result is the same as one run of episodes.
+    """
+    if agent == 'q':
+        import Q_learning as script
+    else:
+        import Advanced_Q_learning as script
+    env = script.env
+    path = os.path.join(checkpoint_dir, f"{trial}.pickle")
+    checkpoint = load_checkpoint(path)
+    if checkpoint is not None and checkpoint['episodes'] < episodes:
+        np.random.set_state(checkpoint['numpy'])
+        random.setstate(checkpoint['random'])
+        env.restore_state(checkpoint['env'])
+        env.action_space.np_random.bit_generator.state = checkpoint['action_space']
+        start_episode, previous_time = checkpoint['episodes'], checkpoint['wall_time']
+        kwargs = {**params, 'Q_table': checkpoint['Q_table'],
+                  'epsilon': _next_epsilon(agent, params, checkpoint['epsilon'])}
+    else:
+        np.random.seed(seed)
+        random.seed(seed)
+        env.seed(seed)
+        env.action_space.seed(seed)
+        start_episode, previous_time, kwargs = 0, 0.0, params
+    telemetry = _TrialTelemetry()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if agent == 'q':
+            Q_table = script.Q_learning(num_episodes=episodes - start_episode, telemetry=telemetry, **kwargs)
+        else:
+            Q_table = script.Advanced_Q_learning(env, num_training_episodes=episodes - start_episode,
+                                                 telemetry=telemetry, **kwargs)
+    wall_time = previous_time + time.perf_counter() - start
+    with open(path + '.tmp', 'wb') as handle:
+        pickle.dump({'episodes': episodes, 'Q_table': Q_table, 'epsilon': telemetry.epsilon, 'wall_time': wall_time,
+                     'numpy': np.random.get_state(), 'random': random.getstate(),
+                     'env': env.clone_state(include_rng=True),
+                     'action_space': env.action_space.np_random.bit_generator.state}, handle)
+    os.replace(path + '.tmp', path)
+
+    stats = evaluate(Q_table, eval_episodes, seed + 1, confidence=confidence)
+    low, high = stats['win_rate_ci']
+    return {'trial': trial, 'agent': agent, 'status': 'evaluated', **params, 'episodes': episodes,
+            'win_rate': stats['win_rate'], 'win_rate_low': low, 'win_rate_high': high,
+            'mean_return': stats['mean_return'], 'wall_time': round(wall_time, 3)}
+
+
+def load_results(path):
+    """Rows of a results table written by run_sweep() (empty if it does not exist yet)"""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as handle:
+        return list(csv.DictReader(handle))
+
+
+def _write_results(path, fields, rows):
+    with open(path + '.tmp', 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(path + '.tmp', path)
+
+
+def run_sweep(agent, space, path, search='grid', num_trials=20, episodes=None, eval_episodes=1000, workers=None,
+              seed=0, rungs=(0.5,), confidence=0.95, min_peers=3, checkpoint_dir=None, verbose=True):
+    """Trains agent ('q' or 'advanced') once per configuration of space on a process pool.
+
+    space maps keyword arguments of Q_learning() / Advanced_Q_learning() to values: a grid
+    sweep tries every combination of value lists, a random sweep draws num_trials
+    configurations (see random_space).
+
+    Losing trials are dropped by successive halving: every trial first trains for each
+    fraction of episodes in rungs (by default half), and its greedy policy is scored with
+    evaluate() over eval_episodes. Trials whose win rate interval at the given confidence
+    lies entirely below the rung's median stop there (see promoted); the others train for
+    the full episodes, resuming from their checkpoint at the rung (see run_trial), so pruning
+    never trains an episode twice. Checkpoints go to checkpoint_dir (default: path without
+    its extension plus '-checkpoints'); a finished trial's one holds its trained QTable.
+
+    Every evaluation is appended to the CSV results table at path: one row per trial and
+    training length with status 'promoted', 'pruned' or 'done', the win rate with its
+    interval, the mean return and the training wall time so far. Evaluations already in the
+    table are skipped, so rerunning an interrupted sweep with the same arguments resumes it.
+    Returns all rows of the table.
+    """
+    if agent not in DEFAULT_EPISODES:
+        raise ValueError(f"unknown agent {agent!r}; use 'q' or 'advanced'")
+    episodes = episodes or DEFAULT_EPISODES[agent]
+    budgets = rung_budgets(episodes, rungs)
+    configs = grid_space(space) if search == 'grid' else random_space(space, num_trials, seed)
+    trials = {trial_id(agent, params, episodes, seed): params for params in configs}
+    names = list(space)
+    fields = ['trial', 'agent', 'status'] + names + RESULT_FIELDS
+    checkpoint_dir = checkpoint_dir or os.path.splitext(path)[0] + '-checkpoints'
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    rows = load_results(path)
+    results = {(row['trial'], int(row['episodes'])): row for row in rows}
+    if verbose:
+        done = sum((trial, episodes) in results for trial in trials)
+        print(f"{len(trials)} trials, {done} already finished in '{path}', "
+              f"evaluated at {', '.join(map(str, budgets))} episodes")
+    if not rows:
+        _write_results(path, fields, rows)
+
+    alive = list(trials)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for budget in budgets:
+            pending = [trial for trial in alive if (trial, budget) not in results]
+            futures = [pool.submit(run_trial, trial, agent, trials[trial], budget, seed, eval_episodes, confidence,
+                                   checkpoint_dir) for trial in pending]
+            try:
+                with open(path, 'a', newline='') as handle:
+                    writer = csv.DictWriter(handle, fieldnames=fields, extrasaction='ignore')
+                    for future in as_completed(futures):
+                        row = future.result()
+                        if budget == episodes:
+                            row['status'] = 'done'
+                        writer.writerow(row)
+                        handle.flush()
+                        rows.append(row)
+                        results[row['trial'], budget] = row
+                        if verbose:
+                            params = ", ".join(f"{name}={row[name]}" for name in names)
+                            print(f"{row['trial']} ({params}) after {budget} episodes: win rate "
+                                  f"{row['win_rate']:.3f} ({row['win_rate_low']:.3f}-{row['win_rate_high']:.3f}), "
+                                  f"mean return {row['mean_return']:.1f}, {row['wall_time']:.1f}s")
+            except BaseException:
+                # Finished rows are already on disk; drop the queued trials and let the caller see the error
+                for future in futures:
+                    future.cancel()
+                raise
+            if budget == episodes:
+                break
+
+            rung = [results[trial, budget] for trial in alive]
+            survivors = promoted(rung, min_peers)
+            for row in rung:
+                row['status'] = 'promoted' if row['trial'] in survivors else 'pruned'
+            _write_results(path, fields, rows)
+            if verbose:
+                print(f"After {budget} episodes: {len(survivors)} of {len(rung)} trials go on to the next rung")
+            alive = [trial for trial in alive if trial in survivors]
+    return rows
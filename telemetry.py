@@ -0,0 +1,139 @@
+import csv
+import json
+import time
+import threading
+import numpy as np
+
+# Columns of every flushed row, in CSV order
+FIELDS = ['time', 'episodes', 'steps', 'episodes_per_sec', 'steps_per_sec', 'win_rate', 'mean_return',
+          'mean_length', 'p50_length', 'p90_length', 'max_length', 'epsilon', 'mean_abs_td']
+
+
+class Telemetry:
+    """Training metrics sink.
+
+    Learners call record_episode() once per episode with totals they kept in local variables,
+    which only appends to in-memory counters. A background thread turns the counters of each
+    interval into a row (episodes/s, steps/s, win rate, mean return, episode lengths, epsilon
+    and mean |TD error|), appends it to history, writes it to path (.csv or JSON lines) and,
+    with echo on, prints a progress line. close() flushes the last partial interval.
+    """
+
+    def __init__(self, path=None, interval=5.0, echo=True):
+        self.path = path
+        self.interval = interval
+        self.echo = echo
+        self.history = []
+        self.lock = threading.Lock()
+        self.start = self.last_flush = time.perf_counter()
+        self.total_episodes = 0
+        self.total_steps = 0
+        self._reset_window()
+
+        self.file = None
+        self.writer = None
+        if path:
+            self.file = open(path, 'w', newline='')
+            if path.lower().endswith('.csv'):
+                self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+                self.writer.writeheader()
+
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="castle-telemetry", daemon=True)
+        self.thread.start()
+
+    def _reset_window(self):
+        self.episodes = 0
+        self.steps = 0
+        self.wins = 0
+        self.return_sum = 0.0
+        self.td_sum = 0.0
+        self.lengths = []
+        self.epsilon = None
+
+    def record_episode(self, steps, total_reward, won, epsilon=None, td_error=0.0):
+        """Adds one finished episode; td_error is the sum of |TD error| over its steps"""
+        with self.lock:
+            self.episodes += 1
+            self.steps += steps
+            self.wins += won
+            self.return_sum += total_reward
+            self.td_sum += td_error
+            self.lengths.append(steps)
+            self.epsilon = epsilon
+
+    def record_totals(self, episodes, steps, wins, return_sum, td_error=0.0, epsilon=None):
+        """Adds counts already summed over several episodes (episode length percentiles then only
+        cover episodes reported by record_episode())"""
+        with self.lock:
+            self.episodes += episodes
+            self.steps += steps
+            self.wins += wins
+            self.return_sum += return_sum
+            self.td_sum += td_error
+            self.epsilon = epsilon
+
+    def _run(self):
+        while not self.closed.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Turns the counters gathered since the last flush into a row; returns it (None if empty)"""
+        with self.lock:
+            now = time.perf_counter()
+            episodes, steps, wins = self.episodes, self.steps, self.wins
+            return_sum, td_sum, lengths, epsilon = self.return_sum, self.td_sum, self.lengths, self.epsilon
+            self._reset_window()
+            elapsed = max(now - self.last_flush, 1e-9)
+            self.last_flush = now
+            self.total_episodes += episodes
+            self.total_steps += steps
+            total_episodes, total_steps = self.total_episodes, self.total_steps
+        if not episodes:
+            return None
+        p50, p90 = np.percentile(lengths, [50, 90]).tolist() if lengths else (None, None)
+        row = {
+            'time': round(now - self.start, 3),
+            'episodes': total_episodes,
+            'steps': total_steps,
+            'episodes_per_sec': episodes / elapsed,
+            'steps_per_sec': steps / elapsed,
+            'win_rate': float(wins) / episodes,
+            'mean_return': float(return_sum) / episodes,
+            'mean_length': steps / episodes,
+            'p50_length': p50,
+            'p90_length': p90,
+            'max_length': max(lengths) if lengths else None,
+            'epsilon': float(epsilon) if epsilon is not None else None,
+            'mean_abs_td': float(td_sum) / steps if steps else 0.0,
+        }
+        self.history.append(row)
+        if self.file is not None:
+            if self.writer is not None:
+                self.writer.writerow(row)
+            else:
+                self.file.write(json.dumps(row) + '\n')
+            self.file.flush()
+        if self.echo:
+            epsilon_text = f", epsilon {epsilon:.4f}" if epsilon is not None else ""
+            print(f"[{row['time']:8.1f}s] episode {row['episodes']:,}: {row['episodes_per_sec']:,.0f} episodes/s, "
+                  f"{row['steps_per_sec']:,.0f} steps/s, win rate {row['win_rate']:.3f}, "
+                  f"mean return {row['mean_return']:.1f}, length {row['mean_length']:.1f}"
+                  f"{epsilon_text}, |TD| {row['mean_abs_td']:.3g}")
+        return row
+
+    def close(self):
+        """Stops the flush thread and writes the final partial interval"""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.thread.join()
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
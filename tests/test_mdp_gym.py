@@ -0,0 +1,63 @@
+import pytest
+from mdp_gym import CastleEscapeEnv, EVENT_FIGHT_LOST, EVENT_FIGHT_WON, EVENT_MASK
+
+
+def test_shrinking_the_grid_rebuilds_the_castle():
+    env = CastleEscapeEnv(grid_size=8)
+    env.state.player_cell = 60
+    env.grid_size = 5
+    env.reset()
+
+    assert env.goal_room == (4, 4)
+    assert env.goal_cell == 24
+    assert env.num_states == 375
+    assert env.state.player_cell == 0
+    assert all(0 < cell < 24 for cell in env.state.guard_cells)
+    assert env.observation_space['player_position'][0].n == 5
+    for action in range(len(env.actions)):
+        env.step(action)
+
+
+def test_grid_change_without_reset_restarts_the_player():
+    env = CastleEscapeEnv(grid_size=8)
+    env.state.player_cell = 63
+    env.grid_size = (3, 4)
+    env._check_kernel()
+
+    assert env.state.player_cell == 0
+    assert env.state.guard_cells == ()
+    assert env.goal_room == (2, 3)
+
+
+def test_guard_strength_change_keeps_the_layout():
+    env = CastleEscapeEnv()
+    cells = env.state.guard_cells
+    env.guards['G1']['strength'] = 0.5
+    env._check_kernel()
+    assert env.state.guard_cells == cells
+
+
+def test_guard_strength_change_applies_to_the_next_step():
+    env = CastleEscapeEnv(text_results=False)
+    fight = env.actions.index('FIGHT')
+    for strength, event in ((1.0, EVENT_FIGHT_LOST), (0.0, EVENT_FIGHT_WON), (1.0, EVENT_FIGHT_LOST)):
+        env.guards['G1']['strength'] = strength
+        env.state.player_cell, env.state.player_health = env.state.guard_cells[0], 2
+        _, _, _, info = env.step(fight)
+        assert info['event'] & EVENT_MASK == event
+        assert env.kernel.key[1][0] == strength
+
+
+def test_goal_change_applies_to_the_next_step():
+    env = CastleEscapeEnv(grid_size=(1, 4), guards={})
+    env.goal_room = (0, 1)
+    _, reward, done, _ = env.step(env.actions.index('RIGHT'))
+    assert env.goal_cell == 1
+    assert done == (env.state.player_cell == 1)
+
+
+def test_given_goal_outside_a_smaller_grid_is_rejected():
+    env = CastleEscapeEnv(grid_size=8, goal_room=(6, 6))
+    env.grid_size = 5
+    with pytest.raises(ValueError):
+        env.reset()
@@ -0,0 +1,51 @@
+import numpy as np
+
+from evaluation import wilson_interval
+from sweep import promoted, rung_budgets
+
+
+def _row(trial, wins, trials=1000):
+    low, high = wilson_interval(wins, trials)
+    return {'trial': trial, 'win_rate': wins / trials, 'win_rate_low': low, 'win_rate_high': high}
+
+
+def test_rung_budgets():
+    assert rung_budgets(2000, (0.5,)) == [1000, 2000]
+    assert rung_budgets(2000, (0.5, 0.25, 1.0)) == [500, 1000, 2000]
+    assert rung_budgets(1, (0.5,)) == [1]
+
+
+def test_noise_is_not_pruned():
+    # Win rates within a few points of each other are binomial noise at 1000 evaluation episodes
+    rows = [_row(f't{i}', wins) for i, wins in enumerate([480, 490, 500, 510, 520])]
+    assert promoted(rows) == {row['trial'] for row in rows}
+
+
+def test_clearly_losing_trial_is_pruned():
+    rows = [_row(f't{i}', wins) for i, wins in enumerate([300, 490, 500, 510, 520])]
+    assert promoted(rows) == {'t1', 't2', 't3', 't4'}
+
+
+def test_too_few_peers_promotes_all():
+    rows = [_row('t0', 100), _row('t1', 500), _row('t2', 900)]
+    assert promoted(rows) == {'t0', 't1', 't2'}
+
+
+def test_resumed_trial_matches_one_run(tmp_path):
+    from sweep import load_checkpoint, run_trial
+
+    params = {'alpha': 0.2, 'epsilon_decay': 0.9}
+    straight, resumed = tmp_path / 'straight', tmp_path / 'resumed'
+    straight.mkdir()
+    resumed.mkdir()
+    full = run_trial('t', 'advanced', params, 40, 0, 100, 0.95, str(straight))
+    half = run_trial('t', 'advanced', params, 20, 0, 100, 0.95, str(resumed))
+    rest = run_trial('t', 'advanced', params, 40, 0, 100, 0.95, str(resumed))
+
+    one, two = load_checkpoint(str(straight / 't.pickle')), load_checkpoint(str(resumed / 't.pickle'))
+    assert np.array_equal(one['Q_table'].values, two['Q_table'].values)
+    assert np.array_equal(one['Q_table'].visits, two['Q_table'].visits)
+    assert one['epsilon'] == two['epsilon']
+    assert rest['win_rate'] == full['win_rate']
+    # The wall time covers both segments
+    assert rest['wall_time'] >= half['wall_time']
@@ -0,0 +1,37 @@
+import numpy as np
+from trajectory import TrajectoryRecorder, load_transitions
+
+
+def _batch(states):
+    n = len(states)
+    return np.asarray(states), np.zeros(n), np.zeros(n), np.asarray(states) + 1, np.zeros(n, dtype=bool)
+
+
+def test_batch_crossing_a_chunk_boundary_spills_before_overwriting(tmp_path):
+    # capacity == chunk_size: the ring holds a single chunk
+    recorder = TrajectoryRecorder(capacity=4, spill_dir=str(tmp_path), chunk_size=4)
+    recorder.record_batch(*_batch([0, 1]))
+    recorder.record_batch(*_batch([2, 3, 4, 5]))
+    recorder.flush()
+
+    spilled = load_transitions(str(tmp_path))
+    assert spilled['state'].tolist() == [0, 1, 2, 3, 4, 5]
+    assert spilled['next_state'].tolist() == [1, 2, 3, 4, 5, 6]
+    assert recorder.arrays()['state'].tolist() == [2, 3, 4, 5]
+
+
+def test_mixed_single_and_batch_records_spill_in_order(tmp_path):
+    recorder = TrajectoryRecorder(capacity=8, spill_dir=str(tmp_path), chunk_size=4)
+    expected = []
+    state = 0
+    for size in [1, 3, 5, 0, 7, 2, 9, 1]:
+        if size == 1:
+            recorder.record(state, 0, 0.0, state + 1, False)
+        else:
+            recorder.record_batch(*_batch(list(range(state, state + size))))
+        expected += list(range(state, state + size))
+        state += size
+    recorder.flush()
+
+    assert load_transitions(str(tmp_path))['state'].tolist() == expected
+    assert recorder.arrays()['state'].tolist() == expected[-8:]
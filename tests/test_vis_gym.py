@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+pygame = pytest.importorskip('pygame')
+
+import vis_gym
+from mdp_gym import CastleEscapeEnv
+
+
+@pytest.fixture
+def window(monkeypatch):
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    vis_gym.setup(GUI=True)
+    yield vis_gym
+    # pygame stays initialised: the font and sprite caches outlive the window
+    vis_gym.window = vis_gym.screen = None
+    pygame.display.quit()
+
+
+def test_render_frame_leaves_the_window_alone(window):
+    game, canvas = window.game, window.window
+    layout = (canvas.width, canvas.height, canvas.cell_size)
+    other = CastleEscapeEnv(grid_size=(3, 4))
+    other.reset()
+
+    frame = window.render_frame(other, cell_size=32)
+    assert frame.shape == (32 * 3 + 280, 32 * 4, 3)
+    assert window.game is game
+    assert window.window is canvas and canvas.surface is pygame.display.get_surface()
+    assert (canvas.width, canvas.height, canvas.cell_size) == layout
+
+    # The window still draws its own game
+    game.reset()
+    window.refresh(*game.step(0), delay=0)
+    assert window.screen is canvas.surface
+
+
+def test_render_frame_without_a_display():
+    pygame.display.quit()
+    driver = os.environ.get('SDL_VIDEODRIVER')
+    env = CastleEscapeEnv()
+    env.reset()
+    frame = vis_gym.render_frame(env, size=(84, 84), console=False)
+    assert frame.shape == (84, 84, 3) and frame.dtype == np.uint8
+    assert not pygame.display.get_init()
+    assert os.environ.get('SDL_VIDEODRIVER') == driver
+    assert vis_gym.screen is None
+
+
+def test_unscaled_frame_views_the_canvas():
+    env = CastleEscapeEnv()
+    env.reset()
+    frame = vis_gym.render_frame(env, cell_size=32)
+    canvas = vis_gym.offscreen_canvases[(5, 5, 32)]
+    assert frame.shape == (canvas.height, canvas.width, 3)
+    assert frame.base is not None and canvas.surface.get_locked()
+    assert frame[0, 0].tolist() == list(canvas.surface.get_at((0, 0)))[:3]
+
+    # Holding the view does not stop the next frame from being drawn
+    held = frame
+    frame = vis_gym.render_frame(env, console=False, cell_size=32)
+    assert frame.shape == (canvas.game_area_height, canvas.width, 3)
+    assert held is not frame
@@ -0,0 +1,109 @@
+import os
+import glob
+import numpy as np
+
+# Fixed dtypes for the recorded fields (375 states fit in uint16, 6 actions in uint8)
+TRANSITION_DTYPES = {
+    'state': np.uint16,
+    'action': np.uint8,
+    'reward': np.float32,
+    'next_state': np.uint16,
+    'done': np.bool_,
+}
+
+
+class TrajectoryRecorder:
+    """Preallocated ring buffers for (state, action, reward, next_state, done) transitions.
+
+    Writes go straight into fixed-size NumPy arrays and wrap around once capacity is reached.
+    With spill_dir set, every completed chunk of chunk_size transitions is saved to disk as
+    an .npz file before it can be overwritten, so nothing is lost on long runs.
+    """
+
+    def __init__(self, capacity=1 << 20, spill_dir=None, chunk_size=None):
+        chunk_size = chunk_size or max(1, capacity // 4)
+        if capacity % chunk_size:
+            raise ValueError("capacity must be a multiple of chunk_size")
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        self.buffers = {name: np.zeros(capacity, dtype=dtype) for name, dtype in TRANSITION_DTYPES.items()}
+        # Direct references avoid a dict lookup per field in record()
+        self._state = self.buffers['state']
+        self._action = self.buffers['action']
+        self._reward = self.buffers['reward']
+        self._next_state = self.buffers['next_state']
+        self._done = self.buffers['done']
+        self.total = 0      # transitions recorded so far
+        self.spilled = 0    # transitions written to disk so far
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def record(self, state, action, reward, next_state, done):
+        """Stores one transition"""
+        i = self.total % self.capacity
+        self._state[i] = state
+        self._action[i] = action
+        self._reward[i] = reward
+        self._next_state[i] = next_state
+        self._done[i] = done
+        self.total += 1
+        if self.spill_dir and self.total % self.chunk_size == 0:
+            self._spill(self.total)
+
+    def record_batch(self, states, actions, rewards, next_states, dones):
+        """Stores a batch of transitions, e.g. one step of CastleEscapeVecEnv"""
+        n = len(states)
+        start = 0
+        while start < n:
+            # Write up to the next chunk boundary only, so a completed chunk is spilled before the
+            # ring wraps around onto it (this also keeps every write a contiguous slice)
+            end = min(n, start + self.chunk_size - self.total % self.chunk_size)
+            i = self.total % self.capacity
+            j = i + end - start
+            self._state[i:j] = states[start:end]
+            self._action[i:j] = actions[start:end]
+            self._reward[i:j] = rewards[start:end]
+            self._next_state[i:j] = next_states[start:end]
+            self._done[i:j] = dones[start:end]
+            self.total += end - start
+            if self.spill_dir and self.total % self.chunk_size == 0:
+                self._spill(self.total)
+            start = end
+
+    def _spill(self, end):
+        """Writes every unspilled transition before end to disk"""
+        while self.spilled < end:
+            start = self.spilled
+            stop = min(end, (start // self.chunk_size + 1) * self.chunk_size)
+            i, j = start % self.capacity, (stop - 1) % self.capacity + 1
+            # Files are named by their first transition so a flushed partial chunk and its remainder sort in order
+            path = os.path.join(self.spill_dir, f"chunk_{start:012d}.npz")
+            np.savez(path, **{name: buf[i:j] for name, buf in self.buffers.items()})
+            self.spilled = stop
+
+    def flush(self):
+        """Spills the partially filled last chunk (call at the end of training)"""
+        if self.spill_dir:
+            self._spill(self.total)
+
+    def arrays(self):
+        """The buffered transitions in recording order (oldest first), as a dict of arrays"""
+        if self.total <= self.capacity:
+            return {name: buf[:self.total] for name, buf in self.buffers.items()}
+        i = self.total % self.capacity
+        return {name: np.concatenate([buf[i:], buf[:i]]) for name, buf in self.buffers.items()}
+
+
+def load_transitions(spill_dir):
+    """Loads every chunk spilled to spill_dir back into one dict of arrays"""
+    parts = {}
+    for path in sorted(glob.glob(os.path.join(spill_dir, "chunk_*.npz"))):
+        with np.load(path) as data:
+            for name in TRANSITION_DTYPES:
+                parts.setdefault(name, []).append(data[name])
+    return {name: np.concatenate(parts[name]) if name in parts else np.zeros(0, dtype=dtype)
+            for name, dtype in TRANSITION_DTYPES.items()}
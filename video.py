@@ -0,0 +1,213 @@
+import shutil
+import subprocess
+import numpy as np
+import pygame
+
+# Fixed 6x7x6 colour cube (252 colours); index 255 is transparent in delta frames
+TRANSPARENT = 255
+
+
+def _channel_table(levels, stride):
+    return (np.round(np.arange(256) * (levels - 1) / 255) * stride).astype(np.uint8)
+
+
+_RED, _GREEN, _BLUE = _channel_table(6, 42), _channel_table(7, 6), _channel_table(6, 1)
+PALETTE = np.zeros((256, 3), dtype=np.uint8)
+PALETTE[:252] = [(r * 255 // 5, g * 255 // 6, b * 255 // 5) for r in range(6) for g in range(7) for b in range(6)]
+
+
+def quantize(frame):
+    """Palette indices for an (..., 3) uint8 RGB array"""
+    return _RED[frame[..., 0]] + _GREEN[frame[..., 1]] + _BLUE[frame[..., 2]]
+
+
+def lzw_encode(data, min_code_size=8):
+    """GIF variable-width LZW compression of a bytes object of palette indices"""
+    clear = 1 << min_code_size
+    end = clear + 1
+    out = bytearray()
+    width = min_code_size + 1
+    buffer, bits = clear, width  # every stream starts with a clear code
+    table = {}
+    next_code = end + 1
+
+    pixels = iter(data)
+    prefix = next(pixels)
+    for pixel in pixels:
+        key = prefix << 8 | pixel
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        buffer |= prefix << bits
+        bits += width
+        while bits >= 8:
+            out.append(buffer & 0xFF)
+            buffer >>= 8
+            bits -= 8
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            # Widen once the decoder, which adds each entry one code later, can see code 2**width
+            if next_code > 1 << width and width < 12:
+                width += 1
+        else:
+            # Table full: start over
+            buffer |= clear << bits
+            bits += width
+            table = {}
+            next_code = end + 1
+            width = min_code_size + 1
+        prefix = pixel
+
+    for code in (prefix, end):
+        buffer |= code << bits
+        bits += width
+    while bits > 0:
+        out.append(buffer & 0xFF)
+        buffer >>= 8
+        bits -= 8
+    return bytes(out)
+
+
+class GifWriter:
+    """Streaming animated GIF encoder.
+
+    Frames are quantized to a fixed palette and only the bounding box of the pixels that changed
+    since the previous frame is written, with unchanged pixels transparent. A frame identical to
+    the previous one only extends its display time. Memory use stays at about two frames however
+    long the recording is.
+    """
+
+    def __init__(self, path, fps=10):
+        self.file = open(path, 'wb')
+        self.frame_time = 1.0 / fps
+        self.previous = None
+        self.pending = None         # (left, top, indices) waiting for its display time
+        self.pending_time = 0.0
+        self.frames = 0
+
+    def write(self, frame):
+        """Adds a (height, width, 3) uint8 RGB frame"""
+        index = quantize(frame)
+        if self.previous is None:
+            self._write_header(index.shape[1], index.shape[0])
+            pending = (0, 0, index)
+        else:
+            if index.shape != self.previous.shape:
+                raise ValueError(f"frame size changed from {self.previous.shape} to {index.shape}")
+            changed = index != self.previous
+            if not changed.any():
+                self.pending_time += self.frame_time
+                return
+            rows = np.flatnonzero(changed.any(axis=1))
+            cols = np.flatnonzero(changed.any(axis=0))
+            top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            box = index[top:bottom, left:right].copy()
+            box[~changed[top:bottom, left:right]] = TRANSPARENT
+            pending = (int(left), int(top), box)
+        self._write_pending()
+        self.pending = pending
+        self.pending_time = self.frame_time
+        self.previous = index
+
+    def _write_header(self, width, height):
+        # Logical screen with a 256-entry global colour table, then loop forever
+        self.file.write(b'GIF89a' + np.array([width, height], '<u2').tobytes() + bytes((0xF7, 0, 0)))
+        self.file.write(PALETTE.tobytes())
+        self.file.write(b'\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+    def _write_pending(self):
+        if self.pending is None:
+            return
+        left, top, index = self.pending
+        height, width = index.shape
+        delay = max(2, round(self.pending_time * 100))  # centiseconds; browsers treat < 2 as 10
+        # Graphic control: keep the previous frame under this one, index 255 transparent
+        self.file.write(b'\x21\xF9\x04\x05' + np.array([delay], '<u2').tobytes() + bytes((TRANSPARENT, 0)))
+        self.file.write(b'\x2C' + np.array([left, top, width, height], '<u2').tobytes() + b'\x00')
+        data = lzw_encode(np.ascontiguousarray(index).tobytes())
+        self.file.write(b'\x08' + b''.join(bytes((len(data[i:i + 255]),)) + data[i:i + 255]
+                                           for i in range(0, len(data), 255)) + b'\x00')
+        self.frames += 1
+        self.pending = None
+
+    def close(self):
+        self._write_pending()
+        if self.previous is not None:
+            self.file.write(b'\x3B')
+        self.file.close()
+
+
+class FfmpegWriter:
+    """Pipes raw RGB frames to an ffmpeg process (any container/codec ffmpeg picks from the path)"""
+
+    def __init__(self, path, fps=10):
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError("ffmpeg was not found on PATH; record to a .gif file instead")
+        self.path = path
+        self.fps = fps
+        self.process = None
+        self.size = None
+        self.frames = 0
+
+    def write(self, frame):
+        """Adds a (height, width, 3) uint8 RGB frame"""
+        # yuv420p needs even dimensions
+        frame = frame[:frame.shape[0] & ~1, :frame.shape[1] & ~1]
+        if self.process is None:
+            self.size = (frame.shape[1], frame.shape[0])
+            self.process = subprocess.Popen(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                 '-s', f'{self.size[0]}x{self.size[1]}', '-r', str(self.fps), '-i', '-',
+                 '-pix_fmt', 'yuv420p', self.path], stdin=subprocess.PIPE)
+        self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+        self.frames += 1
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+class VideoRecorder:
+    """Streams drawn pygame frames to a .gif (built-in encoder) or any other file via ffmpeg.
+
+    add_frame() is called with the screen after each frame is drawn. Every skip-th frame is kept,
+    downscaled by scale and handed straight to the encoder, so nothing accumulates in memory.
+    """
+
+    def __init__(self, path, fps=10, scale=0.5, skip=1):
+        self.writer = GifWriter(path, fps) if path.lower().endswith('.gif') else FfmpegWriter(path, fps)
+        self.path = path
+        self.scale = scale
+        self.skip = max(1, skip)
+        self.seen = 0
+        self.target = None
+
+    def add_frame(self, surface):
+        self.seen += 1
+        if (self.seen - 1) % self.skip:
+            return
+        if self.scale != 1:
+            size = (max(1, round(surface.get_width() * self.scale)), max(1, round(surface.get_height() * self.scale)))
+            if self.target is None or self.target.get_size() != size:
+                self.target = pygame.Surface(size, 0, surface)
+            pygame.transform.smoothscale(surface, size, self.target)
+            surface = self.target
+        pixels = pygame.surfarray.pixels3d(surface)
+        self.writer.write(pixels.transpose(1, 0, 2))
+        del pixels  # unlock the surface before it is drawn to again
+
+    @property
+    def frames(self):
+        return self.writer.frames
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
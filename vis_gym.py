@@ -3,15 +3,10 @@ import sys
 import time
 import random
 import os
+import hashlib
+from collections import OrderedDict
 from mdp_gym import CastleEscapeEnv
 
-# Initialize dimensions
-WIDTH, HEIGHT = 1000, 840
-GRID_SIZE = 5
-CELL_SIZE = min(WIDTH // GRID_SIZE, 120)
-GAME_AREA_HEIGHT = CELL_SIZE * GRID_SIZE
-CONSOLE_HEIGHT = HEIGHT - GAME_AREA_HEIGHT
-
 # Enhanced color palette - rich medieval colors
 WHITE = (255, 255, 255)
 RED = (190, 30, 45)
@@ -28,34 +23,11 @@ TEXT_COLOR = (230, 220, 180)  # Parchment color for text
 GOLD = (212, 175, 55)
 PARCHMENT = (255, 252, 220)
 
-# Create directory for assets if it doesn't exist
-if not os.path.exists('assets'):
-    os.makedirs('assets')
-
-# Define file paths for images
-IMGFILEPATH = {
-    "stone_floor": "assets/stone_floor.png",
-    "goal_room": "assets/goal_room.png",
-    "player": "assets/player.png",
-    "guard": "assets/guard.png",
-    "wall_h": "assets/wall_h.png",
-    "wall_v": "assets/wall_v.png",
-    "health_full": "assets/health_full.png",
-    "health_injured": "assets/health_injured.png",
-    "health_critical": "assets/health_critical.png",
-    "victory": "assets/victory.png",
-    "defeat": "assets/defeat.png",
-    "background": "assets/background.png",
-    "scroll": "assets/scroll.png",
-    "health_bar": "assets/health_bar.png",
-    "controls_panel": "assets/controls_panel.png"
-}
-
-# Setup display
+# Setup display: window is the Canvas drawn in the pygame window and screen its surface
+window = None
 screen = None
 game_ended = False
 action_results = [None, None, None, None, None]
-fps = 60
 sleeptime = 0.1
 clock = None
 animation_frame = 0  # For animated elements
@@ -63,67 +35,108 @@ animation_frame = 0  # For animated elements
 # Initialize MDP game
 game = CastleEscapeEnv()
 
-# Load or create images with enhanced visuals
-def load_images():
-    images = {}
-    
+# Fonts are looked up once per (size, bold); rendered text surfaces are kept in an LRU cache
+# bounded by pixel memory, so repeated frames only render text that changed
+fonts = {}
+text_cache = OrderedDict()
+text_cache_bytes = 0
+TEXT_CACHE_MAX_BYTES = 4 * 1024 * 1024
+
+def get_font(size, bold=False):
+    font = fonts.get((size, bold))
+    if font is None:
+        try:
+            font = pygame.font.SysFont("medievalsharp", size, bold=bold)
+        except:
+            font = pygame.font.Font(None, size)
+            font.set_bold(bold)
+        fonts[(size, bold)] = font
+    return font
+
+def render_text(text, size, color, bold=False):
+    global text_cache_bytes
+    key = (text, size, color, bold)
+    surface = text_cache.get(key)
+    if surface is not None:
+        text_cache.move_to_end(key)
+        return surface
+
+    surface = get_font(size, bold).render(text, True, color)
+    text_cache[key] = surface
+    text_cache_bytes += surface.get_pitch() * surface.get_height()
+    # Evict the least recently used surfaces once over budget
+    while text_cache_bytes > TEXT_CACHE_MAX_BYTES and len(text_cache) > 1:
+        _, old = text_cache.popitem(last=False)
+        text_cache_bytes -= old.get_pitch() * old.get_height()
+    return surface
+
+# Sprite cache: generated sprites are saved once per layout and loaded from disk afterwards.
+# Bump SPRITE_VERSION whenever a make_* generator below changes so stale sprites are not reused.
+SPRITE_VERSION = 1
+SPRITE_CACHE_DIR = os.path.join("assets", "cache")
+
+# Sizes shared by several sprites
+def health_bar_size(canvas):
+    return min(100, canvas.width // 6), min(30, canvas.console_height // 8)
+
+def end_screen_size(canvas):
+    return min(400, canvas.width - 40), min(200, canvas.game_area_height // 2)
+
+def make_stone_floor(canvas):
     # Generate stone floor texture with more detail
-    floor = pygame.Surface((CELL_SIZE, CELL_SIZE))
+    floor = pygame.Surface((canvas.cell_size, canvas.cell_size))
     floor.fill(STONE_GRAY)
     
     # Add stone patterns
     for _ in range(15):
-        x, y = random.randint(0, CELL_SIZE-1), random.randint(0, CELL_SIZE-1)
+        x, y = random.randint(0, canvas.cell_size-1), random.randint(0, canvas.cell_size-1)
         size = random.randint(10, 20)
         color = (random.randint(110, 150), random.randint(110, 150), random.randint(110, 150))
         pygame.draw.rect(floor, color, (x, y, size, size))
     
     # Add cracks and details
     for _ in range(8):
-        start_x, start_y = random.randint(0, CELL_SIZE-1), random.randint(0, CELL_SIZE-1)
-        end_x, end_y = random.randint(0, CELL_SIZE-1), random.randint(0, CELL_SIZE-1)
+        start_x, start_y = random.randint(0, canvas.cell_size-1), random.randint(0, canvas.cell_size-1)
+        end_x, end_y = random.randint(0, canvas.cell_size-1), random.randint(0, canvas.cell_size-1)
         pygame.draw.line(floor, (80, 80, 80), (start_x, start_y), (end_x, end_y), 1)
     
-    pygame.image.save(floor, IMGFILEPATH["stone_floor"])
-    images["stone_floor"] = floor
-    
+    return floor
+
+def make_goal_room(canvas):
     # Generate goal room texture - treasure chamber
-    goal = pygame.Surface((CELL_SIZE, CELL_SIZE))
+    goal = pygame.Surface((canvas.cell_size, canvas.cell_size))
     
     # Golden gradient background
-    for y in range(CELL_SIZE):
+    for y in range(canvas.cell_size):
         gold_shade = (212, 175 - y//3, 55 - y//6)
-        pygame.draw.line(goal, gold_shade, (0, y), (CELL_SIZE, y))
+        pygame.draw.line(goal, gold_shade, (0, y), (canvas.cell_size, y))
     
     # Add gold coins/treasure
     for _ in range(20):
-        x, y = random.randint(5, CELL_SIZE-6), random.randint(5, CELL_SIZE-6)
+        x, y = random.randint(5, canvas.cell_size-6), random.randint(5, canvas.cell_size-6)
         size = random.randint(3, 7)
         pygame.draw.circle(goal, (255, 215, 0), (x, y), size)  # Gold coins
         pygame.draw.circle(goal, (255, 255, 220), (x-1, y-1), size//3)  # Shine effect
     
     # Add EXIT text with fancy styling
-    font_size = max(18, min(36, CELL_SIZE // 3))
-    try:
-        font = pygame.font.SysFont("medievalsharp", font_size, bold=True)
-    except:
-        font = pygame.font.Font(None, font_size)
+    font_size = max(18, min(36, canvas.cell_size // 3))
+    font = get_font(font_size, bold=True)
     
     # Create text with shadow for depth
     text_shadow = font.render("EXIT", True, (100, 70, 0))
     text = font.render("EXIT", True, (255, 255, 220))
     
     # Position text with shadow
-    goal.blit(text_shadow, (CELL_SIZE//2 - text.get_width()//2 + 2, 
-                          CELL_SIZE//2 - text.get_height()//2 + 2))
-    goal.blit(text, (CELL_SIZE//2 - text.get_width()//2, 
-                   CELL_SIZE//2 - text.get_height()//2))
-    
-    pygame.image.save(goal, IMGFILEPATH["goal_room"])
-    images["goal_room"] = goal
+    goal.blit(text_shadow, (canvas.cell_size//2 - text.get_width()//2 + 2, 
+                          canvas.cell_size//2 - text.get_height()//2 + 2))
+    goal.blit(text, (canvas.cell_size//2 - text.get_width()//2, 
+                   canvas.cell_size//2 - text.get_height()//2))
     
+    return goal
+
+def make_player(canvas):
     # Enhanced player sprite - knight with armor and sword
-    player_size = max(CELL_SIZE//2, 30)
+    player_size = max(canvas.cell_size//2, 30)
     player = pygame.Surface((player_size, player_size), pygame.SRCALPHA)
     
     # Body (armor)
@@ -192,11 +205,11 @@ def load_images():
                     (shield_x + shield_size//2, shield_y), 
                     max(2, shield_size//4))
     
-    pygame.image.save(player, IMGFILEPATH["player"])
-    images["player"] = player
-    
+    return player
+
+def make_guard(canvas):
     # Enhanced guard sprite - medieval guard with spear
-    guard_size = max(CELL_SIZE//2, 30)
+    guard_size = max(canvas.cell_size//2, 30)
     guard = pygame.Surface((guard_size, guard_size), pygame.SRCALPHA)
     
     # Body (armor)
@@ -241,18 +254,18 @@ def load_images():
         (guard_size - guard_size//4 + spear_length//2, guard_size//3 - spear_length//2 + guard_size//16)
     ])
     
-    pygame.image.save(guard, IMGFILEPATH["guard"])
-    images["guard"] = guard
-    
+    return guard
+
+def make_wall_h(canvas):
     # Enhanced horizontal wall texture - stone wall with mortar
-    wall_h = pygame.Surface((CELL_SIZE, max(6, CELL_SIZE//12)))
+    wall_h = pygame.Surface((canvas.cell_size, max(6, canvas.cell_size//12)))
     
     # Base color
     wall_h.fill(BROWN)
     
     # Stone texture
     stones_per_wall = 4
-    stone_width = CELL_SIZE // stones_per_wall
+    stone_width = canvas.cell_size // stones_per_wall
     wall_height = wall_h.get_height()
     
     for i in range(stones_per_wall):
@@ -266,18 +279,18 @@ def load_images():
                          stone_width - 2, wall_height),
                         border_radius=1)
     
-    pygame.image.save(wall_h, IMGFILEPATH["wall_h"])
-    images["wall_h"] = wall_h
-    
+    return wall_h
+
+def make_wall_v(canvas):
     # Enhanced vertical wall texture
-    wall_v = pygame.Surface((max(6, CELL_SIZE//12), CELL_SIZE))
+    wall_v = pygame.Surface((max(6, canvas.cell_size//12), canvas.cell_size))
     
     # Base color
     wall_v.fill(BROWN)
     
     # Stone texture
     stones_per_wall = 4
-    stone_height = CELL_SIZE // stones_per_wall
+    stone_height = canvas.cell_size // stones_per_wall
     wall_width = wall_v.get_width()
     
     for i in range(stones_per_wall):
@@ -291,12 +304,11 @@ def load_images():
                          wall_width, stone_height - 2),
                         border_radius=1)
     
-    pygame.image.save(wall_v, IMGFILEPATH["wall_v"])
-    images["wall_v"] = wall_v
-    
+    return wall_v
+
+def make_health_bar(canvas):
     # Fancy health indicators
-    health_height = min(30, CONSOLE_HEIGHT // 8)
-    health_width = min(100, WIDTH // 6)
+    health_width, health_height = health_bar_size(canvas)
     
     # Health bar background frame
     health_bar = pygame.Surface((health_width + 10, health_height + 10))
@@ -308,10 +320,11 @@ def load_images():
     pygame.draw.rect(health_bar, (30, 20, 10), 
                     (5, 5, health_width, health_height))
     
-    pygame.image.save(health_bar, IMGFILEPATH["health_bar"])
-    images["health_bar"] = health_bar
-    
+    return health_bar
+
+def make_health_full(canvas):
     # Full health - vibrant green with pulse effect
+    health_width, health_height = health_bar_size(canvas)
     health_full = pygame.Surface((health_width, health_height))
     for x in range(health_width):
         # Gradient
@@ -326,10 +339,12 @@ def load_images():
         y = health_height//2
         draw_heart(health_full, x, y, heart_size, (255, 255, 255))
     
-    pygame.image.save(health_full, IMGFILEPATH["health_full"])
-    images["health_full"] = health_full
-    
+    return health_full
+
+def make_health_injured(canvas):
     # Injured health - amber warning
+    health_width, health_height = health_bar_size(canvas)
+    heart_size = min(8, health_height // 3)
     health_injured = pygame.Surface((health_width, health_height))
     for x in range(health_width):
         # Gradient
@@ -343,10 +358,12 @@ def load_images():
         y = health_height//2
         draw_heart(health_injured, x, y, heart_size, (255, 255, 255))
     
-    pygame.image.save(health_injured, IMGFILEPATH["health_injured"])
-    images["health_injured"] = health_injured
-    
+    return health_injured
+
+def make_health_critical(canvas):
     # Critical health - alarming red pulse
+    health_width, health_height = health_bar_size(canvas)
+    heart_size = min(8, health_height // 3)
     health_critical = pygame.Surface((health_width, health_height))
     for x in range(health_width):
         # Gradient effect
@@ -359,12 +376,11 @@ def load_images():
     y = health_height//2
     draw_heart(health_critical, x, y, heart_size, (255, 255, 255))
     
-    pygame.image.save(health_critical, IMGFILEPATH["health_critical"])
-    images["health_critical"] = health_critical
-    
+    return health_critical
+
+def make_victory(canvas):
     # Enhanced victory screen
-    victory_width = min(400, WIDTH - 40)
-    victory_height = min(200, GAME_AREA_HEIGHT // 2)
+    victory_width, victory_height = end_screen_size(canvas)
     
     victory = pygame.Surface((victory_width, victory_height))
     
@@ -389,10 +405,7 @@ def load_images():
                         (x+2, y+2, corner_size-4, corner_size-4))
     
     # Victory text with medieval style
-    try:
-        font = pygame.font.SysFont("medievalsharp", 60, bold=True)
-    except:
-        font = pygame.font.Font(None, 60)
+    font = get_font(60, bold=True)
     
     # Text with shadow for depth
     text_shadow = font.render("VICTORY!", True, (100, 80, 0))
@@ -431,19 +444,17 @@ def load_images():
                     victory_height//2 - text.get_height()//2))
     
     # Add "FREEDOM ACHIEVED" subtitle
-    try:
-        subtitle_font = pygame.font.SysFont("medievalsharp", 24)
-    except:
-        subtitle_font = pygame.font.Font(None, 24)
+    subtitle_font = get_font(24)
     
     subtitle = subtitle_font.render("FREEDOM ACHIEVED", True, (255, 255, 220))
     victory.blit(subtitle, (victory_width//2 - subtitle.get_width()//2, 
                           victory_height - subtitle.get_height() - 20))
     
-    pygame.image.save(victory, IMGFILEPATH["victory"])
-    images["victory"] = victory
-    
+    return victory
+
+def make_defeat(canvas):
     # Enhanced defeat screen
+    victory_width, victory_height = end_screen_size(canvas)
     defeat = pygame.Surface((victory_width, victory_height))
     
     # Dark red background with smoke-like effect
@@ -470,10 +481,7 @@ def load_images():
         pygame.draw.line(defeat, (150, 150, 150), (x+4, y+4), (x+11, y+6), 2)
     
     # Defeat text with medieval style
-    try:
-        font = pygame.font.SysFont("medievalsharp", 60, bold=True)
-    except:
-        font = pygame.font.Font(None, 60)
+    font = get_font(60, bold=True)
     
     # Text with shadow for depth
     text_shadow = font.render("DEFEATED!", True, (20, 0, 0))
@@ -521,27 +529,24 @@ def load_images():
                     victory_height//2 - text.get_height()//2))
     
     # Add "THE DUNGEON CLAIMS ANOTHER" subtitle
-    try:
-        subtitle_font = pygame.font.SysFont("medievalsharp", 24)
-    except:
-        subtitle_font = pygame.font.Font(None, 24)
+    subtitle_font = get_font(24)
     
     subtitle = subtitle_font.render("THE DUNGEON CLAIMS ANOTHER", True, (200, 0, 0))
     defeat.blit(subtitle, (victory_width//2 - subtitle.get_width()//2, 
                           victory_height - subtitle.get_height() - 20))
     
-    pygame.image.save(defeat, IMGFILEPATH["defeat"])
-    images["defeat"] = defeat
-    
+    return defeat
+
+def make_background(canvas):
     # Create background with castle stone pattern
-    background = pygame.Surface((WIDTH, HEIGHT))
+    background = pygame.Surface((canvas.width, canvas.height))
     
     # Fill with dark stone pattern
     background.fill(DARK_GRAY)
     
     # Add stone-like texture
     for _ in range(500):
-        x, y = random.randint(0, WIDTH-1), random.randint(0, HEIGHT-1)
+        x, y = random.randint(0, canvas.width-1), random.randint(0, canvas.height-1)
         size = random.randint(3, 8)
         color_var = random.randint(-20, 20)
         color = (min(255, max(0, 40 + color_var)), 
@@ -551,21 +556,19 @@ def load_images():
     
     # Add some cracks
     for _ in range(20):
-        start_x, start_y = random.randint(0, WIDTH-1), random.randint(0, HEIGHT-1)
+        start_x, start_y = random.randint(0, canvas.width-1), random.randint(0, canvas.height-1)
         length = random.randint(20, 100)
         angle = random.random() * 6.28
         end_x = start_x + int(length * math.cos(angle))
         end_y = start_y + int(length * math.sin(angle))
         pygame.draw.line(background, (30, 30, 30), (start_x, start_y), (end_x, end_y), 2)
     
-    pygame.image.save(background, IMGFILEPATH["background"])
-    images["background"] = background
-    
-    # Torch animation removed as requested
-    
+    return background
+
+def make_controls_panel(canvas):
     # Create fancy controls panel (stone tablet)
-    controls_width = WIDTH // 3
-    controls_height = CONSOLE_HEIGHT // 2
+    controls_width = canvas.width // 3
+    controls_height = canvas.console_height // 2
     
     controls_panel = pygame.Surface((controls_width, controls_height))
     
@@ -615,12 +618,12 @@ def load_images():
         end_y = y + int(length * math.sin(angle))
         pygame.draw.line(controls_panel, (80, 80, 70), (x, y), (end_x, end_y), 1)
     
-    pygame.image.save(controls_panel, IMGFILEPATH["controls_panel"])
-    images["controls_panel"] = controls_panel
-    
+    return controls_panel
+
+def make_scroll(canvas):
     # Create scroll for console
-    scroll_width = WIDTH - 20
-    scroll_height = CONSOLE_HEIGHT - 50
+    scroll_width = canvas.width - 20
+    scroll_height = canvas.console_height - 50
     
     scroll = pygame.Surface((scroll_width, scroll_height))
     
@@ -672,8 +675,69 @@ def load_images():
                      max(160, 205 - shadow_size*10))
         pygame.draw.line(scroll, left_color, (0, y), (shadow_size*2, y))
     
-    pygame.image.save(scroll, IMGFILEPATH["scroll"])
-    images["scroll"] = scroll
+    return scroll
+
+# Sprite name -> (generator, has per-pixel alpha)
+SPRITES = {
+    "stone_floor": (make_stone_floor, False),
+    "goal_room": (make_goal_room, False),
+    "player": (make_player, True),
+    "guard": (make_guard, True),
+    "wall_h": (make_wall_h, False),
+    "wall_v": (make_wall_v, False),
+    "health_bar": (make_health_bar, False),
+    "health_full": (make_health_full, False),
+    "health_injured": (make_health_injured, False),
+    "health_critical": (make_health_critical, False),
+    "victory": (make_victory, False),
+    "defeat": (make_defeat, False),
+    "background": (make_background, False),
+    "controls_panel": (make_controls_panel, False),
+    "scroll": (make_scroll, False),
+}
+
+def sprite_cache_dir(canvas):
+    """Cache directory addressed by the generator version and every dimension the sprites depend on"""
+    key = f"v{SPRITE_VERSION}:{canvas.cell_size}:{canvas.width}x{canvas.height}:{canvas.game_area_height}:{canvas.console_height}"
+    return os.path.join(SPRITE_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+# Load a canvas's images from the sprite cache, generating only the missing ones
+def load_images(canvas):
+    cache_dir = sprite_cache_dir(canvas)
+    os.makedirs(cache_dir, exist_ok=True)
+    # convert() needs a display mode, so only the window's sprites use it; an offscreen canvas
+    # gets copies in its own pixel format instead
+    on_display = canvas.surface is pygame.display.get_surface()
+    
+    images = {}
+    for name, (make, alpha) in SPRITES.items():
+        path = os.path.join(cache_dir, name + ".png")
+        image = None
+        if os.path.exists(path):
+            try:
+                image = pygame.image.load(path)
+            except pygame.error:
+                image = None  # Unreadable file, regenerate it
+        if image is None:
+            image = make(canvas)
+            # Save under a temporary name first so a concurrent launch never loads a half-written file
+            tmp_path = os.path.join(cache_dir, f"{name}.{os.getpid()}.tmp.png")
+            pygame.image.save(image, tmp_path)
+            os.replace(tmp_path, path)
+        
+        # Match the canvas's pixel format once here instead of on every blit
+        if on_display:
+            image = image.convert_alpha() if alpha else image.convert()
+        elif alpha:
+            converted = pygame.Surface(image.get_size(), pygame.SRCALPHA, canvas.surface)
+            pygame.surfarray.pixels3d(converted)[:] = pygame.surfarray.pixels3d(image)
+            pygame.surfarray.pixels_alpha(converted)[:] = pygame.surfarray.pixels_alpha(image)
+            image = converted
+        else:
+            converted = pygame.Surface(image.get_size(), 0, canvas.surface)
+            converted.blit(image, (0, 0))
+            image = converted
+        images[name] = image
     
     return images
 
@@ -694,9 +758,38 @@ def draw_heart(surface, x, y, size, color):
     ]
     pygame.draw.polygon(surface, color, points)
 
+# Smallest console that still fits the health bar and a few chronicle lines
+MIN_CONSOLE_HEIGHT = 200
+
+class Canvas:
+    """A surface showing a castle, with everything drawing on it needs.
+
+    The layout puts the game's grid of square cells of cell_size pixels above a console of
+    console_height. images are the sprites made for that layout, static_layer the parts of the
+    castle that never change, and dirty_rects, console_lines and force_redraw record what the
+    previous frame drew so the next one only redraws what changed. Without a surface, a plain
+    one is made for offscreen drawing; nothing here touches the display.
+    """
+
+    def __init__(self, game, cell_size, console_height, surface=None):
+        self.grid = (game.num_rows, game.num_cols)
+        self.cell_size = cell_size
+        self.width = cell_size * game.num_cols
+        self.game_area_height = cell_size * game.num_rows
+        self.console_height = console_height
+        self.height = self.game_area_height + console_height
+        self.surface = surface if surface is not None else pygame.Surface((self.width, self.height), 0, 32)
+        self.images = load_images(self)
+        self.static_layer = None
+        self.static_layer_key = None
+        self.dirty_rects = []      # regions drawn by the previous frame
+        self.console_lines = None  # console lines shown by the previous frame
+        self.force_redraw = True   # redraw and push the whole surface on the next frame
+        self.spare = None          # render_frame()'s second surface, used while an array views the first
+
 # Initialize Pygame with enhanced setup
 def setup(GUI=True):
-    global screen, images, WIDTH, HEIGHT, CELL_SIZE, GAME_AREA_HEIGHT, CONSOLE_HEIGHT, clock
+    global window, screen, clock
     
     if GUI:
         pygame.init()
@@ -706,80 +799,97 @@ def setup(GUI=True):
         available_width = min(info.current_w - 50, 1024)  # Slightly larger max width
         available_height = min(info.current_h - 100, 900)
         
-        # Recalculate dimensions based on available space
-        CELL_SIZE = min(available_width // GRID_SIZE, 140)  # Slightly larger cells
-        WIDTH = CELL_SIZE * GRID_SIZE
-        GAME_AREA_HEIGHT = CELL_SIZE * GRID_SIZE
-        CONSOLE_HEIGHT = min(280, available_height - GAME_AREA_HEIGHT)  # Slightly larger console
-        HEIGHT = GAME_AREA_HEIGHT + CONSOLE_HEIGHT
+        # Recalculate dimensions based on available space, leaving room for the console below
+        cells_across = max(game.num_rows, game.num_cols)
+        cell_size = min(available_width // cells_across,
+                        (available_height - MIN_CONSOLE_HEIGHT) // cells_across, 140)  # Slightly larger cells
+        game_area_height = cell_size * game.num_rows
+        console_height = min(280, available_height - game_area_height)  # Slightly larger console
         
         # Set up display with a more descriptive title
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        screen = pygame.display.set_mode((cell_size * game.num_cols, game_area_height + console_height))
         pygame.display.set_caption("Castle Escape - Medieval Dungeon Adventure")
         
         # Set up clock for controlling game speed
         clock = pygame.time.Clock()
         
-        # Load all images
-        images = load_images()
+        # Lay out the window and load all images
+        window = Canvas(game, cell_size, console_height, screen)
         
         # Set custom icon if available
         try:
-            icon = images["player"]
+            icon = window.images["player"]
             pygame.display.set_icon(icon)
         except:
             pass
 
 # Map room to grid cell positions
-def position_to_grid(position):
+def position_to_grid(canvas, position):
     row, col = position
-    return col * CELL_SIZE, row * CELL_SIZE
+    return col * canvas.cell_size, row * canvas.cell_size
 
-    # Draw the castle rooms with improved atmosphere
-def draw_rooms():
+# Static castle layer: the floor, walls, console background and goal room, composited once per canvas
+def build_static_layer(canvas, goal_room):
+    layer = pygame.Surface((canvas.width, canvas.height), 0, canvas.surface)
+    
     # Draw stone background
-    screen.blit(images["background"], (0, 0))
+    layer.blit(canvas.images["background"], (0, 0))
     
     # Draw floor tiles
-    for x in range(0, WIDTH, CELL_SIZE):
-        for y in range(0, GAME_AREA_HEIGHT, CELL_SIZE):
-            screen.blit(images["stone_floor"], (x, y))
+    for x in range(0, canvas.width, canvas.cell_size):
+        for y in range(0, canvas.game_area_height, canvas.cell_size):
+            layer.blit(canvas.images["stone_floor"], (x, y))
     
     # Draw horizontal walls
-    for x in range(0, WIDTH, CELL_SIZE):
-        for y in range(0, GAME_AREA_HEIGHT, CELL_SIZE):
-            screen.blit(images["wall_h"], (x, y))
-            if y + CELL_SIZE < GAME_AREA_HEIGHT:
-                screen.blit(images["wall_h"], (x, y + CELL_SIZE - images["wall_h"].get_height()))
+    for x in range(0, canvas.width, canvas.cell_size):
+        for y in range(0, canvas.game_area_height, canvas.cell_size):
+            layer.blit(canvas.images["wall_h"], (x, y))
+            if y + canvas.cell_size < canvas.game_area_height:
+                layer.blit(canvas.images["wall_h"], (x, y + canvas.cell_size - canvas.images["wall_h"].get_height()))
     
     # Draw vertical walls
-    for y in range(0, GAME_AREA_HEIGHT, CELL_SIZE):
-        for x in range(0, WIDTH, CELL_SIZE):
-            screen.blit(images["wall_v"], (x, y))
-            if x + CELL_SIZE < WIDTH:
-                screen.blit(images["wall_v"], (x + CELL_SIZE - images["wall_v"].get_width(), y))
+    for y in range(0, canvas.game_area_height, canvas.cell_size):
+        for x in range(0, canvas.width, canvas.cell_size):
+            layer.blit(canvas.images["wall_v"], (x, y))
+            if x + canvas.cell_size < canvas.width:
+                layer.blit(canvas.images["wall_v"], (x + canvas.cell_size - canvas.images["wall_v"].get_width(), y))
     
     # Draw Console area with more texture and depth
-    console_rect = pygame.Rect(0, GAME_AREA_HEIGHT, WIDTH, CONSOLE_HEIGHT)
-    pygame.draw.rect(screen, CONSOLE_BG, console_rect)
+    console_rect = pygame.Rect(0, canvas.game_area_height, canvas.width, canvas.console_height)
+    pygame.draw.rect(layer, CONSOLE_BG, console_rect)
     
     # Draw decorative border for console
     border_width = 4
-    pygame.draw.rect(screen, (60, 40, 20), console_rect, border_width)
+    pygame.draw.rect(layer, (60, 40, 20), console_rect, border_width)
     
     # Add stone accents at console corners
     corner_size = 15
-    for x, y in [(0, GAME_AREA_HEIGHT), 
-                 (WIDTH - corner_size, GAME_AREA_HEIGHT),
-                 (0, HEIGHT - corner_size),
-                 (WIDTH - corner_size, HEIGHT - corner_size)]:
-        pygame.draw.rect(screen, (80, 60, 40), (x, y, corner_size, corner_size))
-        pygame.draw.rect(screen, (100, 80, 60), (x+2, y+2, corner_size-4, corner_size-4))
+    for x, y in [(0, canvas.game_area_height), 
+                 (canvas.width - corner_size, canvas.game_area_height),
+                 (0, canvas.height - corner_size),
+                 (canvas.width - corner_size, canvas.height - corner_size)]:
+        pygame.draw.rect(layer, (80, 60, 40), (x, y, corner_size, corner_size))
+        pygame.draw.rect(layer, (100, 80, 60), (x+2, y+2, corner_size-4, corner_size-4))
+    
+    # Goal room base image (the sparkles are animated and drawn per frame)
+    x, y = position_to_grid(canvas, goal_room)
+    layer.blit(canvas.images["goal_room"], (x, y))
+    
+    return layer
+
+# Rebuild the static layer only when the goal room or the sprites change; returns True if it was rebuilt
+def update_static_layer(canvas, goal_room):
+    key = (goal_room, id(canvas.images))
+    if key == canvas.static_layer_key:
+        return False
+    canvas.static_layer = build_static_layer(canvas, goal_room)
+    canvas.static_layer_key = key
+    return True
 
 # Draw the goal room with treasure effects
-def draw_goal_room():
-    x, y = position_to_grid(game.goal_room)
-    screen.blit(images["goal_room"], (x, y))
+def draw_goal_room(canvas, goal_room):
+    # The room itself is part of the static layer
+    x, y = position_to_grid(canvas, goal_room)
     
     # Add animated sparkle effects
     global animation_frame
@@ -787,114 +897,110 @@ def draw_goal_room():
     
     for i in range(sparkle_count):
         # Calculate position with slight movement
-        sparkle_x = x + CELL_SIZE//2 + int(10 * math.cos((animation_frame + i*20) * 0.1))
-        sparkle_y = y + CELL_SIZE//2 + int(10 * math.sin((animation_frame + i*20) * 0.1))
+        sparkle_x = x + canvas.cell_size//2 + int(10 * math.cos((animation_frame + i*20) * 0.1))
+        sparkle_y = y + canvas.cell_size//2 + int(10 * math.sin((animation_frame + i*20) * 0.1))
         
         # Calculate size that pulses
         sparkle_size = 2 + int(2 * math.sin(animation_frame * 0.2 + i))
         
         # Draw sparkle
-        pygame.draw.circle(screen, (255, 255, 200), (sparkle_x, sparkle_y), sparkle_size)
+        pygame.draw.circle(canvas.surface, (255, 255, 200), (sparkle_x, sparkle_y), sparkle_size)
 
 # Draw player at a given position with animation effects
-def draw_player(position):
-    x, y = position_to_grid(position)
-    player_img = images["player"]
+def draw_player(canvas, position):
+    x, y = position_to_grid(canvas, position)
+    player_img = canvas.images["player"]
     
     # Add slight hovering animation for player
     global animation_frame
     hover_offset = int(2 * math.sin(animation_frame * 0.1))
     
-    player_x = x + (CELL_SIZE - player_img.get_width()) // 2
-    player_y = y + (CELL_SIZE - player_img.get_height()) // 2 + hover_offset
+    player_x = x + (canvas.cell_size - player_img.get_width()) // 2
+    player_y = y + (canvas.cell_size - player_img.get_height()) // 2 + hover_offset
     
     # Draw a subtle shadow beneath the player
     shadow_radius = player_img.get_width() // 3
     shadow_y_offset = 5
-    pygame.draw.ellipse(screen, (0, 0, 0, 128), 
+    pygame.draw.ellipse(canvas.surface, (0, 0, 0, 128), 
                       (player_x + (player_img.get_width() - shadow_radius)//2, 
                        player_y + player_img.get_height() - shadow_y_offset, 
                        shadow_radius, shadow_radius//2))
     
-    screen.blit(player_img, (player_x, player_y))
+    canvas.surface.blit(player_img, (player_x, player_y))
 
 # Draw guards at their positions with animation
-def draw_guards(guard_positions):
+def draw_guards(canvas, guard_positions):
     global animation_frame
     
     for guard, position in guard_positions.items():
-        x, y = position_to_grid(position)
-        guard_img = images["guard"]
+        x, y = position_to_grid(canvas, position)
+        guard_img = canvas.images["guard"]
         
         # Add patrol animation - slight movement back and forth
         patrol_offset = int(3 * math.sin(animation_frame * 0.05))
         
-        guard_x = x + (CELL_SIZE - guard_img.get_width()) // 2 + patrol_offset
-        guard_y = y + (CELL_SIZE - guard_img.get_height()) // 2
+        guard_x = x + (canvas.cell_size - guard_img.get_width()) // 2 + patrol_offset
+        guard_y = y + (canvas.cell_size - guard_img.get_height()) // 2
         
         # Draw guard shadow
         shadow_radius = guard_img.get_width() // 3
         shadow_y_offset = 5
-        pygame.draw.ellipse(screen, (0, 0, 0, 128), 
+        pygame.draw.ellipse(canvas.surface, (0, 0, 0, 128), 
                           (guard_x + (guard_img.get_width() - shadow_radius)//2, 
                            guard_y + guard_img.get_height() - shadow_y_offset, 
                            shadow_radius, shadow_radius//2))
         
-        screen.blit(guard_img, (guard_x, guard_y))
+        canvas.surface.blit(guard_img, (guard_x, guard_y))
         
         # Label the guard with improved styling
-        font_size = max(14, min(24, CELL_SIZE // 5))
-        try:
-            font = pygame.font.SysFont("medievalsharp", font_size)
-        except:
-            font = pygame.font.Font(None, font_size)
+        font_size = max(14, min(24, canvas.cell_size // 5))
         
         # Add a background for the label
-        label = font.render(guard, True, WHITE)
+        label = render_text(guard, font_size, WHITE)
         label_bg = pygame.Rect(
-            x + CELL_SIZE - label.get_width() - 10, 
+            x + canvas.cell_size - label.get_width() - 10, 
             y + 5,
             label.get_width() + 6,
             label.get_height() + 2
         )
-        pygame.draw.rect(screen, (80, 0, 0), label_bg)
-        pygame.draw.rect(screen, (120, 0, 0), label_bg, 1)
+        pygame.draw.rect(canvas.surface, (80, 0, 0), label_bg)
+        pygame.draw.rect(canvas.surface, (120, 0, 0), label_bg, 1)
         
-        screen.blit(label, (x + CELL_SIZE - label.get_width() - 7, y + 6))
+        canvas.surface.blit(label, (x + canvas.cell_size - label.get_width() - 7, y + 6))
 
 # Draw player and guard together with improved conflict visualization
-def draw_player_and_guard_together(position, guard_positions):
+def draw_player_and_guard_together(canvas, position, guard_positions):
     guards_in_room = [guard for guard, pos in guard_positions.items() if pos == position]
     guards_not_in_room = [guard for guard in guard_positions if guard not in guards_in_room]
     
     if guards_in_room:
-        x, y = position_to_grid(position)
-        player_img = images["player"]
-        guard_img = images["guard"]
+        x, y = position_to_grid(canvas, position)
+        player_img = canvas.images["player"]
+        guard_img = canvas.images["guard"]
         
         # Position player on the left third of the cell
-        player_x = x + CELL_SIZE // 6
-        player_y = y + (CELL_SIZE - player_img.get_height()) // 2
+        player_x = x + canvas.cell_size // 6
+        player_y = y + (canvas.cell_size - player_img.get_height()) // 2
         
         # Position guard on the right third of the cell
-        guard_x = x + 2 * CELL_SIZE // 3
-        guard_y = y + (CELL_SIZE - guard_img.get_height()) // 2
+        guard_x = x + 2 * canvas.cell_size // 3
+        guard_y = y + (canvas.cell_size - guard_img.get_height()) // 2
         
         # Draw battle effect background
         global animation_frame
         battle_intensity = abs(math.sin(animation_frame * 0.2))
         
         # Draw pulsing battle aura
-        aura_radius = int(CELL_SIZE * 0.4 * (0.8 + 0.2 * battle_intensity))
+        aura_radius = int(canvas.cell_size * 0.4 * (0.8 + 0.2 * battle_intensity))
         aura_alpha = int(100 + 50 * battle_intensity)
         
         # Create a surface for the battle aura with transparency
-        aura_surface = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
+        aura_surface = pygame.Surface((canvas.cell_size, canvas.cell_size), pygame.SRCALPHA)
         pygame.draw.circle(aura_surface, (255, 0, 0, aura_alpha), 
-                         (CELL_SIZE//2, CELL_SIZE//2), aura_radius)
+                         (canvas.cell_size//2, canvas.cell_size//2), aura_radius)
         
         # Draw the aura
-        screen.blit(aura_surface, (x, y))
+        canvas.surface.blit(aura_surface, (x, y))
         
         # Draw sword clash effect between them
         clash_x = (player_x + player_img.get_width() + guard_x) // 2
@@ -907,7 +1013,7 @@ def draw_player_and_guard_together(position, guard_positions):
             spark_x = clash_x + int(spark_dist * math.cos(spark_angle))
             spark_y = clash_y + int(spark_dist * math.sin(spark_angle))
             spark_size = random.randint(1, 3)
-            pygame.draw.circle(screen, (255, 255, 200), (spark_x, spark_y), spark_size)
+            pygame.draw.circle(canvas.surface, (255, 255, 200), (spark_x, spark_y), spark_size)
         
         # Draw clash "star"
         clash_size = 10 + int(5 * battle_intensity)
@@ -919,36 +1025,32 @@ def draw_player_and_guard_together(position, guard_positions):
                 clash_x + int(dist * math.cos(angle)),
                 clash_y + int(dist * math.sin(angle))
             ))
-        pygame.draw.polygon(screen, (255, 255, 100), clash_points)
+        pygame.draw.polygon(canvas.surface, (255, 255, 100), clash_points)
         
         # Draw shadows
         shadow_radius = player_img.get_width() // 3
         shadow_y_offset = 5
         
-        pygame.draw.ellipse(screen, (0, 0, 0, 128), 
+        pygame.draw.ellipse(canvas.surface, (0, 0, 0, 128), 
                           (player_x + (player_img.get_width() - shadow_radius)//2, 
                            player_y + player_img.get_height() - shadow_y_offset, 
                            shadow_radius, shadow_radius//2))
         
-        pygame.draw.ellipse(screen, (0, 0, 0, 128), 
+        pygame.draw.ellipse(canvas.surface, (0, 0, 0, 128), 
                           (guard_x + (guard_img.get_width() - shadow_radius)//2, 
                            guard_y + guard_img.get_height() - shadow_y_offset, 
                            shadow_radius, shadow_radius//2))
         
         # Draw the characters
-        screen.blit(player_img, (player_x, player_y))
-        screen.blit(guard_img, (guard_x, guard_y))
+        canvas.surface.blit(player_img, (player_x, player_y))
+        canvas.surface.blit(guard_img, (guard_x, guard_y))
         
         # Draw exclamation with animation
-        font_size = max(24, min(40, CELL_SIZE // 3))
-        try:
-            font = pygame.font.SysFont("medievalsharp", font_size, bold=True)
-        except:
-            font = pygame.font.Font(None, font_size)
+        font_size = max(24, min(40, canvas.cell_size // 3))
         
         # Animated warning symbol
         warning_y_offset = int(5 * math.sin(animation_frame * 0.2))
-        conflict = font.render("!", True, (255, 50, 50))
+        conflict = render_text("!", font_size, (255, 50, 50), bold=True)
         
         # Add a glow effect to the warning
         glow_surface = pygame.Surface((conflict.get_width()+10, conflict.get_height()+10), pygame.SRCALPHA)
@@ -956,55 +1058,51 @@ def draw_player_and_guard_together(position, guard_positions):
                          (glow_surface.get_width()//2, glow_surface.get_height()//2), 
                          glow_surface.get_width()//2)
         
-        screen.blit(glow_surface, 
-                  (x + CELL_SIZE//2 - glow_surface.get_width()//2, 
+        canvas.surface.blit(glow_surface, 
+                  (x + canvas.cell_size//2 - glow_surface.get_width()//2, 
                    y + 5 + warning_y_offset - 5))
         
-        screen.blit(conflict, 
-                  (x + CELL_SIZE//2 - conflict.get_width()//2, 
+        canvas.surface.blit(conflict, 
+                  (x + canvas.cell_size//2 - conflict.get_width()//2, 
                    y + 5 + warning_y_offset))
         
         # Label the guard
-        guard_label_font_size = max(14, min(24, CELL_SIZE // 5))
-        try:
-            guard_label_font = pygame.font.SysFont("medievalsharp", guard_label_font_size)
-        except:
-            guard_label_font = pygame.font.Font(None, guard_label_font_size)
+        guard_label_font_size = max(14, min(24, canvas.cell_size // 5))
         
         # Add a background for the label
-        label = guard_label_font.render(guards_in_room[0], True, WHITE)
+        label = render_text(guards_in_room[0], guard_label_font_size, WHITE)
         label_bg = pygame.Rect(
-            x + CELL_SIZE - label.get_width() - 10, 
+            x + canvas.cell_size - label.get_width() - 10, 
             y + 5,
             label.get_width() + 6,
             label.get_height() + 2
         )
-        pygame.draw.rect(screen, (80, 0, 0), label_bg)
-        pygame.draw.rect(screen, (120, 0, 0), label_bg, 1)
+        pygame.draw.rect(canvas.surface, (80, 0, 0), label_bg)
+        pygame.draw.rect(canvas.surface, (120, 0, 0), label_bg, 1)
         
-        screen.blit(label, (x + CELL_SIZE - label.get_width() - 7, y + 6))
+        canvas.surface.blit(label, (x + canvas.cell_size - label.get_width() - 7, y + 6))
 
     # Draw the guards that are not in the same room as player
     for guard in guards_not_in_room:
-        draw_guards({guard: guard_positions[guard]})
+        draw_guards(canvas, {guard: guard_positions[guard]})
 
 # Draw player health status with improved visuals
-def draw_health(health):
+def draw_health(canvas, game, health):
     health_str = game.int_to_health_state[health] if isinstance(health, int) else health
     
     # Calculate position for health bar
     health_x = 15
-    health_y = GAME_AREA_HEIGHT + 15
+    health_y = canvas.game_area_height + 15
     
     # Draw health bar frame
-    screen.blit(images["health_bar"], (health_x, health_y))
+    canvas.surface.blit(canvas.images["health_bar"], (health_x, health_y))
     
-    health_width = images["health_full"].get_width()
-    health_height = images["health_full"].get_height()
+    health_width = canvas.images["health_full"].get_width()
+    health_height = canvas.images["health_full"].get_height()
     
     # Draw appropriate health indicator
     if health_str == 'Full':
-        screen.blit(images["health_full"], (health_x + 5, health_y + 5))
+        canvas.surface.blit(canvas.images["health_full"], (health_x + 5, health_y + 5))
         
         # Add pulsing glow effect for full health
         glow_radius = 3 + int(math.sin(animation_frame * 0.1) * 2)
@@ -1012,10 +1110,10 @@ def draw_health(health):
         pygame.draw.rect(glow_surface, (0, 255, 0, 30), 
                        (0, 0, health_width+10, health_height+10), 
                        glow_radius)
-        screen.blit(glow_surface, (health_x, health_y))
+        canvas.surface.blit(glow_surface, (health_x, health_y))
         
     elif health_str == 'Injured':
-        screen.blit(images["health_injured"], (health_x + 5, health_y + 5))
+        canvas.surface.blit(canvas.images["health_injured"], (health_x + 5, health_y + 5))
         
         # Add warning glow effect for injured health
         if animation_frame % 30 < 15:  # Blink warning
@@ -1023,10 +1121,10 @@ def draw_health(health):
             pygame.draw.rect(glow_surface, (255, 150, 0, 30), 
                            (0, 0, health_width+10, health_height+10), 
                            2)
-            screen.blit(glow_surface, (health_x, health_y))
+            canvas.surface.blit(glow_surface, (health_x, health_y))
             
     else:  # Critical
-        screen.blit(images["health_critical"], (health_x + 5, health_y + 5))
+        canvas.surface.blit(canvas.images["health_critical"], (health_x + 5, health_y + 5))
         
         # Add alarm glow effect for critical health
         glow_intensity = abs(math.sin(animation_frame * 0.2)) * 50 + 30
@@ -1034,68 +1132,72 @@ def draw_health(health):
         pygame.draw.rect(glow_surface, (255, 0, 0, int(glow_intensity)), 
                        (0, 0, health_width+10, health_height+10), 
                        3)
-        screen.blit(glow_surface, (health_x, health_y))
+        canvas.surface.blit(glow_surface, (health_x, health_y))
     
     # Draw health text with improved styling
-    health_text_x = health_x + images["health_bar"].get_width() + 15
+    health_text_x = health_x + canvas.images["health_bar"].get_width() + 15
     health_text_y = health_y + 10
     
-    font_size = max(16, min(28, CONSOLE_HEIGHT // 8))
-    try:
-        font = pygame.font.SysFont("medievalsharp", font_size)
-    except:
-        font = pygame.font.Font(None, font_size)
+    font_size = max(16, min(28, canvas.console_height // 8))
     
     # Add text shadow for depth
     health_text = f"Health: {health_str}"
-    shadow = font.render(health_text, True, (40, 40, 40))
-    text = font.render(health_text, True, 
+    shadow = render_text(health_text, font_size, (40, 40, 40))
+    text = render_text(health_text, font_size, 
                     (220, 220, 180) if health_str == 'Full' else
                     (220, 180, 100) if health_str == 'Injured' else
                     (220, 100, 100))
     
-    screen.blit(shadow, (health_text_x + 2, health_text_y + 2))
-    screen.blit(text, (health_text_x, health_text_y))
+    canvas.surface.blit(shadow, (health_text_x + 2, health_text_y + 2))
+    canvas.surface.blit(text, (health_text_x, health_text_y))
 
 # Display Controls with medieval styling
-def display_controls():
+# Lines of the controls panel; replay() swaps in its own keys
+GAME_CONTROLS = [
+    ("Move:", (180, 160, 120)),
+    ("W - Up", TEXT_COLOR),
+    ("S - Down", TEXT_COLOR),
+    ("A - Left", TEXT_COLOR),
+    ("D - Right", TEXT_COLOR),
+    ("Actions:", (180, 160, 120)),
+    ("F - Fight", TEXT_COLOR),
+    ("H - Hide", TEXT_COLOR)
+]
+REPLAY_CONTROLS = [
+    ("Playback:", (180, 160, 120)),
+    ("Space - Pause", TEXT_COLOR),
+    ("Up/Down - Speed", TEXT_COLOR),
+    ("Left/Right - Step", TEXT_COLOR),
+    ("Seek:", (180, 160, 120)),
+    ("PgUp/PgDn - 10%", TEXT_COLOR),
+    ("Home/End - Ends", TEXT_COLOR),
+    ("N/P - Episode", TEXT_COLOR)
+]
+controls_help = GAME_CONTROLS
+
+def display_controls(canvas):
     # Calculate position for controls panel
-    controls_width = images["controls_panel"].get_width()
-    controls_height = images["controls_panel"].get_height()
-    controls_x = WIDTH - controls_width - 15
-    controls_y = GAME_AREA_HEIGHT + 15
+    controls_width = canvas.images["controls_panel"].get_width()
+    controls_height = canvas.images["controls_panel"].get_height()
+    controls_x = canvas.width - controls_width - 15
+    controls_y = canvas.game_area_height + 15
     
     # Draw control panel background
-    screen.blit(images["controls_panel"], (controls_x, controls_y))
+    canvas.surface.blit(canvas.images["controls_panel"], (controls_x, controls_y))
     
     # Scale font based on available space
     font_size = max(14, min(24, controls_height // 10))
-    try:
-        font = pygame.font.SysFont("medievalsharp", font_size)
-        title_font = pygame.font.SysFont("medievalsharp", font_size + 4, bold=True)
-    except:
-        font = pygame.font.Font(None, font_size)
-        title_font = pygame.font.Font(None, font_size + 4)
-    
-    controls = [
-        ("Move:", (180, 160, 120)),
-        ("W - Up", TEXT_COLOR),
-        ("S - Down", TEXT_COLOR),
-        ("A - Left", TEXT_COLOR),
-        ("D - Right", TEXT_COLOR),
-        ("Actions:", (180, 160, 120)),
-        ("F - Fight", TEXT_COLOR),
-        ("H - Hide", TEXT_COLOR)
-    ]
+    
+    controls = controls_help
     
     # Draw title
-    title = title_font.render("Commands", True, (200, 180, 140))
+    title = render_text("Commands", font_size + 4, (200, 180, 140), bold=True)
     title_x = controls_x + (controls_width - title.get_width()) // 2
-    screen.blit(title, (title_x, controls_y + 15))
+    canvas.surface.blit(title, (title_x, controls_y + 15))
     
     # Draw decorative separator
     separator_y = controls_y + 15 + title.get_height() + 5
-    pygame.draw.line(screen, (120, 100, 80), 
+    pygame.draw.line(canvas.surface, (120, 100, 80), 
                    (controls_x + 20, separator_y), 
                    (controls_x + controls_width - 20, separator_y), 
                    2)
@@ -1109,16 +1211,16 @@ def display_controls():
         is_header = line.endswith(":")
         
         # Use appropriate font and indentation
-        text_font = title_font if is_header else font
+        text_size = font_size + 4 if is_header else font_size
         text_x = controls_x + (indent if not is_header else 15)
         
         # Create text with shadow for depth
-        shadow = text_font.render(line, True, (60, 50, 40))
-        text = text_font.render(line, True, color)
+        shadow = render_text(line, text_size, (60, 50, 40), bold=is_header)
+        text = render_text(line, text_size, color, bold=is_header)
         
         # Draw text with shadow
-        screen.blit(shadow, (text_x + 1, y_pos + 1))
-        screen.blit(text, (text_x, y_pos))
+        canvas.surface.blit(shadow, (text_x + 1, y_pos + 1))
+        canvas.surface.blit(text, (text_x, y_pos))
         
         # Update position for next line
         y_pos += text.get_height() + (10 if is_header else 5)
@@ -1133,22 +1235,22 @@ def display_controls():
     ]
     
     for x, y in accent_points:
-        pygame.draw.rect(screen, (150, 130, 100), (x, y, accent_size, accent_size))
-        pygame.draw.rect(screen, (120, 100, 80), (x, y, accent_size, accent_size), 1)
+        pygame.draw.rect(canvas.surface, (150, 130, 100), (x, y, accent_size, accent_size))
+        pygame.draw.rect(canvas.surface, (120, 100, 80), (x, y, accent_size, accent_size), 1)
 
 # Display victory or defeat message with enhanced effects
-def display_end_message(message):
+def display_end_message(canvas, message):
     global animation_frame
     
     # Add screen darkening effect
-    overlay = pygame.Surface((WIDTH, GAME_AREA_HEIGHT), pygame.SRCALPHA)
+    overlay = pygame.Surface((canvas.width, canvas.game_area_height), pygame.SRCALPHA)
     overlay.fill((0, 0, 0, 180))  # Transparent black
-    screen.blit(overlay, (0, 0))
+    canvas.surface.blit(overlay, (0, 0))
     
     if message == "Victory!":
-        victory_image = images["victory"]
-        x = WIDTH // 2 - victory_image.get_width() // 2
-        y = GAME_AREA_HEIGHT // 2 - victory_image.get_height() // 2
+        victory_image = canvas.images["victory"]
+        x = canvas.width // 2 - victory_image.get_width() // 2
+        y = canvas.game_area_height // 2 - victory_image.get_height() // 2
         
         # Add victory glow effect
         glow_size = 20 + int(10 * math.sin(animation_frame * 0.1))
@@ -1166,28 +1268,28 @@ def display_end_message(message):
                            5)
         
         # Draw the glow
-        screen.blit(glow_surface, 
+        canvas.surface.blit(glow_surface, 
                   (x - glow_size, y - glow_size))
         
         # Draw victory image
-        screen.blit(victory_image, (x, y))
+        canvas.surface.blit(victory_image, (x, y))
         
         # Draw celebratory particles
         for _ in range(10):
-            particle_x = random.randint(0, WIDTH)
-            particle_y = random.randint(0, GAME_AREA_HEIGHT)
+            particle_x = random.randint(0, canvas.width)
+            particle_y = random.randint(0, canvas.game_area_height)
             particle_size = random.randint(2, 5)
             particle_color = random.choice([
                 (255, 215, 0),  # Gold
                 (255, 255, 255),  # White
                 (220, 220, 150)   # Light gold
             ])
-            pygame.draw.circle(screen, particle_color, (particle_x, particle_y), particle_size)
+            pygame.draw.circle(canvas.surface, particle_color, (particle_x, particle_y), particle_size)
         
     else:  # Defeat
-        defeat_image = images["defeat"]
-        x = WIDTH // 2 - defeat_image.get_width() // 2
-        y = GAME_AREA_HEIGHT // 2 - defeat_image.get_height() // 2
+        defeat_image = canvas.images["defeat"]
+        x = canvas.width // 2 - defeat_image.get_width() // 2
+        y = canvas.game_area_height // 2 - defeat_image.get_height() // 2
         
         # Add defeat effect - red pulsing glow
         glow_size = 15 + int(5 * math.sin(animation_frame * 0.1))
@@ -1205,16 +1307,16 @@ def display_end_message(message):
                            3)
         
         # Draw the glow
-        screen.blit(glow_surface, 
+        canvas.surface.blit(glow_surface, 
                   (x - glow_size, y - glow_size))
         
         # Draw defeat image
-        screen.blit(defeat_image, (x, y))
+        canvas.surface.blit(defeat_image, (x, y))
         
         # Draw smoke-like particles
         for _ in range(15):
-            particle_x = random.randint(0, WIDTH)
-            particle_y = random.randint(0, GAME_AREA_HEIGHT)
+            particle_x = random.randint(0, canvas.width)
+            particle_y = random.randint(0, canvas.game_area_height)
             particle_size = random.randint(3, 8)
             particle_color = random.choice([
                 (100, 0, 0, 150),  # Dark red
@@ -1224,32 +1326,35 @@ def display_end_message(message):
             particle_surface = pygame.Surface((particle_size*2, particle_size*2), pygame.SRCALPHA)
             pygame.draw.circle(particle_surface, particle_color, 
                              (particle_size, particle_size), particle_size)
-            screen.blit(particle_surface, (particle_x, particle_y))
+            canvas.surface.blit(particle_surface, (particle_x, particle_y))
+
+# Console scroll scaled to the console size, keyed by (scroll image, width, height)
+scaled_scrolls = {}
 
 # Enhanced console display styled as a medieval scroll
-def draw_console(action_results):
+def draw_console(canvas, game, action_results):
     # Draw scroll background
     scroll_x = 10
-    scroll_y = GAME_AREA_HEIGHT + images["health_bar"].get_height() + 30
+    scroll_y = canvas.game_area_height + canvas.images["health_bar"].get_height() + 30
     
     # Adjust scroll dimensions to fit available space
-    scroll_height = CONSOLE_HEIGHT - images["health_bar"].get_height() - 40
-    scroll_width = WIDTH - 20
+    scroll_height = canvas.console_height - canvas.images["health_bar"].get_height() - 40
+    scroll_width = canvas.width - 20
     
-    # Scale the scroll image to fit
-    scroll_img = pygame.transform.scale(images["scroll"], (scroll_width, scroll_height))
-    screen.blit(scroll_img, (scroll_x, scroll_y))
+    # Scale the scroll image to fit (once per size)
+    scroll_key = (id(canvas.images["scroll"]), scroll_width, scroll_height)
+    scroll_img = scaled_scrolls.get(scroll_key)
+    if scroll_img is None:
+        scroll_img = pygame.transform.scale(canvas.images["scroll"], (scroll_width, scroll_height))
+        scaled_scrolls[scroll_key] = scroll_img
+    canvas.surface.blit(scroll_img, (scroll_x, scroll_y))
     
     # Draw console header
-    font_size = max(16, min(30, CONSOLE_HEIGHT // 10))
-    try:
-        font = pygame.font.SysFont("medievalsharp", font_size, bold=True)
-    except:
-        font = pygame.font.Font(None, font_size)
+    font_size = max(16, min(30, canvas.console_height // 10))
     
-    console_title = font.render("Adventure Chronicle", True, (80, 40, 0))
+    console_title = render_text("Adventure Chronicle", font_size, (80, 40, 0), bold=True)
     title_x = scroll_x + (scroll_width - console_title.get_width()) // 2
-    screen.blit(console_title, (title_x, scroll_y + 10))
+    canvas.surface.blit(console_title, (title_x, scroll_y + 10))
     
     # Draw separator with decorative ends
     line_y = scroll_y + console_title.get_height() + 15
@@ -1257,24 +1362,18 @@ def draw_console(action_results):
     line_x = scroll_x + (scroll_width - line_width) // 2
     
     # Draw main line
-    pygame.draw.line(screen, (120, 80, 40), 
+    pygame.draw.line(canvas.surface, (120, 80, 40), 
                    (line_x, line_y),
                    (line_x + line_width, line_y), 2)
     
     # Draw decorative end caps
     cap_size = 6
     for x in [line_x, line_x + line_width]:
-        pygame.draw.circle(screen, (120, 80, 40), (x, line_y), cap_size)
-        pygame.draw.circle(screen, (150, 100, 50), (x, line_y), cap_size - 2)
+        pygame.draw.circle(canvas.surface, (120, 80, 40), (x, line_y), cap_size)
+        pygame.draw.circle(canvas.surface, (150, 100, 50), (x, line_y), cap_size - 2)
     
     # Display action results with medieval styling
-    font_size = max(12, min(20, CONSOLE_HEIGHT // 15))
-    try:
-        font = pygame.font.SysFont("medievalsharp", font_size)
-        action_font = pygame.font.SysFont("medievalsharp", font_size, bold=True)
-    except:
-        font = pygame.font.Font(None, font_size)
-        action_font = pygame.font.Font(None, font_size)
+    font_size = max(12, min(20, canvas.console_height // 15))
     
     line_height = font_size + 4
     log_start_y = line_y + 15
@@ -1321,11 +1420,11 @@ def draw_console(action_results):
                 text_x = bullet_x + 15
                 
                 # Draw decorative bullet
-                pygame.draw.circle(screen, (80, 40, 0), (bullet_x, y_pos + line_height//2 - 1), 3)
+                pygame.draw.circle(canvas.surface, (80, 40, 0), (bullet_x, y_pos + line_height//2 - 1), 3)
                 
                 # Draw the action (like "MOVE" or "FIGHT")
-                action_surface = action_font.render(action_text, True, (120, 60, 0))
-                screen.blit(action_surface, (text_x, y_pos))
+                action_surface = render_text(action_text, font_size, (120, 60, 0), bold=True)
+                canvas.surface.blit(action_surface, (text_x, y_pos))
                 
                 # Draw position and health info
                 info_x = text_x + action_surface.get_width() + 10
@@ -1336,25 +1435,126 @@ def draw_console(action_results):
                                   (180, 100, 0) if health_text == "Injured" else \
                                   (150, 0, 0)
                     
-                    info_surface = font.render(info_text, True, (60, 30, 0))
-                    screen.blit(info_surface, (info_x, y_pos))
+                    info_surface = render_text(info_text, font_size, (60, 30, 0))
+                    canvas.surface.blit(info_surface, (info_x, y_pos))
                     
                     health_x = info_x + info_surface.get_width() + 10
-                    health_surface = font.render(f"Health: {health_text}", True, health_color)
-                    screen.blit(health_surface, (health_x, y_pos))
+                    health_surface = render_text(f"Health: {health_text}", font_size, health_color)
+                    canvas.surface.blit(health_surface, (health_x, y_pos))
                 else:
                     # Just show position if health unknown
-                    info_surface = font.render(info_text, True, (60, 30, 0))
-                    screen.blit(info_surface, (info_x, y_pos))
+                    info_surface = render_text(info_text, font_size, (60, 30, 0))
+                    canvas.surface.blit(info_surface, (info_x, y_pos))
             else:
                 # For other messages just show the text
                 y_pos = log_start_y + i * line_height
-                text_surface = font.render(result[:min(len(result), 80)], True, (60, 30, 0))
-                screen.blit(text_surface, (scroll_x + 20, y_pos))
+                text_surface = render_text(result[:min(len(result), 80)], font_size, (60, 30, 0))
+                canvas.surface.blit(text_surface, (scroll_x + 20, y_pos))
 
 # Import added for math functions
 import math
 
+# Dirty-rectangle rendering: every frame restores the regions a canvas drew in the previous frame
+# from its static layer, redraws only the animated regions and pushes just those to the display
+recorder = None         # video.VideoRecorder fed every drawn frame, see start_recording()
+
+# A cell plus a margin for what overhangs it: the combat guard sprite on the right third
+# and the bobbing warning glow above
+def cell_region(canvas, position):
+    x, y = position_to_grid(canvas, position)
+    margin = max(8, 2 * canvas.cell_size // 3 + canvas.images["guard"].get_width() - canvas.cell_size)
+    region = pygame.Rect(x - margin, y - margin, canvas.cell_size + 2 * margin, canvas.cell_size + 2 * margin)
+    return region.clip(pygame.Rect(0, 0, canvas.width, canvas.game_area_height))
+
+# Area left of the controls panel and above the console scroll
+def health_region(canvas):
+    right = canvas.width - canvas.images["controls_panel"].get_width() - 15
+    return pygame.Rect(0, canvas.game_area_height, right, canvas.images["health_bar"].get_height() + 30)
+
+# The console scroll, as placed by draw_console()
+def console_region(canvas):
+    scroll_y = canvas.game_area_height + canvas.images["health_bar"].get_height() + 30
+    scroll_height = canvas.console_height - canvas.images["health_bar"].get_height() - 40
+    return pygame.Rect(10, scroll_y, canvas.width - 20, scroll_height)
+
+# Draw one frame of game's current state on canvas, with lines in the console, pushing only what changed
+def draw_frame(canvas, game, lines, end_message=None, show_controls=False):
+    full = update_static_layer(canvas, game.goal_room) or canvas.force_redraw
+    surface = canvas.surface
+    game_area = pygame.Rect(0, 0, canvas.width, canvas.game_area_height)
+    player_position = game.current_state['player_position']
+    guard_positions = game.current_state['guard_positions']
+    
+    # Regions animated this frame: the end screen covers the whole game area, otherwise
+    # only the cells with the player, guards or goal sparkles change
+    if end_message:
+        regions = [game_area]
+    else:
+        cells = {player_position, game.goal_room, *guard_positions.values()}
+        regions = [cell_region(canvas, position) for position in cells]
+    health = health_region(canvas)
+    regions.append(health)
+    
+    # The console does not animate, so it is only redrawn when its lines change
+    changed = canvas.dirty_rects + regions
+    console_changed = full or lines != canvas.console_lines
+    if console_changed:
+        changed.append(console_region(canvas))
+        canvas.console_lines = list(lines)
+    
+    # Restore the background under everything drawn last frame or about to be drawn
+    if full:
+        surface.blit(canvas.static_layer, (0, 0))
+        if show_controls:
+            display_controls(canvas)
+    else:
+        for rect in changed:
+            surface.blit(canvas.static_layer, rect, rect)
+    
+    # Keep the game area effects out of the console
+    surface.set_clip(game_area)
+    draw_goal_room(canvas, game.goal_room)
+    if player_position in guard_positions.values():
+        draw_player_and_guard_together(canvas, player_position, guard_positions)
+    else:
+        draw_player(canvas, player_position)
+        draw_guards(canvas, guard_positions)
+    if end_message:
+        display_end_message(canvas, end_message)
+    
+    surface.set_clip(health)
+    draw_health(canvas, game, game.current_state['player_health'])
+    if console_changed:
+        surface.set_clip(console_region(canvas))
+        draw_console(canvas, game, lines)
+    surface.set_clip(None)
+    
+    if surface is pygame.display.get_surface():
+        if full:
+            pygame.display.flip()
+        else:
+            pygame.display.update(changed)
+    canvas.dirty_rects = regions
+    canvas.force_redraw = False
+    if recorder is not None:
+        recorder.add_frame(surface)
+
+# Stream every frame drawn from now on to path (.gif is encoded in-process, other formats need ffmpeg)
+def start_recording(path, fps=10, scale=0.5, skip=1):
+    global recorder
+    from video import VideoRecorder
+    stop_recording()
+    recorder = VideoRecorder(path, fps=fps, scale=scale, skip=skip)
+    return recorder
+
+# Finish the file started by start_recording()
+def stop_recording():
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
+
+
 # Main loop with animation and improved timing
 def main():
     global game_ended, action_results, animation_frame
@@ -1397,33 +1597,9 @@ def main():
                 if len(action_results) > 10:
                     action_results = action_results[-10:]
         
-        # Clear screen
-        screen.fill(BLACK)
-        
         # Update animation frame
         animation_frame += 1
         
-        # Draw the castle rooms
-        draw_rooms()
-        
-        # Draw the goal room with effects
-        draw_goal_room()
-
-        # Check if player and a guard are in the same room
-        if game.current_state['player_position'] in game.current_state['guard_positions'].values():
-            draw_player_and_guard_together(game.current_state['player_position'], 
-                                         game.current_state['guard_positions'])
-        else:
-            # Draw the player and guards in separate positions
-            draw_player(game.current_state['player_position'])
-            draw_guards(game.current_state['guard_positions'])
-
-        # Display player health with effects
-        draw_health(game.current_state['player_health'])
-        
-        # Display controls with medieval styling
-        # display_controls()
-
         # Check for terminal state
         if game.is_terminal() == 'goal':
             game_ended = True
@@ -1432,38 +1608,25 @@ def main():
             game_ended = True
             end_message = "Defeat!"
 
-        if game_ended:
-            display_end_message(end_message)
-            
-            # Reset game after a moment (allow player to see the end message)
-            if animation_frame % 180 == 0:  # Reset after about a 6 seconds
-                game.reset()
-                game_ended = False
-                end_message = ""
-                action_results = [None, None, None, None, None]
-
-        # Draw the console with styled action results
-        draw_console(action_results)
+        # Draw the rooms, characters, health and console, pushing only what changed
+        draw_frame(window, game, action_results, end_message if game_ended else None)
 
-        pygame.display.flip()
+        # Reset game after a moment (allow player to see the end message)
+        if game_ended and animation_frame % 180 == 0:  # Reset after about a 6 seconds
+            game.reset()
+            game_ended = False
+            end_message = ""
+            action_results = [None, None, None, None, None]
     
         clock.tick(30)  # Limit to 30 FPS for smooth animation
 
+    stop_recording()
     pygame.quit()
     sys.exit()
 
-# Modified refresh function for agent integration
-def refresh(obs, reward, done, info, delay=0.1):
-    global fps, sleeptime, game_ended, clock, action_results, game, animation_frame
-    
-    animation_frame += 1
-    
-    try:
-        action = info['action']
-    except:
-        action = "None"
-
-    result = "Pos: {}, Health: {}, Guard In Cell: {}, Reward: {}, Action: {}".format(
+# Console line for one agent step
+def format_result(obs, reward, action):
+    return "Pos: {}, Health: {}, Guard In Cell: {}, Reward: {}, Action: {}".format(
         obs['player_position'], 
         game.int_to_health_state[obs['player_health']], 
         obs['guard_in_cell'], 
@@ -1471,55 +1634,293 @@ def refresh(obs, reward, done, info, delay=0.1):
         action
     )
 
+# Add a line to the console, dropping the oldest once it is full
+def log_result(result):
     if None in action_results:
         action_results[action_results.index(None)] = result
     else:
         action_results.pop(0)
         action_results.append(result)
 
-    fps = 60
-    clock = pygame.time.Clock()
+# End screen message for env's current state, or None
+def end_message_for_state(env):
+    terminal = env.is_terminal()
+    if terminal == 'goal':
+        return "Victory!"
+    if terminal == 'defeat':
+        return "Defeat!"
+    return None
+
+# Modified refresh function for agent integration
+def refresh(obs, reward, done, info, delay=None):
+    global game_ended, clock, animation_frame
     
-    # Clear screen
-    screen.fill(BLACK)
+    animation_frame += 1
     
-    # Draw the castle rooms with atmosphere
-    draw_rooms()
+    try:
+        action = info['action']
+    except:
+        action = "None"
+    log_result(format_result(obs, reward, action))
+
+    # Check for terminal state
+    end_message = end_message_for_state(game)
+    if end_message:
+        game_ended = True
+
+    # Draw the frame with the controls panel, pushing only what changed
+    draw_frame(window, game, action_results, end_message, show_controls=True)
+    pygame.event.pump()
     
-    # Draw the goal room with effects
-    draw_goal_room()
+    # Pace steps to one per delay seconds; time the agent spent since the last call counts towards it
+    delay = sleeptime if delay is None else delay
+    if clock is None:
+        clock = pygame.time.Clock()
+    if delay:
+        clock.tick(1.0 / delay)
 
-    # Check if player and a guard are in the same room
-    if game.current_state['player_position'] in game.current_state['guard_positions'].values():
-        draw_player_and_guard_together(game.current_state['player_position'], 
-                                     game.current_state['guard_positions'])
-    else:
-        # Draw the player and guards in separate positions
-        draw_player(game.current_state['player_position'])
-        draw_guards(game.current_state['guard_positions'])
+# Live view for training: the learner never waits on drawing
+# Shared slot of a LiveView: sequence number (odd while being written), stop flag, states drawn,
+# then player cell, health, reward and action index of the newest state, then the guard cells
+LIVE_SEQ, LIVE_STOP, LIVE_DRAWN, LIVE_STATE = 0, 1, 2, 3
+
+class LiveView:
+    """Shows the latest state of a training env in a window owned by a separate render process.
+
+    SDL must update the window and pump its events on the thread that created it, so the
+    window lives on the main thread of a spawned process while training keeps the main thread
+    of this one. Pass view.refresh wherever refresh() is used: it writes the env's state into a
+    small shared-memory slot and returns. The render process draws the newest state at fps
+    frames per second and skips any published in between. Closing the window ends the view;
+    training carries on.
+    """
+
+    def __init__(self, env, fps=30):
+        import multiprocessing as mp
+        from multiprocessing import shared_memory
+        import numpy as np
+
+        self.env = env
+        self.published = 0      # states published by the learner
+        self.action_index = {name: i for i, name in enumerate(env.actions)}
+        size = LIVE_STATE + 4 + len(env.guard_names)
+        self.block = shared_memory.SharedMemory(create=True, size=size * 8)
+        self.slot = np.ndarray(size, dtype=np.float64, buffer=self.block.buf)
+        self.slot.fill(0)
+        config = {'grid_size': env.grid_size, 'guards': env.guards, 'goal_room': env.goal_room}
+        # spawn: a fresh interpreter that never inherits this process's SDL or thread state
+        self.process = mp.get_context('spawn').Process(target=_live_view_main, name="castle-live-view",
+                                                       args=(self.block.name, size, config, env.rewards, fps),
+                                                       daemon=True)
+        self.process.start()
+
+    @property
+    def drawn(self):
+        """States drawn so far by the render process"""
+        return int(self.slot[LIVE_DRAWN]) if self.slot is not None else 0
+
+    def refresh(self, obs, reward, done, info, delay=None):
+        s = self.env.state
+        action = self.action_index.get(info.get('action'), -1) if info else -1
+        slot = self.slot
+        # Sequence lock: the reader only takes a state whose sequence number is even and unchanged
+        slot[LIVE_SEQ] += 1
+        slot[LIVE_STATE:] = (s.player_cell, s.player_health, reward, action) + s.guard_cells
+        slot[LIVE_SEQ] += 1
+        self.published += 1
+
+    def close(self):
+        """Stops the render process and frees the shared slot"""
+        if self.slot is None:
+            return
+        self.slot[LIVE_STOP] = 1
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.slot = None
+        self.block.close()
+        self.block.unlink()
+
+def _live_view_main(name, size, config, rewards, fps):
+    """Render loop of a LiveView, on the main thread of its own process"""
+    global game, animation_frame
+    from multiprocessing import shared_memory
+    import numpy as np
+
+    block = shared_memory.SharedMemory(name=name)
+    slot = np.ndarray(size, dtype=np.float64, buffer=block.buf)
+    game = CastleEscapeEnv(**config)
+    game.rewards = rewards
+    setup(GUI=True)
+    pygame.display.set_caption("Castle Escape - training (live)")
+    frame_clock = pygame.time.Clock()
+    shown = 0
+    try:
+        while not slot[LIVE_STOP]:
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
+            seq = slot[LIVE_SEQ]
+            state = slot[LIVE_STATE:].tolist()
+            if seq != shown and seq % 2 == 0 and slot[LIVE_SEQ] == seq:
+                shown = seq
+                cell, health, reward, action = state[:4]
+                game.restore_state((int(cell), int(health), tuple(int(c) for c in state[4:])))
+                action_name = game.actions[int(action)] if action >= 0 else "None"
+                reward = int(reward) if reward == int(reward) else reward
+                log_result(format_result(game.get_observation(), reward, action_name))
+                slot[LIVE_DRAWN] += 1
+            animation_frame += 1
+            draw_frame(window, game, action_results, end_message_for_state(game), show_controls=True)
+            frame_clock.tick(fps)
+    finally:
+        del slot
+        block.close()
+        pygame.quit()
+
+# Replay speeds offered by Up/Down, in steps per sleeptime
+REPLAY_SPEEDS = (1, 2, 5, 10, 20, 50, 100)
 
-    # Display player health with effects
-    draw_health(game.current_state['player_health'])
+# Play back episodes from an episode_log file; every frame is read from the log, nothing is simulated
+def replay(path, episode=0, speed=1):
+    """Replays logged episodes in the window.
+
+    At 1x one step is shown every sleeptime seconds, up to 100x. Space pauses, Left/Right step
+    one frame, Up/Down change speed, PgUp/PgDn seek by a tenth of the episode, Home/End jump to
+    its ends and N/P switch episodes. The log is memory-mapped, so any step of any episode
+    is shown immediately however large the file is.
+    """
+    global game, action_results, animation_frame, controls_help
+    from episode_log import EpisodeLog
+    log = EpisodeLog(path)
+    if not len(log):
+        print(f"No episodes in '{path}'")
+        return
+    game = log.make_env()
+    setup(GUI=True)
+    controls_help = REPLAY_CONTROLS
+    
+    frame_clock = pygame.time.Clock()
+    episode = min(max(episode, 0), len(log) - 1)
+    speed = min(max(speed, REPLAY_SPEEDS[0]), REPLAY_SPEEDS[-1])
+    position = 0.0  # steps into the episode, fractional between steps at low speeds
+    playing = True
+    running = True
+    shown = None
+    caption = None
+    
+    while running:
+        length = log.num_steps(episode)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    playing = not playing
+                    if playing and position >= length:
+                        position = 0.0
+                elif event.key == pygame.K_RIGHT:
+                    playing = False
+                    position = int(position) + 1
+                elif event.key == pygame.K_LEFT:
+                    playing = False
+                    position = int(position) - 1
+                elif event.key == pygame.K_UP:
+                    speed = next((s for s in REPLAY_SPEEDS if s > speed), speed)
+                elif event.key == pygame.K_DOWN:
+                    speed = next((s for s in reversed(REPLAY_SPEEDS) if s < speed), speed)
+                elif event.key == pygame.K_PAGEUP:
+                    position -= max(1, length // 10)
+                elif event.key == pygame.K_PAGEDOWN:
+                    position += max(1, length // 10)
+                elif event.key == pygame.K_HOME:
+                    position = 0.0
+                elif event.key == pygame.K_END:
+                    position = length
+                elif event.key in (pygame.K_n, pygame.K_p):
+                    episode = min(max(episode + (1 if event.key == pygame.K_n else -1), 0), len(log) - 1)
+                    length = log.num_steps(episode)
+                    position = 0.0
+        
+        elapsed = frame_clock.tick(30) / 1000
+        if playing:
+            position += speed * elapsed / sleeptime
+            if position >= length:
+                playing = False
+        position = min(max(position, 0.0), length)
+        
+        # Show the logged state and the console lines leading up to it
+        step = int(position)
+        if (episode, step) != shown:
+            shown = (episode, step)
+            game.restore_state(log.snapshot(episode, step))
+            lines = [log.describe(episode, t) for t in range(max(1, step - 4), step + 1)]
+            action_results = lines + [None] * (5 - len(lines))
+        new_caption = (f"Castle Escape replay - episode {episode + 1}/{len(log)}, step {step}/{length}, "
+                       f"{speed}x{'' if playing else ', paused'}")
+        if new_caption != caption:
+            caption = new_caption
+            pygame.display.set_caption(caption)
+        
+        animation_frame += 1
+        draw_frame(window, game, action_results, end_message_for_state(game), show_controls=True)
     
-    # Display controls with medieval styling
-    display_controls()
+    controls_help = GAME_CONTROLS
+    stop_recording()
+    pygame.quit()
 
-    # Check for terminal state
-    if game.is_terminal() == 'goal':
-        game_ended = True
-        end_message = "Victory!"
-        display_end_message(end_message)
-    elif game.is_terminal() == 'defeat':
-        game_ended = True
-        end_message = "Defeat!"
-        display_end_message(end_message)
+# Offscreen canvases of render_frame() by (rows, cols, cell size), and the surfaces it scales
+# frames into, reused once callers drop their arrays
+offscreen_canvases = {}
+frame_surfaces = []
+
+# Draw env (default: the module's game) and return the frame as a (height, width, 3) uint8 array
+def render_frame(env=None, size=None, console=True, cell_size=None):
+    """Renders the current state to a NumPy array without a window.
 
-    # Draw the console with styled action results
-    draw_console(action_results)
+    The game is drawn on an offscreen Canvas of its own, kept per grid shape and cell size, so
+    an open window and the module's game are left alone and no display is needed. cell_size
+    (at least 32, default 120) sets the drawing resolution; small cells are much faster for
+    bulk use. console=False keeps only the game area.
 
-    pygame.display.flip()
-    clock.tick(fps)
-    time.sleep(sleeptime)
+    Without size the array is a pixels3d view of the canvas itself, no copy; the next call
+    draws over it, so copy it to keep a frame. size=(width, height), e.g. (84, 84) for image
+    observations, scales the canvas into a separate frame surface, the only copy, and the
+    array views that one.
+    """
+    global animation_frame
+    env = env if env is not None else game
+    cell_size = max(32, cell_size or 120)
+    key = (env.num_rows, env.num_cols, cell_size)
+    canvas = offscreen_canvases.get(key)
+    if canvas is None:
+        pygame.font.init()
+        canvas = offscreen_canvases[key] = Canvas(env, cell_size, 280)
+    if canvas.surface.get_locked():
+        # A caller still holds a view of the last frame and a locked surface cannot be blitted
+        # to: draw on the canvas's other surface instead, in full since it is a frame behind
+        spare = canvas.spare
+        if spare is None or spare.get_locked():
+            spare = pygame.Surface(canvas.surface.get_size(), 0, canvas.surface)
+        canvas.spare, canvas.surface = canvas.surface, spare
+        canvas.force_redraw = True
+    
+    animation_frame += 1
+    draw_frame(canvas, env, action_results, end_message_for_state(env), show_controls=True)
+    if not size:
+        pixels = pygame.surfarray.pixels3d(canvas.surface)
+        return (pixels if console else pixels[:, :canvas.game_area_height]).transpose(1, 0, 2)
+    
+    source = canvas.surface if console else canvas.surface.subsurface(0, 0, canvas.width, canvas.game_area_height)
+    size = tuple(size)
+    # A surface is locked while an array from an earlier call still views it, so skip those
+    frame = next((s for s in frame_surfaces if s.get_size() == size and not s.get_locked()), None)
+    if frame is None:
+        frame = pygame.Surface(size, 0, 32)
+        frame_surfaces.append(frame)
+        del frame_surfaces[:-2]
+    pygame.transform.smoothscale(source, size, frame)
+    return pygame.surfarray.pixels3d(frame).transpose(1, 0, 2)
 
 if __name__ == "__main__":
     setup()